@@ -0,0 +1,60 @@
+"""Compare json lines (as written by dump_table) with parquet on size and speed.
+
+    python -m benchmarks.bench_parquet [rows]
+
+The table is mostly numeric, like the tables we re-read for analytics.
+"""
+import os
+import sys
+import time
+import sqlite3
+import random
+import tempfile
+import datetime
+import bson.json_util
+import msaccess
+
+
+def create_numeric_database(path, rows):
+    con = sqlite3.connect(path)
+    con.execute("Create Table measurement (id Integer Primary Key, measured DateTime, "
+                "price Currency, quantity Integer, ratio Double, flag YesNo, label Text(20))")
+    started = datetime.datetime(2015, 1, 1)
+    random.seed(0)
+    con.executemany("Insert Into measurement Values (?, ?, ?, ?, ?, ?, ?)", (
+        (i, (started + datetime.timedelta(minutes=i)).isoformat(" "), "%d.%04d" % (random.randint(0, 10000), i % 10000),
+         random.randint(0, 1000), random.random(), i % 2, "label%d" % (i % 10))
+        for i in range(rows)))
+    con.commit()
+    con.close()
+
+
+def write_json_lines(db, path):
+    field_names = db.get_field_names("measurement")
+    with open(path, "w", encoding="utf-8") as of:
+        for fields in db.iterate_query("measurement"):
+            print(bson.json_util.dumps(dict(zip(field_names, fields))), file=of)
+
+
+def run(rows=200000):
+    with tempfile.TemporaryDirectory() as directory:
+        mdb = os.path.join(directory, "numeric.db")
+        create_numeric_database(mdb, rows)
+        db = msaccess.MsAccessDb(mdb, backend="sqlite")
+
+        outputs = [
+            ("json lines", os.path.join(directory, "measurement.json"), write_json_lines),
+            ("parquet", os.path.join(directory, "measurement.parquet"),
+             lambda db, path: db.export_parquet("measurement", path)),
+        ]
+        for name, path, write in outputs:
+            started = time.time()
+            write(db, path)
+            elapsed = time.time() - started
+            print("{0:<12} {1:8.2f} sec {2:10.0f} rows/sec {3:10.1f} MB".format(
+                name, elapsed, rows / elapsed, os.path.getsize(path) / 1e6))
+        db.close()
+
+
+if __name__ == "__main__":
+    run(*[int(x) for x in sys.argv[1:]])
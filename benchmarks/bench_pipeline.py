@@ -0,0 +1,165 @@
+"""Throughput and peak memory of each export stage on a synthetic table.
+
+    python -m benchmarks.bench_pipeline [rows] [mix] [null_ratio] [batch_size]
+
+mix is a name from benchmarks.synthetic.columnMixes (mixed, numeric,
+text, binary, all) or a comma separated list of ADO type names such as
+adInteger,adVarWChar,adCurrency. Each stage runs on its own, on input
+prepared by the stage before it, so a slowdown points at one stage:
+
+    fetch                       MsAccessDb.iterate_batches (GetRows and conversion)
+    fetch raw                   the same, without converting values
+    fetch per row               MsAccessDb.iterate_query (MoveNext and Field.Value)
+    convert                     the DATA_TYPE converters on GetRows columns
+    regulate_value              MsAccessDb.regulate_value on every cell
+    regulate_value_for_mongodb  MsAccessDb.regulate_value_for_mongodb on every cell
+    translate                   TableTranslator.translate_row
+    serialize json_util         bson.json_util.dumps of translated documents
+    serialize ndjson            NdjsonWriter.encode_row (as dump_table does)
+    sink file                   writing encoded lines to a file
+    sink mongodb                InsertStage into a collection that drops documents
+
+Peak memory is the largest amount allocated during the stage, as seen by
+tracemalloc, on top of what was allocated before it started.
+"""
+import io
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+import bson.json_util
+import msaccess
+from msaccess.ndjson import NdjsonWriter
+from msaccess.columnar import rawConverters
+from scripts.msaccess_export import TableTranslator, InsertStage
+from benchmarks.synthetic import SyntheticTable, SyntheticBackend
+
+TABLE_NAME = "synthetic"
+
+
+class NullCollection:
+    def __init__(self):
+        self.count = 0
+
+    def insert_many(self, documents, ordered=True):
+        self.count += len(documents)
+
+
+def measure(func, repeat=3):
+    """(best elapsed seconds, peak bytes, result) of calling func()"""
+    elapsed = None
+    for i in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - started
+        elapsed = seconds if elapsed is None else min(elapsed, seconds)
+
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def batches_of(rows, batch_size):
+    return [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+
+
+def make_stages(table, db, batch_size, directory):
+    """[(name, func)]; each func returns the number of rows it handled"""
+    converters = msaccess.make_converters(table.types)
+    raw_columns = [list(zip(*block)) for block in batches_of(table.rows, batch_size)]
+    rows = [row for block in db.iterate_batches(TABLE_NAME, batch_size) for row in block]
+    translator = TableTranslator(TABLE_NAME, table.field_names, table.translation_dict())
+    documents = [translator.translate_row(row) for row in rows]
+    writer = NdjsonWriter(io.BytesIO(), translator.field_names, table.types)
+    lines = [(writer.encode_row(row) + "\n").encode("utf-8") for row in rows]
+    output = os.path.join(directory, "sink.json")
+
+    def fetch():
+        return sum(len(block) for block in db.iterate_batches(TABLE_NAME, batch_size))
+
+    def fetch_per_row():
+        return sum(1 for row in db.iterate_query(TABLE_NAME))
+
+    def fetch_raw():
+        return sum(len(block) for block in db.iterate_batches(TABLE_NAME, batch_size, converter_table=rawConverters))
+
+    def convert():
+        count = 0
+        for block in raw_columns:
+            columns = [msaccess.convert_column(convert, column) for convert, column in zip(converters, block)]
+            count += len(columns[0])
+        return count
+
+    def regulate_value():
+        regulate = msaccess.MsAccessDb.regulate_value
+        return len([[regulate(value) for value in row] for row in table.rows])
+
+    def regulate_value_for_mongodb():
+        regulate = msaccess.MsAccessDb.regulate_value_for_mongodb
+        return len([[regulate(value) for value in row] for row in rows])
+
+    def translate():
+        return len([translator.translate_row(row) for row in rows])
+
+    def serialize_json_util():
+        return len([bson.json_util.dumps(document) for document in documents])
+
+    def serialize_ndjson():
+        return len([writer.encode_row(row) for row in rows])
+
+    def sink_file():
+        with open(output, "wb") as of:
+            for block in batches_of(lines, batch_size):
+                of.write(b"".join(block))
+        return len(lines)
+
+    def sink_mongodb():
+        insert = InsertStage(NullCollection(), False)
+        for block in batches_of(documents, batch_size):
+            insert(block)
+        return insert.count
+
+    return [
+        ("fetch", fetch),
+        ("fetch raw", fetch_raw),
+        ("fetch per row", fetch_per_row),
+        ("convert", convert),
+        ("regulate_value", regulate_value),
+        ("regulate_value_for_mongodb", regulate_value_for_mongodb),
+        ("translate", translate),
+        ("serialize json_util", serialize_json_util),
+        ("serialize ndjson", serialize_ndjson),
+        ("sink file", sink_file),
+        ("sink mongodb", sink_mongodb),
+    ]
+
+
+def run_stages(rows=100000, mix="mixed", null_ratio=0.1, batch_size=5000, repeat=3, stages=None):
+    """[(stage, rows, seconds, peak bytes)] for the stages named in stages (all if None)"""
+    table = SyntheticTable(TABLE_NAME, mix, rows, null_ratio)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        with msaccess.MsAccessDb(TABLE_NAME, backend=SyntheticBackend([table])) as db:
+            for name, func in make_stages(table, db, batch_size, directory):
+                if stages is not None and name not in stages:
+                    continue
+                elapsed, peak, count = measure(func, repeat)
+                results.append((name, count, elapsed, peak))
+    return results
+
+
+def run(rows=100000, mix="mixed", null_ratio=0.1, batch_size=5000):
+    rows, null_ratio, batch_size = int(rows), float(null_ratio), int(batch_size)
+    print("{0} rows, columns {1}, {2:.0%} nulls".format(rows, mix, null_ratio))
+    for name, count, elapsed, peak in run_stages(rows, mix, null_ratio, batch_size):
+        print("{0:<28} {1:10.0f} rows/sec {2:8.3f} us/row {3:10.1f} MB peak".format(
+            name, count / elapsed, elapsed / count * 1e6, peak / 1e6))
+
+
+if __name__ == "__main__":
+    run(*sys.argv[1:])
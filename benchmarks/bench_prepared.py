@@ -0,0 +1,40 @@
+"""Point lookups through First (string SQL) against first_prepared.
+
+    python -m benchmarks.bench_prepared [lookups] [backend]
+
+With the ado backend, pass a .mdb containing a customer table through
+MSACCESS_BENCH_MDB; otherwise a temporary sqlite database is used.
+"""
+import os
+import sys
+import time
+import tempfile
+import msaccess
+from tests.sample_database import create_sample_database
+
+
+def run(lookups=20000, backend="sqlite"):
+    with tempfile.TemporaryDirectory() as directory:
+        mdb = os.environ.get("MSACCESS_BENCH_MDB") or create_sample_database(
+            os.path.join(directory, "sample.db"), customers=1000, orders_per_customer=0)
+        db = msaccess.MsAccessDb(mdb, backend=backend)
+
+        def string_sql(i):
+            return db.First("customer Where id = %d" % (i % 1000 + 1))
+
+        def prepared(i):
+            return db.first_prepared("Select * From customer Where id = ?", [i % 1000 + 1])
+
+        for name, lookup in [("string sql", string_sql), ("prepared", prepared)]:
+            started = time.time()
+            for i in range(lookups):
+                lookup(i)
+            elapsed = time.time() - started
+            print("{0:<12} {1:8.1f} us/lookup {2:10.0f} lookups/sec".format(
+                name, elapsed / lookups * 1e6, lookups / elapsed))
+        db.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    run(*([int(args[0])] + args[1:] if args else []))
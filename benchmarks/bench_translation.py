@@ -0,0 +1,38 @@
+"""Per-row cost of translating documents, before and after TableTranslator.
+
+    python -m benchmarks.bench_translation [rows] [columns]
+"""
+import sys
+import timeit
+from scripts.msaccess_export import TableTranslator, translate_mongo_document
+
+
+def make_table(columns):
+    field_names = ["field%d" % i for i in range(columns)]
+    translation_dict = {"table": "Table"}
+    for field_name in field_names:
+        translation_dict["table/" + field_name] = "Table/" + field_name.capitalize()
+    return field_names, translation_dict
+
+
+def run(rows=100000, columns=40):
+    field_names, translation_dict = make_table(columns)
+    row = list(range(columns))
+
+    def per_cell():
+        for i in range(rows):
+            translate_mongo_document("table", dict(zip(field_names, row)), translation_dict)
+
+    def compiled():
+        translator = TableTranslator("table", field_names, translation_dict)
+        for i in range(rows):
+            translator.translate_row(row)
+
+    for name, func in [("per cell lookup", per_cell), ("TableTranslator", compiled)]:
+        elapsed = min(timeit.repeat(func, number=1, repeat=3))
+        print("{0:<16} {1:8.3f} us/row  {2:10.0f} rows/sec".format(
+            name, elapsed / rows * 1e6, rows / elapsed))
+
+
+if __name__ == "__main__":
+    run(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,163 @@
+"""Synthetic Access-like tables and a backend that serves them from memory.
+
+Values are generated in the form ADO hands them to us (datetime for
+dates, Decimal for currency and numeric columns, bytes for binary), for
+the DATA_TYPE codes in msaccess.typeNames that an Access table can hold.
+SyntheticBackend plugs into MsAccessDb like the sqlite backend does, so
+benchmarks go through the real fetch code without a .mdb file.
+"""
+import re
+import random
+import decimal
+import datetime
+import msaccess
+from msaccess.backends import SqliteBackend, SqliteRecordset
+
+STARTED = datetime.datetime(2015, 1, 1)
+
+
+def random_text(rng, i, length):
+    return "text%d " % i + "".join(rng.choice("abcdefghijklmnopqrstuvwxyz 日本語") for _ in range(length))
+
+
+# DATA_TYPE -> function(rng, i) making one value
+valueFactories = {
+    2: lambda rng, i: rng.randint(-32768, 32767),
+    3: lambda rng, i: i,
+    4: lambda rng, i: rng.random() * 1000,
+    5: lambda rng, i: rng.random() * 1e6,
+    6: lambda rng, i: decimal.Decimal("%d.%04d" % (rng.randint(0, 100000), rng.randint(0, 9999))),
+    7: lambda rng, i: STARTED + datetime.timedelta(seconds=i * 61),
+    11: lambda rng, i: rng.random() < 0.5,
+    14: lambda rng, i: decimal.Decimal("%d.%02d" % (rng.randint(0, 10 ** 6), rng.randint(0, 99))),
+    16: lambda rng, i: rng.randint(-128, 127),
+    17: lambda rng, i: rng.randint(0, 255),
+    18: lambda rng, i: rng.randint(0, 65535),
+    19: lambda rng, i: rng.randint(0, 2 ** 32 - 1),
+    20: lambda rng, i: rng.randint(-2 ** 62, 2 ** 62),
+    21: lambda rng, i: rng.randint(0, 2 ** 63),
+    72: lambda rng, i: "{%08X-0000-0000-0000-%012X}" % (i, rng.getrandbits(48)),
+    128: lambda rng, i: bytes(rng.getrandbits(8) for _ in range(16)),
+    129: lambda rng, i: "%-10s" % ("c%d" % (i % 100000)),
+    130: lambda rng, i: "%-10s" % ("w%d" % (i % 100000)),
+    131: lambda rng, i: decimal.Decimal("%d.%03d" % (rng.randint(0, 10 ** 6), rng.randint(0, 999))),
+    133: lambda rng, i: STARTED + datetime.timedelta(days=i % 3650),
+    135: lambda rng, i: STARTED + datetime.timedelta(seconds=i, microseconds=rng.randint(0, 999) * 1000),
+    139: lambda rng, i: decimal.Decimal("%d.%02d" % (rng.randint(0, 10 ** 4), rng.randint(0, 99))),
+    200: lambda rng, i: random_text(rng, i, 8),
+    201: lambda rng, i: random_text(rng, i, 200),
+    202: lambda rng, i: random_text(rng, i, 16),
+    203: lambda rng, i: random_text(rng, i, 400),
+    204: lambda rng, i: bytes(rng.getrandbits(8) for _ in range(64)),
+    205: lambda rng, i: bytes(rng.getrandbits(8) for _ in range(1024)),
+}
+
+# Named column-type mixes
+columnMixes = {
+    # a typical Access table: counter key, some text, money, dates, flags, a memo
+    "mixed": [3, 202, 202, 6, 7, 5, 11, 2, 203, 3],
+    "numeric": [3, 2, 4, 5, 6, 20, 11, 7, 131, 3],
+    "text": [3, 202, 202, 202, 200, 203, 201, 130],
+    "binary": [3, 202, 204, 205],
+    # one column of every type we can generate
+    "all": sorted(valueFactories),
+}
+
+typeCodes = dict((name, data_type) for data_type, name in msaccess.typeNames.items())
+
+
+def parse_mix(mix):
+    """A mix name from columnMixes, or a comma separated list of type names or codes (adInteger,202,...)"""
+    if isinstance(mix, (list, tuple)):
+        return list(mix)
+    if mix in columnMixes:
+        return list(columnMixes[mix])
+    types = []
+    for name in mix.split(","):
+        name = name.strip()
+        data_type = int(name) if name.isdigit() else typeCodes.get(name)
+        if data_type not in valueFactories:
+            raise Exception("cannot generate values of type: %s" % name)
+        types.append(data_type)
+    return types
+
+
+class SyntheticTable:
+    def __init__(self, name, types, rows, null_ratio=0.0, seed=0):
+        self.name = name
+        self.types = parse_mix(types)
+        self.field_names = ["f%d_%s" % (i, msaccess.typeNames[data_type][2:].lower())
+                            for i, data_type in enumerate(self.types)]
+        rng = random.Random(seed)
+        factories = [valueFactories[data_type] for data_type in self.types]
+        self.rows = [tuple(None if j and rng.random() < null_ratio else factory(rng, i)
+                           for j, factory in enumerate(factories))
+                     for i in range(rows)]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def recordset(self):
+        return SqliteRecordset(self.field_names, self.rows, self.types)
+
+    def translation_dict(self, translated_name=None):
+        """A translation dictionary in the translation_words format"""
+        translated_name = translated_name or self.name.capitalize()
+        translation_dict = {self.name: translated_name}
+        for field_name in self.field_names:
+            translation_dict[self.name + "/" + field_name] = translated_name + "/" + field_name.capitalize()
+        return translation_dict
+
+
+def schema_recordset(names, records):
+    return SqliteRecordset(names, [[record.get(name) for name in names] for record in records])
+
+
+class SyntheticConnection:
+    """Just enough of ADODB.Connection: Execute of "Select ... From table" and OpenSchema"""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.State = msaccess.adStateOpen
+
+    def Close(self):
+        self.State = 0
+
+    def Execute(self, query, *args):
+        if isinstance(query, bytes):
+            query = query.decode("cp932")
+        match = re.search(r"\bFrom\s+\[?(\w+)\]?", query, re.IGNORECASE)
+        if match is None or match.group(1) not in self.tables:
+            raise Exception("synthetic backend cannot run: %s" % query)
+        return (self.tables[match.group(1)].recordset(), 0)
+
+    def OpenSchema(self, schema, criteria=None):
+        tables = self.tables.values()
+        if schema == 20:
+            return schema_recordset(["TABLE_NAME", "TABLE_TYPE"],
+                                    [{"TABLE_NAME": table.name, "TABLE_TYPE": "TABLE"} for table in tables])
+        elif schema == 4:
+            return schema_recordset(
+                ["TABLE_NAME", "COLUMN_NAME", "ORDINAL_POSITION", "IS_NULLABLE", "DATA_TYPE"],
+                [{"TABLE_NAME": table.name, "COLUMN_NAME": name, "ORDINAL_POSITION": i + 1,
+                  "IS_NULLABLE": i > 0, "DATA_TYPE": data_type}
+                 for table in tables for i, (name, data_type) in enumerate(zip(table.field_names, table.types))])
+        elif schema == 28:
+            return schema_recordset(["TABLE_NAME", "COLUMN_NAME", "ORDINAL"],
+                                    [{"TABLE_NAME": table.name, "COLUMN_NAME": table.field_names[0], "ORDINAL": 1}
+                                     for table in tables])
+        raise Exception("synthetic backend has no schema: %s" % schema)
+
+
+class SyntheticBackend(SqliteBackend):
+    """Serves SyntheticTables to MsAccessDb: MsAccessDb("synthetic", backend=SyntheticBackend([table]))"""
+    name = "synthetic"
+
+    def __init__(self, tables):
+        self.tables = dict((table.name, table) for table in tables)
+
+    def connect(self, db_name):
+        return SyntheticConnection(self.tables)
+
+    def open_catalog(self, con):
+        raise Exception("synthetic backend has no catalog")
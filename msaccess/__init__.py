@@ -1,22 +1,33 @@
 # -*- coding: utf-8 -*-
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import datetime
+import decimal
 import time
-import win32com.client
-import pywintypes
 import sys
 import codecs
 from enum import Enum
+import os
+from .backends import get_backend
+from .schema import SchemaCatalog, read_foreign_keys, file_signature
+from .cache import QueryCache, cache_key, is_select
+from .metrics import NULL_METRICS
+
+
+def is_com_error(e):
+    """pywintypes が読み込まれていなければ COM のエラーは起こりえない"""
+    pywintypes = sys.modules.get("pywintypes")
+    return pywintypes is not None and isinstance(e, pywintypes.com_error)
 
 
 def com_exception_print(func):
-    def deco(*args):
+    def deco(*args, **kwargs):
         try:
-            return func(*args)
-        except pywintypes.com_error as e:
-            print(str(e.args[1], "sjis"), file=sys.stderr)
-            print(str(e.args[2][2], "sjis"), file=sys.stderr)
-            raise e
+            return func(*args, **kwargs)
+        except Exception as e:
+            if is_com_error(e):
+                print(str(e.args[1], "sjis"), file=sys.stderr)
+                print(str(e.args[2][2], "sjis"), file=sys.stderr)
+            raise
 
     return deco
 
@@ -33,6 +44,73 @@ def ConvertFromAdoList(adoList):
     return [adoList.Item(x) for x in range(adoList.Count)]
 
 
+def fetch_batches(recordset, batch_size=5000, columns=False, query=None, converter_table=None, metrics=None):
+    """ Recordset.GetRows で batch_size 行ずつ取り出す
+        GetRows は [列][行] の形で返すので、行ごとに転置してから返す
+        recordset は Fields と EOF と GetRows を持っていれば何でもよい
+        metrics (msaccess.metrics.Metrics) があれば fetch と convert の時間を数える
+    """
+    if metrics is None:
+        metrics = NULL_METRICS
+    converters = make_converters([field.Type for field in recordset.Fields], converter_table)
+    while not recordset.EOF:
+        with metrics.timer("fetch") as timer:
+            block = get_rows(recordset, batch_size)
+            timer.rows = len(block[0]) if len(block) else 0
+        metrics.count_com_call("GetRows")
+        try:
+            with metrics.timer("convert", rows=timer.rows):
+                block = [convert_column(convert, column) for convert, column in zip(converters, block)]
+        except Exception as e:
+            print("convert error in '%s'" % query, file=sys.stderr)
+            print(str(e), file=sys.stderr)
+            raise
+        if columns:
+            yield block
+        else:
+            yield [list(row) for row in zip(*block)]
+
+
+@com_exception_print
+def get_rows(recordset, batch_size):
+    return recordset.GetRows(batch_size)
+
+
+def identity(value):
+    return value
+
+
+def convert_date(value):
+    if value is None:
+        return None
+    return MsAccessDb.convert_pytime_to_datetime(value)
+
+
+def convert_decimal(value):
+    if value is None:
+        return None
+    return float(value)
+
+
+def make_converters(data_types, converter_table=None):
+    """ 列の DATA_TYPE ごとに変換関数を一つ選んでおく
+        converter_table (省略時は valueConverters) にない型は regulate_value で毎回調べる
+    """
+    if converter_table is None:
+        converter_table = valueConverters
+    return [converter_table.get(data_type, MsAccessDb.regulate_value) for data_type in data_types]
+
+
+def convert_row(converters, row):
+    return [convert(value) for convert, value in zip(converters, row)]
+
+
+def convert_column(convert, column):
+    if convert is identity:
+        return list(column)
+    return [convert(value) for value in column]
+
+
 typeNames = {
     0: 'adEmpty',
     2: 'adSmallInt',
@@ -74,24 +152,98 @@ typeNames = {
     204: 'adVarBinary',
     205: 'adLongVarBinary'}
 
+# DATA_TYPE ごとの値の変換．PyTime は datetime に、通貨や数値は float にする
+valueConverters = {
+    2: identity,
+    3: identity,
+    4: identity,
+    5: identity,
+    6: convert_decimal,
+    7: convert_date,
+    8: identity,
+    11: identity,
+    14: convert_decimal,
+    16: identity,
+    17: identity,
+    18: identity,
+    19: identity,
+    20: identity,
+    21: identity,
+    72: identity,
+    128: identity,
+    129: identity,
+    130: identity,
+    131: convert_decimal,
+    133: convert_date,
+    135: convert_date,
+    139: convert_decimal,
+    200: identity,
+    201: identity,
+    202: identity,
+    203: identity,
+    204: identity,
+    205: identity}
+
 SchemaTypes = Enum("SchemaTypes", "TABLE")
 
+adStateOpen = 1
+
 class MsAccessDb:
+    # regulate_value_for_mongodb に渡された値の型の名前
     types = set()
-    
-    @com_exception_print
-    def __init__(self, db_name):
-        connection_string = (
-            "Provider=Microsoft.Jet.OLEDB.4.0;Data Source=%s;" % db_name)
-        self.con = win32com.client.dynamic.Dispatch("ADODB.Connection")
-        self.con.Open(connection_string)
 
-        self.cat = win32com.client.Dispatch("ADOX.Catalog")
-        self.cat.ActiveConnection = self.con
+    @com_exception_print
+    def __init__(self, db_name, backend=None, schema_cache=None, prepared_cache_size=100, metrics=None,
+                 result_cache=None):
+        """backend は "ado" か "sqlite"，またはそのインスタンス
+            (省略時は環境変数 MSACCESS_BACKEND，それもなければ ado)
+            schema_cache はスキーマ情報を保存するディレクトリ
+            (省略時は環境変数 MSACCESS_SCHEMA_CACHE，それもなければ保存しない)
+            prepared_cache_size は prepare したコマンドをいくつまで取っておくか
+            metrics (msaccess.metrics.Metrics) を渡すとクエリの実行と取り出しを計測する
+            result_cache (msaccess.cache.QueryCache か True) を渡すと SELECT の結果を覚えておく
+        """
+        self.metrics = metrics or NULL_METRICS
+        self.result_cache = QueryCache() if result_cache is True else result_cache
+        self.db_name = db_name
+        self.backend = get_backend(backend)
+        self.con = self.backend.connect(db_name)
+        self._cat = None
+        self.closed = False
+        if schema_cache is None:
+            schema_cache = os.environ.get("MSACCESS_SCHEMA_CACHE")
+        self.schema_cache = schema_cache
+        self._schema = None
+        self._procedure_index = None
+        self._view_index = None
+        self.prepared_commands = OrderedDict()
+        self.prepared_cache_size = prepared_cache_size
+
+    @property
+    @com_exception_print
+    def cat(self):
+        """ADOX.Catalog はクエリ定義を扱うときになってから作る"""
+        if self._cat is None:
+            self._cat = self.backend.open_catalog(self.con)
+        return self._cat
 
     @com_exception_print
     def close(self):
+        if self.closed:
+            return
+        self.prepared_commands.clear()
+        self._cat = None
         self.con.Close()
+        self.closed = True
+
+    def is_open(self):
+        return not self.closed and self.con.State == adStateOpen
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     @classmethod
     def convert_pytime_to_datetime(cls, pytime):
@@ -103,9 +255,9 @@ class MsAccessDb:
     def regulate_value(cls, value):
         """PyTimeとかを普通のdatetimeとかに直しておく"""
         try:
-            if "datetime" in str(type(value)):
+            if isinstance(value, datetime.datetime):
                 return cls.convert_pytime_to_datetime(value)
-            elif "Decimal" in str(type(value)):
+            elif isinstance(value, decimal.Decimal):
                 return float(value)
             elif isinstance(value, str):
                 return value
@@ -116,35 +268,234 @@ class MsAccessDb:
 
     @classmethod
     def regulate_value_for_mongodb(cls, value):
+        # 列ごとの変換 (valueConverters) からは呼ばれないので、ここで型を覚えても遅くならない
         type_name = str(type(value))
         if type_name not in cls.types:
-            cls.types = cls.types | set([type_name])
-            #print("type: {0}".format(str(type(value))))
-            import sys
-            sys.stdout.flush()
-
-        
-        if isinstance(value, datetime.datetime) and False:
-            return "ISODate({0})".format(value.isoformat())
-        elif "Decimal" in str(type(value)):
+            cls.types.add(type_name)
+        if isinstance(value, decimal.Decimal):
             return float(value)
         else:
             return value
 
     @com_exception_print
     def execute_query(self, query):
-        return self.con.Execute(query.encode("cp932"))[0]
-
-    def iterate_query(self, query):
-        qry = self.execute_query("Select * From %s;" % query)
-        while not qry.EOF:
-            try:
-                yield [MsAccessDb.regulate_value(y.Value) for y in qry.Fields]
-            except Exception as e:
-                print("convert error '%s' in '%s'" % ([y.Value for y in qry.Fields], query), file=sys.stderr)
-                print(str(e), file=sys.stderr)
-                raise
-            qry.MoveNext()
+        if self.result_cache is not None and not is_select(query):
+            self.result_cache.invalidate()
+        self.metrics.count_com_call("Execute")
+        with self.metrics.timer("execute"):
+            return self.con.Execute(query.encode("cp932"))[0]
+
+    def iterate_query(self, query, batch_size=None):
+        """batch_size を指定すると GetRows でまとめて取り出す"""
+        return self.iterate_statement("Select * From %s;" % query, batch_size)
+
+    def iterate_statement(self, statement, batch_size=None):
+        """SELECT 文をそのまま実行して一行ずつ返す"""
+        if self.result_cache is not None and is_select(statement):
+            yield from self.cached_rows(cache_key(statement), lambda: self.iterate_recordset(
+                self.execute_query(statement), batch_size, statement))
+            return
+        for row in self.iterate_recordset(self.execute_query(statement), batch_size, statement):
+            yield row
+
+    def cached_rows(self, key, fetch):
+        """ result_cache に覚えた key の結果．なければ fetch() の行を覚えながら返す
+            .mdb の更新時刻かサイズが変わっていれば先に全部捨てる
+        """
+        self.result_cache.check(file_signature(self.db_name))
+        return self.result_cache.iterate(key, fetch)
+
+    def iterate_recordset(self, qry, batch_size=None, statement=None):
+        """実行済みの Recordset から一行ずつ返す"""
+        if batch_size:
+            for rows in fetch_batches(qry, batch_size, False, statement, metrics=self.metrics):
+                for row in rows:
+                    yield row
+            return
+
+        fields = qry.Fields
+        converters = make_converters([field.Type for field in fields])
+        rows = 0
+        try:
+            while not qry.EOF:
+                try:
+                    yield [convert(y.Value) for convert, y in zip(converters, fields)]
+                except Exception as e:
+                    print("convert error '%s' in '%s'" % ([y.Value for y in qry.Fields], statement), file=sys.stderr)
+                    print(str(e), file=sys.stderr)
+                    raise
+                qry.MoveNext()
+                rows += 1
+        finally:
+            # 一行ずつのときは取り出す側と受け取る側の時間を分けられないので行数だけ数える
+            self.metrics.record("fetch", rows)
+            self.metrics.count_com_call("MoveNext", rows)
+            self.metrics.count_com_call("Field.Value", rows * len(converters))
+
+    def iterate_statement_batches(self, statement, batch_size=5000, columns=False, converter_table=None):
+        qry = self.execute_query(statement)
+        return fetch_batches(qry, batch_size, columns, statement, converter_table, self.metrics)
+
+    @com_exception_print
+    def prepare(self, statement):
+        """ パラメータ (?) つきの SQL を ADODB.Command にしておく
+            SQL の文字列ごとに prepared_cache_size 個まで使い回す
+        """
+        command = self.prepared_commands.get(statement)
+        if command is not None:
+            self.prepared_commands.move_to_end(statement)
+            return command
+
+        command = self.backend.create_command()
+        command.ActiveConnection = self.con
+        command.CommandText = EnsureUnicode(statement)
+        command.Prepared = True
+        self.prepared_commands[statement] = command
+        if len(self.prepared_commands) > self.prepared_cache_size:
+            self.prepared_commands.popitem(last=False)
+        return command
+
+    @com_exception_print
+    def execute_prepared(self, statement, parameters=()):
+        if self.result_cache is not None and not is_select(statement):
+            self.result_cache.invalidate()
+        return self.backend.execute_command(self.prepare(statement), parameters)
+
+    def iterate_prepared(self, statement, parameters=(), batch_size=None):
+        """ self.iterate_prepared("Select * From customer Where id = ?", [1])
+        """
+        if self.result_cache is not None and is_select(statement):
+            yield from self.cached_rows(cache_key(statement, parameters), lambda: self.iterate_recordset(
+                self.execute_prepared(statement, parameters), batch_size, statement))
+            return
+        for row in self.iterate_recordset(self.execute_prepared(statement, parameters), batch_size, statement):
+            yield row
+
+    def first_prepared(self, statement, parameters=()):
+        """First のパラメータつき版．見つからなければ None"""
+        return next(self.iterate_prepared(statement, parameters), None)
+
+    def sql_literal(self, value):
+        """値を SQL に埋め込める形にする (書き方はバックエンドごとに違う)"""
+        return self.backend.literal(value)
+
+    def iterate_keyed(self, table_name, key_column, after=None, batch_size=None):
+        """ key_column の順に取り出す．after を渡すとそれより大きいキーの行だけ
+            途中から再開するときに使う
+        """
+        return self.scan(table_name, key=key_column, after=after, batch_size=batch_size)
+
+    def build_scan_statement(self, table_name, columns=None, where=None, key=None,
+                             start=None, stop=None, after=None, limit=None, tie_key=None, tie_after=None):
+        """ tie_key を渡すと key, tie_key の順に並べ、after は (after, tie_after) より後の行にする
+            key が重複するときにページの境目の行を落とさないため
+        """
+        conditions = []
+        if where:
+            conditions.append("(%s)" % where)
+        if start is not None:
+            conditions.append("[%s] >= %s" % (key, self.sql_literal(start)))
+        if stop is not None:
+            conditions.append("[%s] < %s" % (key, self.sql_literal(stop)))
+        if after is not None and tie_key is not None and tie_after is not None:
+            conditions.append("([%s] > %s Or ([%s] = %s And [%s] > %s))" % (
+                key, self.sql_literal(after), key, self.sql_literal(after), tie_key, self.sql_literal(tie_after)))
+        elif after is not None:
+            conditions.append("[%s] > %s" % (key, self.sql_literal(after)))
+        column_list = ", ".join("[%s]" % column for column in columns) if columns else "*"
+        order_by = "[%s]" % key if key else None
+        if key and tie_key:
+            order_by += ", [%s]" % tie_key
+        return self.backend.select_statement(
+            column_list, table_name, " And ".join(conditions) or None, order_by, limit)
+
+    def scan(self, table_name, columns=None, where=None, key=None, start=None, stop=None,
+             after=None, page_size=None, batch_size=None):
+        """ テーブルを条件つきで読む
+            columns   : 取り出すカラム (省略時は全部)
+            where     : 絞り込みの条件式
+            key       : この順に並べる．start <= key < stop や key > after で範囲を指定できる
+            page_size : key の範囲で page_size 行ずつ別々のクエリにして読む．
+                        key を省略すると主キーを使う．key が主キーでなければ
+                        (key, 主キー) の順でページを分ける (主キーは一つの列であること)
+        """
+        if not page_size:
+            statement = self.build_scan_statement(table_name, columns, where, key, start, stop, after)
+            for row in self.iterate_statement(statement, batch_size):
+                yield row
+            return
+
+        key_columns = self.get_primary_key(table_name)
+        if len(key_columns) != 1:
+            raise Exception("paging requires a single column primary key: %s" % table_name)
+        tie_key = None
+        if key is None:
+            key = key_columns[0]
+        elif key != key_columns[0]:
+            tie_key = key_columns[0]
+
+        # ページの続きを決めるためにキーも取り出す
+        query_columns = list(columns) if columns else None
+        extra = 0
+        indexes = []
+        for column in [key, tie_key] if tie_key else [key]:
+            if query_columns is None:
+                indexes.append(self.get_field_names(table_name).index(column))
+            elif column in query_columns:
+                indexes.append(query_columns.index(column))
+            else:
+                query_columns.append(column)
+                indexes.append(len(query_columns) - 1)
+                extra += 1
+        tie_after = None
+
+        while True:
+            statement = self.build_scan_statement(
+                table_name, query_columns, where, key, start, stop, after, page_size, tie_key, tie_after)
+            count = 0
+            for row in self.iterate_statement(statement, batch_size):
+                count += 1
+                after = row[indexes[0]]
+                if tie_key:
+                    tie_after = row[indexes[1]]
+                yield row[:len(row) - extra] if extra else row
+            if count < page_size:
+                return
+
+    def scan_ranges(self, table_name, key, parts):
+        """ 数値の key の範囲を parts 個に分けて [(start, stop)] で返す
+            それぞれを scan(start=..., stop=...) に渡して別々のワーカーで読める
+        """
+        low, high = next(self.iterate_statement(
+            "Select Min([%s]), Max([%s]) From %s;" % (key, key, table_name)))
+        if low is None:
+            return []
+        step = (high - low + 1) / float(parts)
+        bounds = [low + int(step * i) for i in range(parts)] + [high + 1]
+        return [(bounds[i], bounds[i + 1]) for i in range(parts) if bounds[i] < bounds[i + 1]]
+
+    def iterate_batches(self, query, batch_size=5000, columns=False, converter_table=None):
+        """ batch_size 行ずつのリストを返す．columns=True なら列ごとのリストで返す
+            converter_table で DATA_TYPE ごとの変換を差し替えられる
+        """
+        return self.iterate_statement_batches("Select * From %s;" % query, batch_size, columns, converter_table)
+
+    def iterate_column_batches(self, query, batch_size=5000, numpy=False):
+        """列ごとにまとめた ColumnBatch を返す (msaccess.columnar を参照)"""
+        from .columnar import iterate_column_batches
+        return iterate_column_batches(self, query, batch_size, numpy)
+
+    def iterate_large_fields(self, query, policy, columns=None, chunk_size=64 * 1024):
+        """ メモ型や OLE オブジェクト型の列を GetChunk で少しずつ読みながら一行ずつ返す
+            長い値は policy の値になる (msaccess.largefields を参照)
+        """
+        from .largefields import iterate_large_fields
+        return iterate_large_fields(self, "Select * From %s;" % query, policy, columns, chunk_size)
+
+    def export_parquet(self, table_name, path, row_group_size=65536, field_names=None, compression="snappy"):
+        """テーブルを Parquet ファイルに書き出す (pyarrow が必要)"""
+        from .parquet import write_parquet
+        return write_parquet(self, table_name, path, row_group_size, field_names, compression)
 
     @com_exception_print
     def open_schema(self):
@@ -154,32 +505,39 @@ class MsAccessDb:
     def open_columns(self, tableName):
         return self.con.OpenSchema(4, [None, None, tableName])
 
+    @property
     @com_exception_print
+    def schema(self):
+        """テーブル、カラム、主キーをまとめて読み込んだ SchemaCatalog"""
+        if self._schema is None:
+            self._schema = SchemaCatalog.load_cached(self.con, self.db_name, self.schema_cache)
+        return self._schema
+
+    def invalidate_schema(self):
+        self._schema = None
+
     def get_schema_names(self, schemaType):
-        ret = []
-        schemas = self.open_schema()
-        while not schemas.EOF:
-            fields = schemas.Fields
-            # print fields.Item("TABLE_TYPE").Value, fields.Item("TABLE_NAME").Value
-            if fields.Item("TABLE_TYPE").Value == str(schemaType):
-                ret.append(fields.Item("TABLE_NAME").Value)
-            schemas.MoveNext()
-        return ret
+        return self.schema.table_names(schemaType)
 
-    @com_exception_print
     def get_table_names(self):
         return self.get_schema_names("TABLE")
 
-    @com_exception_print
     def get_field_names(self, queryName):
-        field_list = [ (field.Item("ORDINAL_POSITION").Value, field.Item("COLUMN_NAME").Value) for field in self.GetSchemaColumns(queryName)]
-        field_list.sort()
-        return [ field_name for order, field_name in field_list ]
+        return self.schema.field_names(queryName)
 
-    @com_exception_print
     def get_field_attributes(self, queryName):
-        field_list = [ dict([ (field(i).Name, field(i).Value) for i in range(field.Count) ]) for field in self.GetSchemaColumns(queryName)]
-        return field_list
+        return self.schema.field_attributes(queryName)
+
+    def get_primary_key(self, tableName):
+        """主キーのカラム名のリスト"""
+        return self.schema.primary_key(tableName)
+
+    @com_exception_print
+    def get_foreign_keys(self):
+        """ 外部キーのリスト [{"name", "parent_table", "parent_columns", "child_table", "child_columns"}]
+            (msaccess.schema.read_foreign_keys を参照)
+        """
+        return read_foreign_keys(self.con)
 
     @com_exception_print
     def get_table_and_field_names(self):
@@ -187,35 +545,61 @@ class MsAccessDb:
             for field_name in self.get_field_names(table_name):
                 yield (table_name, field_name)
 
+    @staticmethod
+    def IndexQueryDefinitions(collection):
+        """ Procedures や Views を {名前: オブジェクト} にする
+            "~" で始まる一時的なものは除く
+        """
+        index = {}
+        count = collection.Count
+        for i in range(count):
+            item = collection.Item(i)
+            name = item.Name
+            if "~" != name[0]:
+                index[name] = item
+        return index
+
+    @property
     @com_exception_print
-    def GetProcedureNames(self):
-        return [self.cat.Procedures.Item(i).Name for i in range(self.cat.Procedures.Count) if
-                "~" != self.cat.Procedures.Item(i).Name[0]]
+    def procedure_index(self):
+        if self._procedure_index is None:
+            self._procedure_index = self.IndexQueryDefinitions(self.cat.Procedures)
+        return self._procedure_index
 
+    @property
     @com_exception_print
+    def view_index(self):
+        if self._view_index is None:
+            self._view_index = self.IndexQueryDefinitions(self.cat.Views)
+        return self._view_index
+
+    def invalidate_query_definitions(self):
+        """ 他の接続からクエリ定義が変更されたときに呼ぶ
+        """
+        self._procedure_index = None
+        self._view_index = None
+
+    def GetProcedureNames(self):
+        return list(self.procedure_index)
+
     def HasProcedure(self, name):
-        return EnsureUnicode(name) in self.GetProcedureNames()
+        return EnsureUnicode(name) in self.procedure_index
 
-    @com_exception_print
     def GetViewNames(self):
-        return [self.cat.Views.Item(i).Name for i in range(self.cat.Views.Count) if
-                "~" != self.cat.Views.Item(i).Name[0]]
+        return list(self.view_index)
 
-    @com_exception_print
     def HasView(self, name):
-        return EnsureUnicode(name) in self.GetViewNames()
+        return EnsureUnicode(name) in self.view_index
 
-    @com_exception_print
     def GetQueryDefinitionNames(self):
         return sorted(self.GetProcedureNames() + self.GetViewNames())
 
-    @com_exception_print
     def GetQueryDefinitionObject(self, name):
         name = EnsureUnicode(name)
-        if self.HasProcedure(name):
-            return self.cat.Procedures.Item(name)
-        elif self.HasView(name):
-            return self.cat.Views.Item(name)
+        if name in self.procedure_index:
+            return self.procedure_index[name]
+        elif name in self.view_index:
+            return self.view_index[name]
         else:
             raise Exception("not found QueryDefinitionObject: %s" % name)
 
@@ -248,6 +632,15 @@ class MsAccessDb:
         attrs["OrdinalPosition"] = field.Item("ORDINAL_POSITION").Value
         return (name, attrs)
 
+    @classmethod
+    def ConvertEasyAttributes(cls, attributes):
+        name = cls.regulate_value(attributes["COLUMN_NAME"])
+        attrs = {}
+        attrs["Type"] = typeNames[attributes["DATA_TYPE"]]
+        attrs["IsNullable"] = attributes["IS_NULLABLE"]
+        attrs["OrdinalPosition"] = attributes["ORDINAL_POSITION"]
+        return (name, attrs)
+
     def GetEasySchema(self, tableName):
         """ 他の形式への変換が簡単になるような形のスキーマにする
             あと、ORDINAL_POSITION でソートしておく
@@ -260,8 +653,8 @@ class MsAccessDb:
             }
         """
         ret = []
-        for field in self.GetSchemaColumns(tableName):
-            ret.append(self.ConvertEasyField(field))
+        for attributes in self.get_field_attributes(tableName):
+            ret.append(self.ConvertEasyAttributes(attributes))
         return dict(ret)
 
     @com_exception_print
@@ -273,20 +666,31 @@ class MsAccessDb:
                 print(f.Item(i).Name, f.Item(i).Value)
                 keys.MoveNext()
 
+    @com_exception_print
+    def count_rows(self, table_name):
+        """テーブルの行数"""
+        return self.execute_query("Select Count(*) From %s;" % table_name).Fields.Item(0).Value
+
     def First(self, query):
         """最初のデータだけ取り出す．合計値を取り出すときとかに"""
-        return next(self.iterate_query(query))
+        return next(self.iterate_statement(self.backend.select_statement("*", query, limit=1)))
 
     @com_exception_print
     def CreateQueryDefinition(self, name, queryString):
         """ データベースへクエリ定義を登録する
         """
         # クエリのインスタンスを作成
-        queryDefinition = win32com.client.Dispatch("ADODB.Command")
+        queryDefinition = self.backend.create_command()
         # 定義を設定
         queryDefinition.CommandText = EnsureUnicode(queryString)
         # 追加
-        self.cat.Procedures.Append(EnsureUnicode(name), queryDefinition)
+        name = EnsureUnicode(name)
+        self.cat.Procedures.Append(name, queryDefinition)
+        # 引数のない Select は Views に入るので、どちらの索引も作り直す
+        self.invalidate_query_definitions()
+        self.invalidate_schema()
+        if self.result_cache is not None:
+            self.result_cache.invalidate()
 
     @com_exception_print
     def DeleteQueryDefinition(self, name):
@@ -295,10 +699,15 @@ class MsAccessDb:
         name = EnsureUnicode(name)
         if self.HasProcedure(name):
             self.cat.Procedures.Delete(name)
+            del self.procedure_index[name]
         elif self.HasView(name):
             self.cat.Views.Delete(name)
+            del self.view_index[name]
         else:
             raise Exception("%s is not found" % name)
+        self.invalidate_schema()
+        if self.result_cache is not None:
+            self.result_cache.invalidate()
 
 
 def MakeFromPhraseOfInnerJoin(field, names):
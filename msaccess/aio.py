@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+""" asyncio から MsAccessDb を使う
+
+    COM の処理はデータベースごとに専用のスレッド (シングルスレッドアパートメント)
+    で行う．行は batch_size 行ずつ取り出して prefetch 個までしか先読みしないので、
+    受け取る側が遅ければ取り出す側も待つ．
+
+        async with AsyncMsAccessDb("data.mdb") as db:
+            async for row in db.iterate_query("customer"):
+                ...
+
+    たくさんのファイルをまとめて扱うときは map_databases で同時に開く数を絞る
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from . import MsAccessDb
+
+
+def initialize_apartment():
+    """ADO を使うスレッドで COM を初期化しておく"""
+    try:
+        import pythoncom
+    except ImportError:
+        return
+    pythoncom.CoInitialize()
+
+
+def uninitialize_apartment():
+    try:
+        import pythoncom
+    except ImportError:
+        return
+    pythoncom.CoUninitialize()
+
+
+class EndOfBatches:
+    pass
+
+
+class AsyncMsAccessDb:
+    def __init__(self, db_name, backend=None, batch_size=1000, prefetch=2, semaphore=None, **options):
+        """ batch_size : 一回に取り出す行数
+            prefetch   : 受け取る側を待たずに先読みしておくバッチの数
+            semaphore  : 同時に実行するクエリの数を絞る asyncio.Semaphore (複数の db で共有できる)
+            options    : MsAccessDb に渡す引数
+        """
+        self.db_name = db_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.semaphore = semaphore
+        self.options = options
+        self.executor = ThreadPoolExecutor(max_workers=1, initializer=initialize_apartment)
+        self.db = None
+
+    async def run(self, func, *args, **kwargs):
+        """func を COM 用のスレッドで実行する"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def open(self):
+        if self.db is None:
+            self.db = await self.run(MsAccessDb, self.db_name, self.backend, **self.options)
+        return self
+
+    async def close(self):
+        if self.db is not None:
+            await self.run(self.db.close)
+            await self.run(uninitialize_apartment)
+            self.db = None
+        self.executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def acquire(self):
+        if self.semaphore is not None:
+            await self.semaphore.acquire()
+
+    def release(self):
+        if self.semaphore is not None:
+            self.semaphore.release()
+
+    async def call(self, method_name, *args, **kwargs):
+        """MsAccessDb のメソッドをそのまま呼ぶ．例: await db.call("get_table_names")"""
+        await self.acquire()
+        try:
+            return await self.run(getattr(self.db, method_name), *args, **kwargs)
+        finally:
+            self.release()
+
+    async def First(self, query):
+        return await self.call("First", query)
+
+    async def get_table_names(self):
+        return await self.call("get_table_names")
+
+    async def get_field_names(self, queryName):
+        return await self.call("get_field_names", queryName)
+
+    async def produce(self, batches, queue):
+        """バッチを取り出して queue に入れる．queue が一杯なら空くまで待つ"""
+        try:
+            while True:
+                batch = await self.run(next, batches, None)
+                if batch is None:
+                    break
+                await queue.put(batch)
+            await queue.put(EndOfBatches)
+        except Exception as e:
+            await queue.put(e)
+
+    async def iterate_batches(self, query, batch_size=None):
+        await self.acquire()
+        try:
+            batches = await self.run(self.db.iterate_batches, query, batch_size or self.batch_size)
+            queue = asyncio.Queue(self.prefetch)
+            producer = asyncio.ensure_future(self.produce(batches, queue))
+            try:
+                while True:
+                    batch = await queue.get()
+                    if batch is EndOfBatches:
+                        break
+                    if isinstance(batch, Exception):
+                        raise batch
+                    yield batch
+            finally:
+                producer.cancel()
+                await self.run(batches.close)
+        finally:
+            self.release()
+
+    async def iterate_query(self, query, batch_size=None):
+        async for batch in self.iterate_batches(query, batch_size):
+            for row in batch:
+                yield row
+
+
+async def map_databases(db_names, func, concurrency=8, **options):
+    """ 各データベースを AsyncMsAccessDb で開いて await func(db) を実行し、
+        結果を db_names の順で返す．同時に開くのは concurrency 個まで
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(db_name):
+        async with semaphore:
+            async with AsyncMsAccessDb(db_name, **options) as db:
+                return await func(db)
+
+    return await asyncio.gather(*[run(db_name) for db_name in db_names])
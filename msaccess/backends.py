@@ -0,0 +1,534 @@
+# -*- coding: utf-8 -*-
+""" MsAccessDb の下で動く接続バックエンド
+
+    ado    : ADODB/ADOX を COM 経由で使う本来の実装 (Windows のみ)
+    sqlite : ADO のオブジェクトモデル (Connection, Recordset, Fields,
+             Catalog) を SQLite の上で真似する代替実装．
+             Windows 以外でテストやプロファイルを取るために使う
+"""
+import os
+import re
+import sqlite3
+import datetime
+import decimal
+
+
+def win32com_client():
+    """win32com は使うときになってから import する"""
+    import win32com.client
+    return win32com.client
+
+
+def quote_string(text):
+    return "'%s'" % text.replace("'", "''")
+
+
+class AdoBackend:
+    name = "ado"
+    connection_string = "Provider=Microsoft.Jet.OLEDB.4.0;Data Source=%s;"
+
+    def literal(self, value):
+        """Jet SQL のリテラル．日付は #...# で囲む"""
+        if value is None:
+            return "Null"
+        elif isinstance(value, bool):
+            return "True" if value else "False"
+        elif isinstance(value, datetime.datetime):
+            return value.strftime("#%Y-%m-%d %H:%M:%S#")
+        elif isinstance(value, (int, float, decimal.Decimal)):
+            return str(value)
+        return quote_string(str(value))
+
+    def select_statement(self, columns, source, where=None, order_by=None, limit=None):
+        """Jet では件数の制限は Top で書く"""
+        statement = "Select %s%s From %s" % ("Top %d " % limit if limit else "", columns, source)
+        if where:
+            statement += " Where %s" % where
+        if order_by:
+            statement += " Order By %s" % order_by
+        return statement + ";"
+
+    def connect(self, db_name):
+        con = win32com_client().dynamic.Dispatch("ADODB.Connection")
+        con.Open(self.connection_string % db_name)
+        return con
+
+    def open_catalog(self, con):
+        cat = win32com_client().Dispatch("ADOX.Catalog")
+        cat.ActiveConnection = con
+        return cat
+
+    def create_command(self):
+        return win32com_client().Dispatch("ADODB.Command")
+
+    def execute_command(self, command, parameters=()):
+        """Command.Execute(RecordsAffected, Parameters) は (Recordset, 件数) を返す"""
+        result = command.Execute(None, tuple(parameters))
+        if isinstance(result, tuple):
+            return result[0]
+        return result
+
+
+class SqliteBackend:
+    name = "sqlite"
+
+    def literal(self, value):
+        if value is None:
+            return "Null"
+        elif isinstance(value, bool):
+            return "1" if value else "0"
+        elif isinstance(value, datetime.datetime):
+            return quote_string(value.isoformat(" "))
+        elif isinstance(value, (int, float, decimal.Decimal)):
+            return str(value)
+        return quote_string(str(value))
+
+    def select_statement(self, columns, source, where=None, order_by=None, limit=None):
+        statement = "Select %s From %s" % (columns, source)
+        if where:
+            statement += " Where %s" % where
+        if order_by:
+            statement += " Order By %s" % order_by
+        if limit:
+            statement += " Limit %d" % limit
+        return statement + ";"
+
+    def connect(self, db_name):
+        return SqliteConnection(db_name)
+
+    def open_catalog(self, con):
+        return SqliteCatalog(con)
+
+    def create_command(self):
+        return SqliteCommand()
+
+    def execute_command(self, command, parameters=()):
+        return command.Execute(None, tuple(parameters))[0]
+
+
+backends = {
+    AdoBackend.name: AdoBackend,
+    SqliteBackend.name: SqliteBackend,
+}
+
+
+def get_backend(backend=None):
+    """名前かインスタンスからバックエンドを返す．
+        指定がなければ環境変数 MSACCESS_BACKEND を見て、それもなければ ado
+    """
+    if backend is None:
+        backend = os.environ.get("MSACCESS_BACKEND", AdoBackend.name)
+    if isinstance(backend, str):
+        if backend not in backends:
+            raise Exception("unknown backend: %s" % backend)
+        return backends[backend]()
+    return backend
+
+
+# ---------------------------------------------------------------------------
+# SQLite による ADO の代替実装
+
+# 宣言された型名から ADO の DataTypeEnum へ．上から順に部分一致で探す
+declared_types = [
+    ("CURRENCY", 6),
+    ("MONEY", 6),
+    ("DATE", 7),
+    ("TIME", 7),
+    ("BOOL", 11),
+    ("BIT", 11),
+    ("YESNO", 11),
+    ("DECIMAL", 131),
+    ("NUMERIC", 131),
+    ("BIGINT", 20),
+    ("SMALLINT", 2),
+    ("TINYINT", 17),
+    ("BYTE", 17),
+    ("INT", 3),
+    ("REAL", 4),
+    ("FLOA", 5),
+    ("DOUB", 5),
+    ("MEMO", 203),
+    ("CLOB", 203),
+    ("LONGTEXT", 203),
+    ("CHAR", 130),
+    ("TEXT", 130),
+    ("GUID", 72),
+    ("BLOB", 205),
+    ("BINARY", 205),
+    ("OLE", 205),
+]
+
+# 値の Python の型から ADO の DataTypeEnum へ (Recordset の Field.Type 用)
+value_types = [
+    (bool, 11),
+    (int, 3),
+    (float, 5),
+    (decimal.Decimal, 6),
+    (datetime.datetime, 7),
+    (str, 202),
+    (bytes, 205),
+]
+
+adVariant = 12
+adFldLong = 0x80
+# GetChunk で読む長い値の型 (adLongVarChar, adLongVarWChar, adLongVarBinary)
+long_types = (201, 203, 205)
+# Access のテキスト型の最大の長さ．これより長い文字列はメモ型とみなす
+max_text_length = 255
+adStateClosed = 0
+adStateOpen = 1
+adGetRowsRest = -1
+
+
+select_all_pattern = re.compile(r"\s*Select\s+\*\s+From\s+\[?(\w+)\]?\s*;?\s*$", re.IGNORECASE)
+
+
+def ado_type_of_declaration(declared_type):
+    declared_type = (declared_type or "").upper()
+    for key, data_type in declared_types:
+        if key in declared_type:
+            return data_type
+    return adVariant
+
+
+def ado_type_of_value(value):
+    if isinstance(value, str) and len(value) > max_text_length:
+        return 203
+    for python_type, data_type in value_types:
+        if isinstance(value, python_type):
+            return data_type
+    return adVariant
+
+
+def convert_datetime(text):
+    return datetime.datetime.fromisoformat(text.decode())
+
+
+def convert_decimal(text):
+    return decimal.Decimal(text.decode())
+
+
+def convert_boolean(text):
+    return text not in (b"0", b"", b"False", b"false")
+
+
+converters_registered = False
+
+
+def register_converters():
+    """Access の日付・通貨・Yes/No 型を宣言した列を Python の値に戻す"""
+    global converters_registered
+    if converters_registered:
+        return
+    for name in ("DATETIME", "DATE", "TIMESTAMP"):
+        sqlite3.register_converter(name, convert_datetime)
+    for name in ("CURRENCY", "MONEY", "DECIMAL", "NUMERIC"):
+        sqlite3.register_converter(name, convert_decimal)
+    for name in ("BOOLEAN", "BIT", "YESNO"):
+        sqlite3.register_converter(name, convert_boolean)
+    converters_registered = True
+
+
+class SqliteField:
+    def __init__(self, recordset, index, name, data_type):
+        self.recordset = recordset
+        self.index = index
+        self.Name = name
+        self.Type = data_type
+        self.Attributes = adFldLong if data_type in long_types else 0
+        # GetChunk でどこまで読んだか (行が変わったら最初から)
+        self.chunk_position = None
+        self.chunk_offset = 0
+
+    @property
+    def Value(self):
+        return self.recordset.current[self.index]
+
+    @property
+    def ActualSize(self):
+        """値の長さ (文字列は文字数、バイナリはバイト数)．Null なら 0"""
+        value = self.Value
+        return 0 if value is None else len(value)
+
+    def GetChunk(self, size):
+        """Field.GetChunk と同じく、呼ぶたびに続きを size だけ返す．残りがなければ None"""
+        if self.chunk_position != self.recordset.position:
+            self.chunk_position = self.recordset.position
+            self.chunk_offset = 0
+        value = self.Value
+        if value is None or self.chunk_offset >= len(value):
+            return None
+        chunk = value[self.chunk_offset:self.chunk_offset + size]
+        self.chunk_offset += len(chunk)
+        return chunk
+
+
+class SqliteFields:
+    def __init__(self, fields):
+        self.fields = fields
+
+    @property
+    def Count(self):
+        return len(self.fields)
+
+    def Item(self, key):
+        if isinstance(key, str):
+            for field in self.fields:
+                if field.Name == key:
+                    return field
+            raise KeyError(key)
+        return self.fields[key]
+
+    __call__ = Item
+    __getitem__ = Item
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+
+class SqliteRecordset:
+    """前方参照のみの Recordset．行は必要になった分だけ cursor から取り出す"""
+
+    def __init__(self, names, rows, types=None):
+        self.rows = iter(rows)
+        self.current = next(self.rows, None)
+        self.position = 0
+        if types is None:
+            types = [ado_type_of_value(value) for value in self.current] if self.current else [adVariant] * len(names)
+        self.Fields = SqliteFields([SqliteField(self, i, name, data_type)
+                                    for i, (name, data_type) in enumerate(zip(names, types))])
+        self.State = adStateOpen
+
+    @property
+    def EOF(self):
+        return self.current is None
+
+    def MoveNext(self):
+        self.current = next(self.rows, None)
+        self.position += 1
+
+    def GetRows(self, rows=adGetRowsRest):
+        block = []
+        while self.current is not None and (rows < 0 or len(block) < rows):
+            block.append(self.current)
+            self.MoveNext()
+        return tuple(zip(*block)) if block else tuple(() for field in self.Fields)
+
+    def Close(self):
+        self.current = None
+        self.State = adStateClosed
+
+
+class SqliteConnection:
+    # OpenSchema で返す列．ADO の SchemaEnum と同じ並び
+    table_columns = ["TABLE_CATALOG", "TABLE_SCHEMA", "TABLE_NAME", "TABLE_TYPE",
+                     "TABLE_GUID", "DESCRIPTION", "TABLE_PROPID", "DATE_CREATED", "DATE_MODIFIED"]
+    column_columns = ["TABLE_CATALOG", "TABLE_SCHEMA", "TABLE_NAME", "COLUMN_NAME",
+                      "COLUMN_GUID", "COLUMN_PROPID", "ORDINAL_POSITION", "COLUMN_HASDEFAULT",
+                      "COLUMN_DEFAULT", "COLUMN_FLAGS", "IS_NULLABLE", "DATA_TYPE", "TYPE_GUID",
+                      "CHARACTER_MAXIMUM_LENGTH", "CHARACTER_OCTET_LENGTH", "NUMERIC_PRECISION",
+                      "NUMERIC_SCALE", "DESCRIPTION"]
+    primary_key_columns = ["TABLE_CATALOG", "TABLE_SCHEMA", "TABLE_NAME", "COLUMN_NAME",
+                           "COLUMN_GUID", "COLUMN_PROPID", "ORDINAL", "PK_NAME"]
+    foreign_key_columns = ["PK_TABLE_CATALOG", "PK_TABLE_SCHEMA", "PK_TABLE_NAME", "PK_COLUMN_NAME",
+                           "PK_COLUMN_GUID", "PK_COLUMN_PROPID", "FK_TABLE_CATALOG", "FK_TABLE_SCHEMA",
+                           "FK_TABLE_NAME", "FK_COLUMN_NAME", "FK_COLUMN_GUID", "FK_COLUMN_PROPID",
+                           "ORDINAL", "UPDATE_RULE", "DELETE_RULE", "PK_NAME", "FK_NAME", "DEFERRABILITY"]
+
+    def __init__(self, db_name):
+        register_converters()
+        self.db_name = db_name
+        # ConnectionPool から別のスレッドに渡されることがある
+        self.connection = sqlite3.connect(
+            db_name, detect_types=sqlite3.PARSE_DECLTYPES, isolation_level=None, check_same_thread=False)
+        self.State = adStateOpen
+
+    def Close(self):
+        self.connection.close()
+        self.State = adStateClosed
+
+    def Execute(self, query, *args):
+        return self.execute(query)
+
+    def execute(self, query, parameters=()):
+        if isinstance(query, bytes):
+            query = query.decode("cp932")
+        cursor = self.connection.execute(query, parameters)
+        if cursor.description is None:
+            return (SqliteRecordset([], []), cursor.rowcount)
+        names = [column[0] for column in cursor.description]
+        return (SqliteRecordset(names, cursor, self.declared_field_types(query, names)), -1)
+
+    def declared_field_types(self, query, names):
+        """ "Select * From テーブル" なら宣言された型を Field.Type にする．
+            それ以外は None (最初の行の値から決める)
+        """
+        match = select_all_pattern.match(query)
+        if match is None:
+            return None
+        declared = dict((column_name, declared_type) for cid, column_name, declared_type, not_null, default, pk
+                        in self.table_info(match.group(1)))
+        if not declared or set(names) - set(declared):
+            return None
+        return [ado_type_of_declaration(declared[name]) for name in names]
+
+    def OpenSchema(self, schema, criteria=None):
+        table_name = criteria[2] if criteria and len(criteria) > 2 else None
+        if schema == 20:
+            return SqliteRecordset(self.table_columns, self.schema_tables(table_name))
+        elif schema == 4:
+            return SqliteRecordset(self.column_columns, self.schema_columns(table_name))
+        elif schema == 28:
+            return SqliteRecordset(self.primary_key_columns, self.schema_primary_keys(table_name))
+        elif schema == 27:
+            # 制限は (PK_TABLE_CATALOG, PK_TABLE_SCHEMA, PK_TABLE_NAME, FK_TABLE_CATALOG, FK_TABLE_SCHEMA, FK_TABLE_NAME)
+            child_table_name = criteria[5] if criteria and len(criteria) > 5 else None
+            return SqliteRecordset(self.foreign_key_columns, self.schema_foreign_keys(table_name, child_table_name))
+        raise Exception("unsupported schema: %s" % schema)
+
+    def master_entries(self, table_name=None):
+        rows = self.connection.execute(
+            "Select name, type From sqlite_master Where type In ('table', 'view') Order By name").fetchall()
+        return [(name, entry_type) for name, entry_type in rows if table_name in (None, name)]
+
+    def table_info(self, table_name):
+        return self.connection.execute("PRAGMA table_info(%s)" % quote_identifier(table_name)).fetchall()
+
+    def schema_tables(self, table_name=None):
+        for name, entry_type in self.master_entries(table_name):
+            if entry_type == "view":
+                table_type = "VIEW"
+            elif name.startswith("sqlite_") or name.startswith(SqliteCatalog.system_prefix):
+                table_type = "SYSTEM TABLE"
+            else:
+                table_type = "TABLE"
+            yield [None, None, name, table_type, None, None, None, None, None]
+
+    def schema_columns(self, table_name=None):
+        for name, entry_type in self.master_entries(table_name):
+            for cid, column_name, declared_type, not_null, default, pk in self.table_info(name):
+                data_type = ado_type_of_declaration(declared_type)
+                length = re.search(r"\((\d+)\)", declared_type or "")
+                length = int(length.group(1)) if length else None
+                yield [None, None, name, column_name,
+                       None, None, cid + 1, default is not None,
+                       default, None, not (not_null or pk), data_type, None,
+                       length, length * 2 if length else None, None,
+                       None, None]
+
+    def schema_primary_keys(self, table_name=None):
+        for name, entry_type in self.master_entries(table_name):
+            if entry_type != "table":
+                continue
+            for cid, column_name, declared_type, not_null, default, pk in self.table_info(name):
+                if pk:
+                    yield [None, None, name, column_name, None, None, pk, "PrimaryKey"]
+
+    def schema_foreign_keys(self, parent_table_name=None, child_table_name=None):
+        for name, entry_type in self.master_entries(child_table_name):
+            if entry_type != "table":
+                continue
+            foreign_keys = self.connection.execute(
+                "PRAGMA foreign_key_list(%s)" % quote_identifier(name)).fetchall()
+            for id, seq, parent, column_name, parent_column_name, on_update, on_delete, match in foreign_keys:
+                if parent_table_name not in (None, parent):
+                    continue
+                if parent_column_name is None:
+                    # 参照先の列を省略したときは主キー
+                    primary_key = sorted((pk, info_name) for cid, info_name, declared_type, not_null, default, pk
+                                         in self.table_info(parent) if pk)
+                    parent_column_name = primary_key[seq][1]
+                yield [None, None, parent, parent_column_name, None, None,
+                       None, None, name, column_name, None, None,
+                       seq + 1, on_update, on_delete, "PrimaryKey", "%s_%s_%d" % (parent, name, id), None]
+
+
+class SqliteCommand:
+    def __init__(self, command_text=None):
+        self.CommandText = command_text
+        self.ActiveConnection = None
+        self.Prepared = False
+
+    def Execute(self, records_affected=None, parameters=()):
+        return self.ActiveConnection.execute(self.CommandText, parameters)
+
+
+class SqliteQueryDefinition:
+    def __init__(self, name, command):
+        self.Name = name
+        self.Command = command
+
+
+class SqliteQueryDefinitions:
+    """ADOX の Procedures / Views の代わり"""
+
+    def __init__(self, load, append=None, delete=None):
+        self.load = load
+        self.append = append
+        self.delete = delete
+
+    @property
+    def Count(self):
+        return len(self.load())
+
+    def Item(self, key):
+        items = self.load()
+        if isinstance(key, str):
+            for item in items:
+                if item.Name == key:
+                    return item
+            raise KeyError(key)
+        return items[key]
+
+    def Append(self, name, command):
+        self.append(name, command)
+
+    def Delete(self, name):
+        self.delete(name)
+
+
+class SqliteCatalog:
+    """ADOX.Catalog の代わり．
+        ビューは SQLite のビュー、プロシージャは専用のテーブルに保存する
+    """
+    system_prefix = "MSys"
+    procedure_table = "MSysProcedures"
+
+    def __init__(self, con):
+        self.con = con
+        self.Procedures = SqliteQueryDefinitions(
+            self.load_procedures, self.append_procedure, self.delete_procedure)
+        self.Views = SqliteQueryDefinitions(self.load_views, delete=self.delete_view)
+
+    def execute(self, query, parameters=()):
+        return self.con.connection.execute(query, parameters)
+
+    def ensure_procedure_table(self):
+        self.execute("Create Table If Not Exists %s (Name Text Primary Key, CommandText Text)"
+                     % self.procedure_table)
+
+    def load_procedures(self):
+        self.ensure_procedure_table()
+        return [SqliteQueryDefinition(name, SqliteCommand(text)) for name, text in
+                self.execute("Select Name, CommandText From %s Order By Name" % self.procedure_table)]
+
+    def append_procedure(self, name, command):
+        self.ensure_procedure_table()
+        self.execute("Insert Into %s Values (?, ?)" % self.procedure_table, (name, command.CommandText))
+
+    def delete_procedure(self, name):
+        self.execute("Delete From %s Where Name = ?" % self.procedure_table, (name,))
+
+    def load_views(self):
+        return [SqliteQueryDefinition(name, SqliteCommand(sql)) for name, sql in
+                self.execute("Select name, sql From sqlite_master Where type = 'view' Order By name")]
+
+    def delete_view(self, name):
+        self.execute("Drop View %s" % quote_identifier(name))
+
+
+def quote_identifier(name):
+    return "[%s]" % name
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+""" クエリの結果のキャッシュ
+
+    同じ検索や合計のクエリを何度も実行するときに、結果の行を覚えておく．
+
+        db = MsAccessDb("data.mdb", result_cache=QueryCache(max_entries=1000, ttl=60))
+        db.First("(Select Sum(amount) From orders)")   # 実行する
+        db.First("(select sum(amount)  from orders)")  # 覚えておいた結果
+        db.result_cache.stats()
+
+    キーは空白と大文字小文字をそろえた SQL (文字列のリテラルの中はそのまま) と
+    パラメータ．エントリの数とバイト数 (pickle した大きさ) の上限を超えたら
+    最後に使ったのが古いものから捨てる．ttl 秒より古いエントリは使わない．
+    directory を指定すると、結果を列ごとにまとめて pickle し zlib で縮めたファイルにも
+    書いておき、メモリにないときや次に起動したときに使う．
+
+    .mdb の更新時刻かサイズが変わったら全部捨てる．MsAccessDb は SELECT 以外の文を
+    実行したときと、クエリ定義を作ったり消したりしたときにも捨てる．
+    max_rows 行より多い結果は覚えない (一行ずつ読みながら返す)
+"""
+import os
+import re
+import sys
+import time
+import zlib
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 文字列、[名前]、#日付# とそれ以外
+token_pattern = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\[[^\]]*\]|#[^#]*#)|([^'\"\[#]+|.)", re.DOTALL)
+
+
+def normalize_sql(statement):
+    """リテラルの外の空白を一つにし、小文字にして、最後の ; を取る"""
+    parts = []
+    for literal, text in token_pattern.findall(statement):
+        parts.append(literal if literal else re.sub(r"\s+", " ", text).lower())
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def cache_key(statement, parameters=()):
+    key = normalize_sql(statement)
+    if parameters:
+        key += "\0" + repr(tuple(parameters))
+    return key
+
+
+def is_select(statement):
+    """結果を覚えてよい読むだけの文か．Jet の Select ... Into (テーブル作成クエリ) は書き込みとする"""
+    if not normalize_sql(statement).lstrip("(").startswith(("select", "transform")):
+        return False
+    code = "".join(text for literal, text in token_pattern.findall(statement))
+    return re.search(r"\binto\b", code, re.IGNORECASE) is None
+
+
+class CacheEntry:
+    def __init__(self, rows, size, created):
+        self.rows = rows
+        self.size = size
+        self.created = created
+
+
+class QueryCache:
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, ttl=None, max_rows=10000,
+                 directory=None, max_disk_bytes=1024 * 1024 * 1024):
+        """ max_entries, max_bytes : メモリに置くエントリの数とバイト数の上限
+            ttl                    : エントリを使う秒数 (None なら期限なし)
+            max_rows               : これより行の多い結果は覚えない
+            directory              : ファイルにも書くディレクトリ (None ならメモリだけ)
+            max_disk_bytes         : directory のファイルの合計の上限
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        # 結果を覚えたときの .mdb の (更新時刻, サイズ)
+        self.signature = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # directory のファイルの合計 (数えるまでは None)
+        self.disk_bytes = None
+        self.lock = threading.Lock()
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return OrderedDict([
+            ("hits", self.hits),
+            ("disk_hits", self.disk_hits),
+            ("misses", self.misses),
+            ("hit_ratio", (self.hits + self.disk_hits) / lookups if lookups else None),
+            ("expired", self.expired),
+            ("evictions", self.evictions),
+            ("invalidations", self.invalidations),
+            ("entries", len(self.entries)),
+            ("bytes", self.bytes),
+        ])
+
+    def check(self, signature):
+        """.mdb の (更新時刻, サイズ) が覚えたときと違えば全部捨てる"""
+        with self.lock:
+            if signature == self.signature:
+                return
+            if self.signature is not None:
+                self.invalidations += 1
+            self.clear_entries()
+            self.signature = signature
+
+    def invalidate(self):
+        """全部捨てる．ファイルの方も"""
+        with self.lock:
+            self.invalidations += 1
+            self.clear_entries()
+            for mtime, size, path in self.result_files():
+                self.remove_file(path)
+
+    def clear_entries(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def is_expired(self, entry, now):
+        return self.ttl is not None and now - entry.created > self.ttl
+
+    def get(self, key):
+        """覚えている行のリスト．なければ None"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if not self.is_expired(entry, now):
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.rows
+                self.expired += 1
+                self.remove(key)
+            entry = self.read_file(key, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self.store(key, entry)
+            return entry.rows
+
+    def put(self, key, rows):
+        rows = [tuple(row) for row in rows]
+        data = pickle.dumps(rows, pickle.HIGHEST_PROTOCOL)
+        entry = CacheEntry(rows, len(data), time.time())
+        with self.lock:
+            self.store(key, entry)
+            self.write_file(key, entry)
+
+    def store(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+        self.remove(key)
+        self.entries[key] = entry
+        self.bytes += entry.size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest, evicted = self.entries.popitem(last=False)
+            self.bytes -= evicted.size
+            self.evictions += 1
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry.size
+
+    def iterate(self, key, fetch):
+        """ key の結果を返す．なければ fetch() の行を返しながら覚える
+            max_rows 行までは先に全部読んでしまう (途中でやめられても覚えられるように)
+        """
+        rows = self.get(key)
+        if rows is not None:
+            for row in rows:
+                yield list(row)
+            return
+
+        iterator = iter(fetch())
+        collected = []
+        for row in iterator:
+            collected.append(row)
+            if self.max_rows is not None and len(collected) > self.max_rows:
+                # 大きすぎるので覚えずにそのまま返す
+                yield from collected
+                yield from iterator
+                return
+        self.put(key, collected)
+        yield from collected
+
+    # ---- ファイル ----
+
+    def file_path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".result")
+
+    def read_file(self, key, now):
+        if not self.directory:
+            return None
+        path = self.file_path(key)
+        try:
+            with open(path, "rb") as f:
+                signature, created, stored_key, width, columns = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, zlib.error, pickle.PickleError, ValueError, TypeError, AttributeError):
+            self.remove_file(path)
+            return None
+        if stored_key != key or signature != self.signature:
+            self.remove_file(path)
+            return None
+        rows = [tuple(row) for row in zip(*columns)] if width else [()] * columns
+        entry = CacheEntry(rows, len(pickle.dumps(rows, pickle.HIGHEST_PROTOCOL)), created)
+        if self.is_expired(entry, now):
+            self.expired += 1
+            self.remove_file(path)
+            return None
+        return entry
+
+    def write_file(self, key, entry):
+        if not self.directory:
+            return
+        # 列ごとにまとめると同じ型の値が並ぶので縮みやすい
+        width = len(entry.rows[0]) if entry.rows else 0
+        columns = [list(column) for column in zip(*entry.rows)] if width else len(entry.rows)
+        data = zlib.compress(pickle.dumps((self.signature, entry.created, key, width, columns),
+                                          pickle.HIGHEST_PROTOCOL))
+        path = self.file_path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self.remove_file(path)
+            with open(path + ".tmp", "wb") as f:
+                f.write(data)
+            os.replace(path + ".tmp", path)
+            self.disk_bytes = self.disk_usage() + len(data)
+            if self.disk_bytes > self.max_disk_bytes:
+                self.prune_files()
+        except OSError as e:
+            print("cannot write query cache '%s': %s" % (path, e), file=sys.stderr)
+
+    def disk_usage(self):
+        """directory のファイルの合計．最初の一回だけ数える"""
+        if self.disk_bytes is None:
+            self.disk_bytes = sum(size for mtime, size, path in self.result_files())
+        return self.disk_bytes
+
+    def result_files(self):
+        files = []
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".result"):
+                    path = os.path.join(self.directory, name)
+                    stat = os.stat(path)
+                    files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def remove_file(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        if self.disk_bytes is not None:
+            self.disk_bytes -= size
+
+    def prune_files(self):
+        """ファイルの合計が max_disk_bytes を超えたら古いものから消す"""
+        files = self.result_files()
+        self.disk_bytes = sum(size for mtime, size, path in files)
+        for mtime, size, path in sorted(files):
+            if self.disk_bytes <= self.max_disk_bytes:
+                break
+            self.remove_file(path)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+""" 大きなテーブルを途中から再開できるようにする
+
+    テーブルごとに最後に書き終えた行の主キーと出力ファイルの位置を
+    小さな JSON ファイルに記録する．再開するときは出力をその位置まで切り詰め、
+    MsAccessDb.iterate_keyed で続きの行から読み直す
+"""
+import os
+import json
+import glob
+import decimal
+import hashlib
+import datetime
+
+
+def encode_value(value):
+    """主キーの値を JSON に書ける形にする (通貨型や十進型の列は Decimal のことがある)"""
+    if isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    elif isinstance(value, decimal.Decimal):
+        return {"decimal": str(value)}
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, dict) and "datetime" in value:
+        return datetime.datetime.fromisoformat(value["datetime"])
+    elif isinstance(value, dict) and "decimal" in value:
+        return decimal.Decimal(value["decimal"])
+    return value
+
+
+class Checkpoint:
+    def __init__(self, path, table_name):
+        self.path = path
+        self.table_name = table_name
+
+    def load(self):
+        """ {"last_key", "rows", "offset", "done"}．まだなければ None
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        if state["table"] != self.table_name:
+            raise Exception("checkpoint '%s' is for another table: %s" % (self.path, state["table"]))
+        state["last_key"] = decode_value(state["last_key"])
+        return state
+
+    def save(self, last_key, rows, offset=None, done=False):
+        """一時ファイルに書いてから置き換えるので、途中で止まっても壊れない"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"table": self.table_name, "last_key": encode_value(last_key),
+                       "rows": rows, "offset": offset, "done": done}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CheckpointStore:
+    """ディレクトリの中にテーブルごとの Checkpoint を置く"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def checkpoint(self, table_name):
+        name = hashlib.sha1(table_name.encode("utf-8")).hexdigest()
+        return Checkpoint(os.path.join(self.directory, "%s.checkpoint" % name), table_name)
+
+    def paths(self):
+        return glob.glob(os.path.join(self.directory, "*.checkpoint"))
+
+    def exists(self):
+        return bool(self.paths())
+
+    def clear(self):
+        for path in self.paths():
+            os.remove(path)
+
+
+def single_key_column(db, table_name):
+    key_columns = db.get_primary_key(table_name)
+    if len(key_columns) != 1:
+        raise Exception("checkpoint requires a single column primary key: %s" % table_name)
+    return key_columns[0]
+
+
+def write_lines_with_checkpoint(db, table_name, path, checkpoint, encode_row, commit_every=10000,
+                                encoding="utf-8"):
+    """ table_name の行を encode_row(row) した一行ずつ path に書く．
+        commit_every 行ごとに fsync してから checkpoint を進める．
+        前回の checkpoint があれば出力をその位置まで切り詰めて続きから書く．
+        書いた行数を返す
+    """
+    key_column = single_key_column(db, table_name)
+    key_index = db.get_field_names(table_name).index(key_column)
+
+    state = checkpoint.load()
+    if state and state["done"]:
+        return state["rows"]
+    if state:
+        if not os.path.exists(path) or os.path.getsize(path) < state["offset"]:
+            raise Exception("cannot resume from checkpoint '%s': output '%s' is missing or shorter than recorded. "
+                            "remove the checkpoint to start over" % (checkpoint.path, path))
+        after, rows, mode = state["last_key"], state["rows"], "r+b"
+    else:
+        after, rows, mode = None, 0, "wb"
+
+    with open(path, mode) as f:
+        if state:
+            f.truncate(state["offset"])
+            f.seek(state["offset"])
+        last_key = after
+        pending = 0
+        for row in db.iterate_keyed(table_name, key_column, after):
+            f.write((encode_row(row) + "\n").encode(encoding))
+            last_key = row[key_index]
+            rows += 1
+            pending += 1
+            if pending >= commit_every:
+                f.flush()
+                os.fsync(f.fileno())
+                checkpoint.save(last_key, rows, f.tell())
+                pending = 0
+        f.flush()
+        os.fsync(f.fileno())
+        checkpoint.save(last_key, rows, f.tell(), done=True)
+    return rows
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+""" 列ごとのバッチ
+
+    行ごとにリストを作る代わりに、batch_size 行を列ごとにまとめて返す．
+    数値、Yes/No、日付の列は array.array (numpy=True なら numpy の配列) にし、
+    文字列などそれ以外の列だけ Python のリストのままにする．
+    通貨の Decimal から float への変換や日付の変換は列ごとにまとめて行う．
+
+    日付は 1970-01-01 からのマイクロ秒 (array.array では 'q'、
+    numpy では datetime64[us]) で持つ．
+    Null を含む列はそのバッチだけ Python のリストのままにする
+"""
+import array
+import datetime
+from . import valueConverters, identity, fetch_batches, MsAccessDb
+
+EPOCH = datetime.datetime(1970, 1, 1)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+# GetRows の値をそのまま受け取る
+rawConverters = dict((data_type, identity) for data_type in valueConverters)
+
+# DATA_TYPE ごとの array.array の型コード
+arrayTypecodes = {
+    2: "h",
+    3: "i",
+    4: "f",
+    5: "d",
+    6: "d",
+    7: "q",
+    11: "b",
+    14: "d",
+    16: "b",
+    17: "B",
+    18: "H",
+    19: "I",
+    20: "q",
+    21: "Q",
+    131: "d",
+    133: "q",
+    135: "q",
+    139: "d",
+}
+
+# DATA_TYPE ごとの numpy の dtype
+numpyDtypes = {
+    2: "int16",
+    3: "int32",
+    4: "float32",
+    5: "float64",
+    6: "float64",
+    7: "datetime64[us]",
+    11: "bool",
+    14: "float64",
+    16: "int8",
+    17: "uint8",
+    18: "uint16",
+    19: "uint32",
+    20: "int64",
+    21: "uint64",
+    131: "float64",
+    133: "datetime64[us]",
+    135: "datetime64[us]",
+    139: "float64",
+}
+
+dateTypes = set([7, 133, 135])
+decimalTypes = set([6, 14, 131, 139])
+
+
+def plain_datetime(value):
+    return MsAccessDb.convert_pytime_to_datetime(value)
+
+
+def datetime_to_microseconds(value):
+    return (plain_datetime(value) - EPOCH) // ONE_MICROSECOND
+
+
+def microseconds_to_datetime(value):
+    return EPOCH + datetime.timedelta(microseconds=value)
+
+
+def make_array(data_type, column):
+    typecode = arrayTypecodes[data_type]
+    if data_type in dateTypes:
+        return array.array(typecode, [datetime_to_microseconds(value) for value in column])
+    elif data_type in decimalTypes:
+        return array.array(typecode, [float(value) for value in column])
+    return array.array(typecode, column)
+
+
+def make_numpy_array(data_type, column):
+    import numpy
+
+    dtype = numpyDtypes[data_type]
+    if data_type in dateTypes:
+        return numpy.array([plain_datetime(value) for value in column], dtype=dtype)
+    return numpy.array(column, dtype=dtype)
+
+
+def make_object_column(data_type, column):
+    """型つきの配列にできない列．値は iterate_query と同じように変換する"""
+    convert = valueConverters.get(data_type, MsAccessDb.regulate_value)
+    if convert is identity:
+        return list(column)
+    return [convert(value) for value in column]
+
+
+class ColumnBatch:
+    def __init__(self, names, types, columns):
+        self.names = names
+        self.types = types
+        self.columns = columns
+
+    @classmethod
+    def from_block(cls, names, types, block, numpy=False):
+        """GetRows の [列][行] の値からバッチを作る"""
+        typed_columns = numpyDtypes if numpy else arrayTypecodes
+        make = make_numpy_array if numpy else make_array
+        columns = []
+        for data_type, column in zip(types, block):
+            if data_type in typed_columns and None not in column:
+                columns.append(make(data_type, column))
+            else:
+                columns.append(make_object_column(data_type, column))
+        return cls(names, types, columns)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def column(self, name):
+        return self.columns[self.names.index(name)]
+
+    def is_typed(self, index):
+        return not isinstance(self.columns[index], list)
+
+    def column_values(self, index):
+        """列を Python の値のリストにする (日付は datetime に戻す)"""
+        column = self.columns[index]
+        if isinstance(column, list):
+            return column
+        if isinstance(column, array.array):
+            if self.types[index] in dateTypes:
+                return [microseconds_to_datetime(value) for value in column]
+            if self.types[index] == 11:
+                return [bool(value) for value in column]
+            return column.tolist()
+        if self.types[index] in dateTypes:
+            return column.astype("datetime64[us]").astype(object).tolist()
+        return column.tolist()
+
+    def to_rows(self):
+        return [list(row) for row in zip(*[self.column_values(i) for i in range(len(self.columns))])]
+
+    def to_pydict(self):
+        return dict((name, self.column_values(i)) for i, name in enumerate(self.names))
+
+
+def iterate_column_batches(db, query, batch_size=5000, numpy=False):
+    """query (テーブル名など) を batch_size 行ずつの ColumnBatch で返す"""
+    qry = db.execute_query("Select * From %s;" % query)
+    names = [field.Name for field in qry.Fields]
+    types = [field.Type for field in qry.Fields]
+    for block in fetch_batches(qry, batch_size, True, query, rawConverters, db.metrics):
+        yield ColumnBatch.from_block(names, types, block, numpy)
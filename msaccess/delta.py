@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+""" 前回からの差分だけを取り出す
+
+    テーブルごとに {主キー: 行のハッシュ} を状態ファイルに保存しておき、
+    次の実行ではハッシュを比べて insert / update / delete だけを返す．
+    主キーのないテーブルは行全体をキーにする (変更は delete と insert になる)
+"""
+import os
+import json
+import base64
+import decimal
+import hashlib
+import datetime
+from collections import namedtuple
+
+INSERT = "insert"
+UPDATE = "update"
+DELETE = "delete"
+
+Change = namedtuple("Change", "operation key row")
+
+
+def tag_value(value):
+    """JSON にすると型が分からなくなる値に型の印を付ける"""
+    if isinstance(value, datetime.datetime):
+        return {"$date": value.isoformat()}
+    elif isinstance(value, decimal.Decimal):
+        return {"$decimal": str(value)}
+    elif isinstance(value, (bytes, bytearray)):
+        return {"$binary": base64.b64encode(value).decode("ascii")}
+    raise TypeError("cannot encode %r in a key" % (value,))
+
+
+def untag_value(value):
+    if isinstance(value, dict) and len(value) == 1:
+        if "$date" in value:
+            return datetime.datetime.fromisoformat(value["$date"])
+        elif "$decimal" in value:
+            return decimal.Decimal(value["$decimal"])
+        elif "$binary" in value:
+            return base64.b64decode(value["$binary"])
+    return value
+
+
+def encode_key(values):
+    """キーの値のリストを文字列にする．decode_key で同じ型の値に戻せる"""
+    return json.dumps(values, default=tag_value, ensure_ascii=False)
+
+
+def decode_key(key):
+    return [untag_value(value) for value in json.loads(key)]
+
+
+def row_hash(row):
+    return hashlib.sha1(json.dumps(row, default=str, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class DeltaState:
+    """ 状態ファイルを置くディレクトリ．テーブルごとに一つの JSON ファイルにする
+        scope は読む .mdb と差分を渡す先 (出力ファイルやデータベース) を表す文字列のリスト．
+        scope が違えば同じディレクトリでも別の状態になる
+    """
+
+    def __init__(self, directory, scope=()):
+        self.directory = directory
+        self.scope = list(scope)
+
+    def path(self, table_name):
+        name = json.dumps(self.scope + [table_name], ensure_ascii=False)
+        return os.path.join(self.directory, "%s.json" % hashlib.sha1(name.encode("utf-8")).hexdigest())
+
+    def load(self, table_name):
+        """前回の {キー: ハッシュ}．初回なら None"""
+        try:
+            with open(self.path(table_name), encoding="utf-8") as f:
+                return json.load(f)["rows"]
+        except FileNotFoundError:
+            return None
+
+    def save(self, table_name, key_columns, rows):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(table_name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"scope": self.scope, "table": table_name, "key_columns": key_columns, "rows": rows}, f,
+                      ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+
+class TableDelta:
+    """ 一つのテーブルの行を前回の状態と比べる
+
+        delta = TableDelta(field_names, key_columns, state.load(table_name))
+        for change in delta.changes(db.iterate_query(table_name)):
+            ...
+        state.save(table_name, delta.key_columns, delta.rows)
+    """
+
+    def __init__(self, field_names, key_columns, previous=None):
+        self.field_names = list(field_names)
+        self.key_columns = list(key_columns) or list(field_names)
+        self.key_indexes = [self.field_names.index(column) for column in self.key_columns]
+        self.first_run = previous is None
+        self.previous = previous or {}
+        self.rows = {}
+
+    def key_values(self, row):
+        return [row[i] for i in self.key_indexes]
+
+    def changes(self, rows):
+        """変わった行だけを Change で返す．最後に消えた行を DELETE で返す"""
+        previous = self.previous
+        for row in rows:
+            key_values = self.key_values(row)
+            key = encode_key(key_values)
+            digest = row_hash(row)
+            self.rows[key] = digest
+            old_digest = previous.get(key)
+            if old_digest is None:
+                yield Change(INSERT, key_values, row)
+            elif old_digest != digest:
+                yield Change(UPDATE, key_values, row)
+
+        for key in previous:
+            if key not in self.rows:
+                yield Change(DELETE, decode_key(key), None)
+
+
+def iterate_table_changes(db, table_name, state):
+    """ (TableDelta, changes) を返す．changes を最後まで回したあとで
+        state.save(table_name, delta.key_columns, delta.rows) すること
+    """
+    delta = TableDelta(db.get_field_names(table_name), db.get_primary_key(table_name), state.load(table_name))
+    return delta, delta.changes(db.iterate_query(table_name))
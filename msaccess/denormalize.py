@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+""" 関連するテーブルを埋め込んだドキュメントを作る (ハッシュ結合)
+
+    Jet に inner join を何段も実行させると遅く、結果も平らな行にしかならない．
+    ここでは子のテーブルを一回ずつ読んで結合キーごとの索引 (HashIndex) を作り、
+    最後に親のテーブルを一回読みながら、子のドキュメントの配列を埋め込む．
+    孫があれば先に孫の索引を作り、子の索引には孫を埋め込んだドキュメントを入れる．
+
+        relation = relations_from_config({
+            "table": "customer",
+            "embed": [{"table": "orders", "as": "orders", "join": {"id": "customer_id"}}]})
+        denormalizer = Denormalizer(db, relation)
+        for documents in denormalizer.iterate_batches():
+            ...
+
+    関係は設定 (relations_from_config) か外部キー (relations_from_foreign_keys) から作る．
+    索引が max_rows_in_memory 行を超えたら、その索引は一時ファイルの SQLite に移す
+"""
+import os
+import pickle
+import decimal
+import sqlite3
+import tempfile
+
+DEFAULT_MAX_ROWS_IN_MEMORY = 1000000
+SPILL_BATCH_SIZE = 10000
+
+
+class Relation:
+    """ table を親の parent_columns = 自分の child_columns で結合し、親の name の配列として埋め込む
+        一番上のテーブルは parent_columns と child_columns が空
+    """
+
+    def __init__(self, table, parent_columns=(), child_columns=(), name=None, children=None):
+        if len(parent_columns) != len(child_columns):
+            raise Exception("join columns of %s do not match: %s, %s" % (table, parent_columns, child_columns))
+        self.table = table
+        self.parent_columns = list(parent_columns)
+        self.child_columns = list(child_columns)
+        self.name = name
+        self.children = list(children or [])
+
+    def walk(self):
+        """自分と子孫すべて (親が先)"""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_config(self):
+        """relations_from_config で読める形"""
+        config = {"table": self.table}
+        if self.parent_columns:
+            config["join"] = dict(zip(self.parent_columns, self.child_columns))
+        if self.name:
+            config["as"] = self.name
+        if self.children:
+            config["embed"] = [child.to_config() for child in self.children]
+        return config
+
+
+def relations_from_config(config, table=None):
+    """ 次のような辞書 (YAML で書いたもの) から Relation を作る．join は {親の列: 子の列}
+
+            table: customer
+            embed:
+              - table: orders
+                as: orders
+                join: {id: customer_id}
+                embed:
+                  - table: order_items
+                    join: {order_id: order_id}
+    """
+    if table is not None and config.get("table", table) != table:
+        raise Exception("relations are for %s, not %s" % (config["table"], table))
+    root = Relation(config.get("table", table), name=config.get("as"))
+    root.children = [relation_from_config(child) for child in config.get("embed") or []]
+    return root
+
+
+def relation_from_config(config):
+    join = config.get("join")
+    if not join:
+        raise Exception("no join columns for %s" % config.get("table"))
+    return Relation(config["table"], list(join.keys()), list(join.values()), config.get("as"),
+                    [relation_from_config(child) for child in config.get("embed") or []])
+
+
+def relations_from_foreign_keys(foreign_keys, table, depth=1):
+    """ 外部キー (MsAccessDb.get_foreign_keys) で table を参照しているテーブルを埋め込む Relation
+        depth 段まで子の子もたどる．たどってきたテーブルに戻る外部キーは使わない
+        同じテーブルから同じ子のテーブルへの外部キーが複数あれば (請求先と送り先など)、
+        子の Relation の name を "子のテーブル_子の列" にする
+    """
+    return Relation(table, children=child_relations(foreign_keys, table, depth, [table]))
+
+
+def child_relations(foreign_keys, table, depth, ancestors):
+    if depth <= 0:
+        return []
+    foreign_keys_from_table = [foreign_key for foreign_key in foreign_keys
+                               if foreign_key["parent_table"] == table and foreign_key["child_table"] not in ancestors]
+    child_tables = [foreign_key["child_table"] for foreign_key in foreign_keys_from_table]
+    children = []
+    for foreign_key in foreign_keys_from_table:
+        child_table = foreign_key["child_table"]
+        name = None
+        if child_tables.count(child_table) > 1:
+            name = "_".join([child_table] + foreign_key["child_columns"])
+        children.append(Relation(
+            child_table, foreign_key["parent_columns"], foreign_key["child_columns"], name,
+            child_relations(foreign_keys, child_table, depth - 1, ancestors + [child_table])))
+    return children
+
+
+def normalize_key(values):
+    """ 結合キー．Null を含めば None
+        == で等しい数は同じ値にする (一時ファイルの索引は pickle した値で比べるため)．
+        整数になる float, Decimal と bool は int、float で正確に表せる Decimal は float
+    """
+    key = []
+    for value in values:
+        if value is None:
+            return None
+        key.append(normalize_number(value))
+    return tuple(key)
+
+
+def normalize_number(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, decimal.Decimal) and value.is_finite():
+        if value == value.to_integral_value():
+            return int(value)
+        if float(value) == value:
+            return float(value)
+    return value
+
+
+class HashIndex:
+    """ 結合キーごとのドキュメントのリスト．入れた順に返す
+        max_rows 行を超えたら、それまでの分もあとの分も directory の一時ファイルの SQLite に書く
+    """
+
+    def __init__(self, max_rows=DEFAULT_MAX_ROWS_IN_MEMORY, directory=None):
+        self.max_rows = max_rows
+        self.directory = directory
+        self.entries = {}
+        self.rows = 0
+        self.path = None
+        self.connection = None
+        self.pending = []
+
+    @property
+    def spilled(self):
+        return self.connection is not None
+
+    def add(self, key, document):
+        self.rows += 1
+        if self.connection is not None:
+            self.pending.append((pickle.dumps(key), pickle.dumps(document, pickle.HIGHEST_PROTOCOL)))
+            if len(self.pending) >= SPILL_BATCH_SIZE:
+                self.flush()
+            return
+        self.entries.setdefault(key, []).append(document)
+        if self.max_rows is not None and self.rows > self.max_rows:
+            self.spill()
+
+    def spill(self):
+        fd, self.path = tempfile.mkstemp(suffix=".index", dir=self.directory)
+        os.close(fd)
+        # 結合は別のスレッドで行うことがある
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("Create Table entries (key Blob, document Blob)")
+        for key, documents in self.entries.items():
+            for document in documents:
+                self.pending.append((pickle.dumps(key), pickle.dumps(document, pickle.HIGHEST_PROTOCOL)))
+        self.entries = {}
+        self.flush()
+
+    def flush(self):
+        if self.pending:
+            with self.connection:
+                self.connection.executemany("Insert Into entries Values (?, ?)", self.pending)
+            self.pending = []
+
+    def finish(self):
+        """入れ終わったら呼ぶ．書き出したものに索引を付ける"""
+        if self.connection is not None:
+            self.flush()
+            self.connection.execute("Create Index entries_key On entries (key)")
+
+    def get(self, key):
+        if self.connection is None:
+            return list(self.entries.get(key, ()))
+        rows = self.connection.execute(
+            "Select document From entries Where key = ? Order By rowid", (pickle.dumps(key),)).fetchall()
+        return [pickle.loads(document) for document, in rows]
+
+    def close(self):
+        self.entries = {}
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def column_indexes(field_names, columns, table):
+    indexes = []
+    for column in columns:
+        if column not in field_names:
+            raise Exception("no column %s in %s" % (column, table))
+        indexes.append(field_names.index(column))
+    return indexes
+
+
+class Denormalizer:
+    def __init__(self, db, relation, make_document=None, batch_size=5000,
+                 max_rows_in_memory=DEFAULT_MAX_ROWS_IN_MEMORY, spill_directory=None):
+        """ relation           : 一番上の Relation
+            make_document      : (テーブル名, 行) からドキュメントを作る関数．既定では {列名: 値}
+            max_rows_in_memory : 一つの索引をメモリに置く行数の上限
+        """
+        self.db = db
+        self.relation = relation
+        self.make_document = make_document or self.plain_document
+        self.batch_size = batch_size
+        self.max_rows_in_memory = max_rows_in_memory
+        self.spill_directory = spill_directory
+        self.field_names = dict((relation.table, db.get_field_names(relation.table))
+                                for relation in relation.walk())
+        # {id(Relation): HashIndex}
+        self.indexes = {}
+        # [(埋め込む名前, 親の結合キーの列の位置, 子の Relation)] をテーブルごとに
+        self.embeddings = dict((id(relation), [
+            (child.name or child.table,
+             column_indexes(self.field_names[relation.table], child.parent_columns, relation.table),
+             child)
+            for child in relation.children]) for relation in relation.walk())
+        for parent in relation.walk():
+            names = [name for name, indexes, child in self.embeddings[id(parent)]]
+            for name in names:
+                if names.count(name) > 1:
+                    raise Exception("%s embeds two relations as %s" % (parent.table, name))
+
+    def plain_document(self, table, row):
+        return dict(zip(self.field_names[table], row))
+
+    def document(self, relation, row):
+        """子の配列を埋め込んだドキュメント"""
+        document = self.make_document(relation.table, row)
+        for name, indexes, child in self.embeddings[id(relation)]:
+            key = normalize_key([row[i] for i in indexes])
+            document[name] = self.indexes[id(child)].get(key) if key is not None else []
+        return document
+
+    def build_index(self, relation):
+        """relation のテーブルを一回読んで索引を作る．子孫の索引は先に作り、使い終わったら閉じる"""
+        for child in relation.children:
+            self.build_index(child)
+        metrics = self.db.metrics
+        key_indexes = column_indexes(self.field_names[relation.table], relation.child_columns, relation.table)
+        index = HashIndex(self.max_rows_in_memory, self.spill_directory)
+        try:
+            with metrics.table(relation.table):
+                for rows in self.db.iterate_batches(relation.table, self.batch_size):
+                    with metrics.timer("index", rows=len(rows)):
+                        for row in rows:
+                            key = normalize_key([row[i] for i in key_indexes])
+                            if key is not None:
+                                index.add(key, self.document(relation, row))
+            index.finish()
+        except BaseException:
+            index.close()
+            raise
+        finally:
+            for child in relation.children:
+                self.indexes.pop(id(child)).close()
+        self.indexes[id(relation)] = index
+
+    def build_indexes(self):
+        """一番上のテーブルの子の索引を作る"""
+        for child in self.relation.children:
+            self.build_index(child)
+
+    def embed_rows(self, rows):
+        """一番上のテーブルの行のリストをドキュメントのリストにする．別のスレッドで呼んでもよい"""
+        with self.db.metrics.timer("join", rows=len(rows)):
+            return [self.document(self.relation, row) for row in rows]
+
+    def iterate_rows(self):
+        """一番上のテーブルを batch_size 行ずつ読む．先に build_indexes を呼んでおく"""
+        return self.db.iterate_batches(self.relation.table, self.batch_size)
+
+    def iterate_batches(self):
+        """子の索引を作ってから、埋め込んだドキュメントを batch_size 個ずつ返す"""
+        self.build_indexes()
+        try:
+            for rows in self.iterate_rows():
+                yield self.embed_rows(rows)
+        finally:
+            self.close()
+
+    def close(self):
+        for index in self.indexes.values():
+            index.close()
+        self.indexes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+""" メモ型や OLE オブジェクト型などの長い値を少しずつ読む
+
+    Field.Value で読むと値全体が一度に Python に来るので、画像を埋め込んだ
+    テーブルではメモリが足りなくなる．長い値の列は Field.GetChunk で
+    chunk_size ずつ読み、行には policy が返したもの (ハッシュやファイルの場所など)
+    だけを入れる．
+
+        policy = HashPolicy()
+        for row in db.iterate_large_fields("picture", policy):
+            ...
+
+    policy は次のものから選ぶ (make_policy で名前からも作れる)
+        inline : 全部読んで値にする (今までと同じ)
+        skip   : 読まずに None にする
+        hash   : 読みながらハッシュを計算し {"size", "sha1"} にする
+        file   : directory に内容のハッシュを名前にしたファイルとして書き {"size", "sha1", "path"} にする
+        chunks : GridFS と同じ形の chunks / files コレクションに書き {"files_id", "length", ...} にする
+"""
+import os
+import uuid
+import hashlib
+import datetime
+import tempfile
+
+adFldLong = 0x80
+longTypes = (201, 203, 205)
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def is_long_field(field):
+    """GetChunk で読むべき列か (型が長い値の型か、Attributes に adFldLong がある)"""
+    return field.Type in longTypes or bool(getattr(field, "Attributes", 0) & adFldLong)
+
+
+def chunk_bytes(chunk):
+    """GetChunk の値をバイト列にする．文字列は UTF-8 にする"""
+    if isinstance(chunk, str):
+        return chunk.encode("utf-8")
+    return bytes(chunk)
+
+
+class LargeValue:
+    """今の行の一つの長い値．行を進めたら使えない"""
+
+    def __init__(self, field, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.field = field
+        self.chunk_size = chunk_size
+
+    @property
+    def name(self):
+        return self.field.Name
+
+    @property
+    def size(self):
+        return self.field.ActualSize
+
+    def is_text(self):
+        return self.field.Type in (201, 203)
+
+    def chunks(self):
+        """値を chunk_size ずつ返す．一回しか読めない"""
+        while True:
+            chunk = self.field.GetChunk(self.chunk_size)
+            if chunk is None or len(chunk) == 0:
+                return
+            yield chunk
+
+    def read(self):
+        """全部読む．Null なら None"""
+        chunks = list(self.chunks())
+        if not chunks:
+            return self.field.Value
+        if isinstance(chunks[0], str):
+            return "".join(chunks)
+        return b"".join(chunk_bytes(chunk) for chunk in chunks)
+
+
+class InlinePolicy:
+    def __call__(self, value):
+        return value.read()
+
+
+class SkipPolicy:
+    def __call__(self, value):
+        return None
+
+
+class HashPolicy:
+    def __init__(self, algorithm="sha1"):
+        self.algorithm = algorithm
+
+    def __call__(self, value):
+        digest = hashlib.new(self.algorithm)
+        size = 0
+        for chunk in value.chunks():
+            data = chunk_bytes(chunk)
+            digest.update(data)
+            size += len(data)
+        if not size and value.field.Value is None:
+            return None
+        return {"size": size, self.algorithm: digest.hexdigest()}
+
+
+class ExternalFilePolicy:
+    """ directory に書く．同じ内容は一つのファイルになる
+        path は directory からの相対パス (ハッシュの先頭2文字のディレクトリの下)
+    """
+
+    def __init__(self, directory, suffix=""):
+        self.directory = directory
+        self.suffix = suffix
+
+    def __call__(self, value):
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha1()
+        size = 0
+        fd, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in value.chunks():
+                    data = chunk_bytes(chunk)
+                    digest.update(data)
+                    f.write(data)
+                    size += len(data)
+            if not size and value.field.Value is None:
+                return None
+            sha1 = digest.hexdigest()
+            path = os.path.join(sha1[:2], sha1 + self.suffix)
+            os.makedirs(os.path.join(self.directory, sha1[:2]), exist_ok=True)
+            os.replace(temporary_path, os.path.join(self.directory, path))
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        return {"size": size, "sha1": sha1, "path": path.replace(os.sep, "/")}
+
+
+def new_file_id():
+    try:
+        from bson import ObjectId
+    except ImportError:
+        return uuid.uuid4().hex
+    return ObjectId()
+
+
+class ChunkCollectionPolicy:
+    """ GridFS と同じ形で書く．chunks には {"files_id", "n", "data"} を一つずつ、
+        files があれば {"_id", "length", "chunkSize", "uploadDate", "filename", "sha1"} を入れる
+    """
+
+    def __init__(self, chunks, files=None, chunk_size=255 * 1024):
+        self.chunks = chunks
+        self.files = files
+        self.chunk_size = chunk_size
+
+    def __call__(self, value):
+        files_id = new_file_id()
+        digest = hashlib.sha1()
+        n = 0
+        size = 0
+        pending = bytearray()
+        for chunk in value.chunks():
+            data = chunk_bytes(chunk)
+            digest.update(data)
+            size += len(data)
+            pending += data
+            while len(pending) >= self.chunk_size:
+                self.chunks.insert_one({"files_id": files_id, "n": n, "data": bytes(pending[:self.chunk_size])})
+                del pending[:self.chunk_size]
+                n += 1
+        if not size and value.field.Value is None:
+            return None
+        if pending:
+            self.chunks.insert_one({"files_id": files_id, "n": n, "data": bytes(pending)})
+        if self.files is not None:
+            self.files.insert_one({"_id": files_id, "length": size, "chunkSize": self.chunk_size,
+                                   "uploadDate": datetime.datetime.now(datetime.timezone.utc),
+                                   "filename": value.name, "sha1": digest.hexdigest()})
+        return {"files_id": files_id, "length": size, "sha1": digest.hexdigest()}
+
+
+policies = {
+    "inline": InlinePolicy,
+    "skip": SkipPolicy,
+    "hash": HashPolicy,
+    "file": ExternalFilePolicy,
+    "chunks": ChunkCollectionPolicy,
+}
+
+
+def make_policy(name, *args, **kwargs):
+    if name not in policies:
+        raise Exception("unknown large field policy: %s" % name)
+    return policies[name](*args, **kwargs)
+
+
+def iterate_large_fields(db, statement, policy, columns=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ statement の結果を一行ずつ返す．長い値の列 (columns で列名を指定もできる) は
+        GetChunk で読んで policy(LargeValue) の値にし、それ以外は iterate_query と同じように変換する
+    """
+    from . import make_converters
+
+    qry = db.execute_query(statement)
+    fields = [qry.Fields.Item(i) for i in range(qry.Fields.Count)]
+    if columns is None:
+        large = [is_long_field(field) for field in fields]
+    else:
+        large = [field.Name in columns for field in fields]
+    converters = make_converters([field.Type for field in fields])
+    handlers = [(lambda field: policy(LargeValue(field, chunk_size))) if is_large else
+                (lambda field, convert=convert: convert(field.Value))
+                for is_large, convert in zip(large, converters)]
+
+    rows = 0
+    try:
+        while not qry.EOF:
+            yield [handle(field) for handle, field in zip(handlers, fields)]
+            qry.MoveNext()
+            rows += 1
+    finally:
+        db.metrics.record("fetch", rows)
+        db.metrics.count_com_call("MoveNext", rows)
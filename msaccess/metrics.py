@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+""" 処理の段階ごとの計測
+
+    段階 (execute, fetch, convert, translate, serialize, sink) とテーブルごとに
+    行数、バイト数、かかった時間を数え、COM の呼び出し回数も数える．
+
+        metrics = Metrics()
+        db = MsAccessDb("data.mdb", metrics=metrics)
+        with metrics.table("customer", total_rows=db.count_rows("customer")):
+            for rows in db.iterate_batches("customer"):
+                with metrics.timer("serialize", rows=len(rows)) as timer:
+                    data = encode(rows)
+                    timer.bytes = len(data)
+
+    結果は summary() で辞書に、to_prometheus() で Prometheus のテキスト形式にできる．
+    progress=True ならテーブルごとの進み具合と残り時間の見込みを標準エラー出力に書く．
+    何もしない NULL_METRICS が既定値なので、計測しなければ余計な処理はほとんどない
+"""
+import sys
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+class StageMetrics:
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.calls = 0
+
+    def to_dict(self):
+        return {"rows": self.rows, "bytes": self.bytes, "seconds": self.seconds, "calls": self.calls,
+                "rows_per_second": self.rows / self.seconds if self.seconds else None}
+
+
+class Timer:
+    """with metrics.timer(...) as timer: の timer．rows と bytes はあとから足してもよい"""
+
+    def __init__(self, metrics, stage, table, rows, bytes):
+        self.metrics = metrics
+        self.stage = stage
+        self.table = table
+        self.rows = rows
+        self.bytes = bytes
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.record(self.stage, self.rows, self.bytes, time.perf_counter() - self.started, self.table)
+
+
+class Progress:
+    """一つのテーブルの進み具合．interval 秒ごとに一行書く"""
+
+    def __init__(self, table, total_rows=None, stream=None, interval=1.0):
+        self.table = table
+        self.total_rows = total_rows
+        self.stream = stream
+        self.interval = interval
+        self.rows = 0
+        self.started = time.time()
+        self.printed = self.started
+
+    def eta(self, now=None):
+        """残りの秒数の見込み．全体の行数が分からなければ None"""
+        elapsed = (now or time.time()) - self.started
+        if not self.total_rows or not self.rows or not elapsed:
+            return None
+        return max(self.total_rows - self.rows, 0) / (self.rows / elapsed)
+
+    def message(self, now=None):
+        now = now or time.time()
+        elapsed = max(now - self.started, 1e-9)
+        if self.total_rows:
+            text = "{0}: {1}/{2} rows ({3:.0%})".format(
+                self.table, self.rows, self.total_rows, self.rows / self.total_rows)
+        else:
+            text = "{0}: {1} rows".format(self.table, self.rows)
+        text += ", {0:.0f} rows/sec".format(self.rows / elapsed)
+        eta = self.eta(now)
+        if eta is not None:
+            text += ", ETA {0}".format(format_seconds(eta))
+        return text
+
+    def update(self, rows):
+        self.rows += rows
+        now = time.time()
+        if self.stream is not None and now - self.printed >= self.interval:
+            self.printed = now
+            print(self.message(now), file=self.stream)
+
+    def finish(self):
+        if self.stream is not None:
+            print(self.message() + ", done", file=self.stream)
+
+
+def format_seconds(seconds):
+    seconds = int(round(seconds))
+    return "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class TableScope:
+    def __init__(self, metrics, table, total_rows):
+        self.metrics = metrics
+        self.table = table
+        self.total_rows = total_rows
+
+    def __enter__(self):
+        self.previous = self.metrics.current_table
+        self.metrics.current_table = self.table
+        self.progress = self.metrics.start_progress(self.table, self.total_rows)
+        return self.progress
+
+    def __exit__(self, *args):
+        self.metrics.current_table = self.previous
+        if self.progress is not None:
+            self.metrics.progress.pop(self.table, None)
+            if args[0] is None:
+                self.progress.finish()
+
+
+class Metrics:
+    """ 段階とテーブルごとの計測値
+        progress_stage の行数で進み具合を数える (既定では fetch)
+    """
+    enabled = True
+
+    def __init__(self, progress=False, progress_stream=None, progress_interval=1.0, progress_stage="fetch"):
+        self.stages = OrderedDict()
+        self.com_calls = OrderedDict()
+        self.listeners = []
+        self.current_table = None
+        self.show_progress = progress
+        self.progress_stream = progress_stream
+        self.progress_interval = progress_interval
+        self.progress_stage = progress_stage
+        self.progress = {}
+        # {テーブル: Pipeline.stats()}
+        self.pipelines = OrderedDict()
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """record のたびに listener(stage, table, rows, bytes, seconds) を呼ぶ"""
+        self.listeners.append(listener)
+
+    def record(self, stage, rows=0, bytes=0, seconds=0.0, table=None):
+        if table is None:
+            table = self.current_table
+        with self.lock:
+            metrics = self.stages.get((stage, table))
+            if metrics is None:
+                metrics = self.stages[(stage, table)] = StageMetrics()
+            metrics.rows += rows
+            metrics.bytes += bytes
+            metrics.seconds += seconds
+            metrics.calls += 1
+            progress = self.progress.get(table) if stage == self.progress_stage else None
+            if progress is not None:
+                progress.update(rows)
+        for listener in self.listeners:
+            listener(stage, table, rows, bytes, seconds)
+
+    def count_com_call(self, name, calls=1):
+        with self.lock:
+            self.com_calls[name] = self.com_calls.get(name, 0) + calls
+
+    def record_pipeline(self, stats, table=None):
+        """msaccess.pipeline.Pipeline の stats() を残す (段階ごとの稼働率とキューの深さ)"""
+        self.pipelines[table if table is not None else self.current_table or ""] = stats
+
+    def timer(self, stage, rows=0, bytes=0, table=None):
+        return Timer(self, stage, table, rows, bytes)
+
+    def table(self, table, total_rows=None):
+        """with の中の record はテーブルを省略すると table のものになる．Progress を返す"""
+        return TableScope(self, table, total_rows)
+
+    def start_progress(self, table, total_rows=None):
+        if not self.show_progress:
+            return None
+        stream = self.progress_stream or sys.stderr
+        progress = self.progress[table] = Progress(table, total_rows, stream, self.progress_interval)
+        return progress
+
+    def stage_totals(self):
+        """{stage: StageMetrics} テーブルをまとめたもの"""
+        totals = OrderedDict()
+        for (stage, table), metrics in self.stages.items():
+            total = totals.setdefault(stage, StageMetrics())
+            total.rows += metrics.rows
+            total.bytes += metrics.bytes
+            total.seconds += metrics.seconds
+            total.calls += metrics.calls
+        return totals
+
+    def summary(self):
+        tables = OrderedDict()
+        for (stage, table), metrics in self.stages.items():
+            tables.setdefault(table or "", OrderedDict())[stage] = metrics.to_dict()
+        return {
+            "elapsed_seconds": time.time() - self.started,
+            "stages": OrderedDict((stage, metrics.to_dict()) for stage, metrics in self.stage_totals().items()),
+            "tables": tables,
+            "com_calls": dict(self.com_calls),
+            "pipelines": self.pipelines,
+        }
+
+    def to_json(self):
+        return json.dumps(self.summary(), indent=2, ensure_ascii=False)
+
+    def to_prometheus(self, prefix="msaccess"):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append("# HELP %s_%s %s" % (prefix, name, help_text))
+            lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+            for labels, value in samples:
+                label_text = ",".join('%s="%s"' % (key, escape_label(value)) for key, value in labels)
+                lines.append("%s_%s{%s} %s" % (prefix, name, label_text, value) if label_text else
+                             "%s_%s %s" % (prefix, name, value))
+
+        def stage_samples(attribute):
+            return [((("stage", stage), ("table", table or "")), getattr(metrics, attribute))
+                    for (stage, table), metrics in self.stages.items()]
+
+        metric("stage_rows_total", "counter", "Rows handled by each stage.", stage_samples("rows"))
+        metric("stage_bytes_total", "counter", "Bytes written by each stage.", stage_samples("bytes"))
+        metric("stage_seconds_total", "counter", "Seconds spent in each stage.", stage_samples("seconds"))
+        metric("stage_calls_total", "counter", "Number of batches or calls timed in each stage.",
+               stage_samples("calls"))
+        metric("com_calls_total", "counter", "Number of calls into ADO.",
+               [((("call", name),), calls) for name, calls in self.com_calls.items()])
+
+        def pipeline_samples(value):
+            samples = []
+            for table, stats in self.pipelines.items():
+                for stage, stage_stats in stats["stages"].items():
+                    sample = value(stage_stats)
+                    if sample is not None:
+                        samples.append(((("stage", stage), ("table", table)), sample))
+            return samples
+
+        metric("pipeline_busy_seconds", "gauge", "Seconds each pipeline stage spent working.",
+               pipeline_samples(lambda stats: stats["busy_seconds"]))
+        metric("pipeline_utilization", "gauge", "Share of the pipeline run time each stage spent working.",
+               pipeline_samples(lambda stats: stats["utilization"]))
+        metric("pipeline_queue_max_depth", "gauge", "Largest number of batches waiting before each stage.",
+               pipeline_samples(lambda stats: stats["input_queue"]["max_depth"] if "input_queue" in stats else None))
+        metric("pipeline_queue_mean_depth", "gauge", "Mean number of batches waiting before each stage.",
+               pipeline_samples(lambda stats: stats["input_queue"]["mean_depth"] if "input_queue" in stats else None))
+        metric("elapsed_seconds", "gauge", "Seconds since the export started.",
+               [((), time.time() - self.started)])
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename, format=None):
+        """ filename に書き出す．"-" なら標準エラー出力
+            format は "json" か "prometheus"．省略時は拡張子 .prom なら prometheus
+        """
+        if format is None:
+            format = "prometheus" if filename.endswith((".prom", ".txt")) else "json"
+        if format == "json":
+            text = self.to_json() + "\n"
+        elif format == "prometheus":
+            text = self.to_prometheus()
+        else:
+            raise Exception("unknown metrics format: %s" % format)
+        if filename == "-":
+            sys.stderr.write(text)
+        else:
+            with open(filename, "w", encoding="utf-8") as f:
+                f.write(text)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class NullTimer:
+    rows = 0
+    bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class NullMetrics(Metrics):
+    """何も数えない"""
+    enabled = False
+
+    def record(self, stage, rows=0, bytes=0, seconds=0.0, table=None):
+        pass
+
+    def count_com_call(self, name, calls=1):
+        pass
+
+    def record_pipeline(self, stats, table=None):
+        pass
+
+    def timer(self, stage, rows=0, bytes=0, table=None):
+        return NullTimer()
+
+    def table(self, table, total_rows=None):
+        return NullTimer()
+
+
+NULL_METRICS = NullMetrics()
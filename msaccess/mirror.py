@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+""" テーブルを SQLite のファイルに写しておき、繰り返す集計はそちらで答える
+
+    Jet で何度も集計すると遅く、そのあいだ Access の利用者がファイルのロックで待たされる．
+    Mirror はテーブルを SQLite に写す．型は DATA_TYPE から sqlite バックエンドが読める
+    宣言 (Currency, DateTime, YesNo, LongText など) にするので、写したファイルを
+    MsAccessDb(path, backend="sqlite") で開けば元と同じ型の値が返る．
+    主キーと、indexes で指定した列には索引を作る．
+
+    二回目からは主キーごとの行のハッシュ (msaccess.delta) と比べて、変わった行だけを
+    書き直す．.mdb の更新時刻とサイズが変わっていなければ読みもしない．
+
+        with MirroredDb("data.mdb", "data.sqlite", max_age=600) as db:
+            db.First("(Select Sum(amount) From orders)")
+
+    MirroredDb は写しが max_age 秒より古くなったときだけ .mdb を開いて写し直し、
+    クエリは写しの方で実行する (SQL は SQLite で通るように書くこと．Top や #日付# は使えない)
+"""
+import sys
+import json
+import time
+import sqlite3
+import datetime
+from .backends import quote_identifier, SqliteCatalog
+from .schema import file_signature
+from .delta import TableDelta, DELETE
+from .metrics import NULL_METRICS
+from .pipeline import Pipeline, Stage, chunked
+
+# DATA_TYPE -> SQLite で宣言する型．sqlite バックエンドがまた同じ DATA_TYPE に戻せるもの
+# メモ型は Memo だと数字だけの値が数値になるので、TEXT の型親和性になる LongText にする
+sqliteTypes = {
+    2: "SmallInt",
+    3: "Integer",
+    4: "Real",
+    5: "Double",
+    6: "Currency",
+    7: "DateTime",
+    11: "YesNo",
+    14: "Decimal",
+    16: "TinyInt",
+    17: "Byte",
+    18: "Integer",
+    19: "BigInt",
+    20: "BigInt",
+    21: "BigInt",
+    72: "Guid",
+    128: "Binary",
+    129: "Text",
+    130: "Text",
+    131: "Numeric",
+    133: "DateTime",
+    135: "DateTime",
+    139: "Numeric",
+    200: "Text",
+    201: "LongText",
+    202: "Text",
+    203: "LongText",
+    204: "Binary",
+    205: "OleObject",
+}
+textTypes = (129, 130, 200, 202)
+dateTypes = (7, 133, 135)
+
+TABLES_TABLE = SqliteCatalog.system_prefix + "MirrorTables"
+ROWS_TABLE = SqliteCatalog.system_prefix + "MirrorRows"
+
+
+def declared_type(attributes):
+    """カラムの属性 (adSchemaColumns の行) から SQLite の型の宣言"""
+    data_type = attributes["DATA_TYPE"]
+    declaration = sqliteTypes.get(data_type, "")
+    if data_type in textTypes and attributes.get("CHARACTER_MAXIMUM_LENGTH"):
+        declaration += "(%d)" % attributes["CHARACTER_MAXIMUM_LENGTH"]
+    return declaration
+
+
+def adapt_datetime(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(" ")
+    return value
+
+
+def make_adapter(data_types):
+    """行を executemany に渡せる形にする関数．日付の列がなければ何もしない"""
+    indexes = [i for i, data_type in enumerate(data_types) if data_type in dateTypes]
+    if not indexes:
+        return lambda row: row
+
+    def adapt(row):
+        row = list(row)
+        for i in indexes:
+            row[i] = adapt_datetime(row[i])
+        return row
+    return adapt
+
+
+def index_name(table_name, columns):
+    return "ix_%s_%s" % (table_name, "_".join(columns))
+
+
+class Mirror:
+    def __init__(self, path, indexes=None, batch_size=5000, queue_size=4):
+        """ path    : 写しの SQLite のファイル
+            indexes : {テーブル名: [列名か列名のリスト]} 主キーのほかに索引を作る列
+        """
+        self.path = path
+        self.indexes = indexes or {}
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        # 写しているあいだに読む側は別の接続で前の状態を読める
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute(
+            "Create Table If Not Exists %s (table_name Text Primary Key, columns Text, key_columns Text, "
+            "source_signature Text, refreshed_at Double, rows Integer)" % TABLES_TABLE)
+        self.connection.execute(
+            "Create Table If Not Exists %s (table_name Text, key Text, hash Text, "
+            "Primary Key (table_name, key)) Without RowId" % ROWS_TABLE)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def entries(self):
+        """{テーブル名: 写したときの情報の辞書}"""
+        cursor = self.connection.execute(
+            "Select table_name, columns, key_columns, source_signature, refreshed_at, rows From %s" % TABLES_TABLE)
+        return dict((table_name, {"columns": json.loads(columns), "key_columns": json.loads(key_columns),
+                                  "source_signature": json.loads(source_signature),
+                                  "refreshed_at": refreshed_at, "rows": rows})
+                    for table_name, columns, key_columns, source_signature, refreshed_at, rows in cursor)
+
+    def age(self, now=None):
+        """一番古いテーブルを写してからの秒数．まだ何も写していなければ None"""
+        refreshed_at = self.connection.execute("Select Min(refreshed_at) From %s" % TABLES_TABLE).fetchone()[0]
+        if refreshed_at is None:
+            return None
+        return (now or time.time()) - refreshed_at
+
+    def refresh(self, db, tables=None, full=False, metrics=NULL_METRICS):
+        """ db (MsAccessDb) のテーブルを写す．{テーブル名: 書いた行数} を返す
+            full=True なら差分を見ずに全部写し直す
+        """
+        source_signature = file_signature(db.db_name)
+        signature = json.dumps(source_signature)
+        entries = self.entries()
+        source_tables = db.get_table_names()
+        table_names = [table_name for table_name in source_tables if tables is None or table_name in tables]
+        written = {}
+        for table_name in entries:
+            if table_name not in source_tables:
+                self.drop_table(table_name)
+        for table_name in table_names:
+            entry = entries.get(table_name)
+            if not full and source_signature is not None and entry is not None \
+                    and entry["source_signature"] == list(source_signature):
+                # .mdb が変わっていない
+                self.touch(table_name)
+                written[table_name] = 0
+                continue
+            with metrics.table(table_name):
+                written[table_name] = self.refresh_table(db, table_name, entry, signature, full, metrics)
+        return written
+
+    def touch(self, table_name):
+        self.connection.execute("Update %s Set refreshed_at = ? Where table_name = ?" % TABLES_TABLE,
+                                (time.time(), table_name))
+
+    def drop_table(self, table_name):
+        with self.transaction():
+            self.connection.execute("Drop Table If Exists %s" % quote_identifier(table_name))
+            self.connection.execute("Delete From %s Where table_name = ?" % TABLES_TABLE, (table_name,))
+            self.connection.execute("Delete From %s Where table_name = ?" % ROWS_TABLE, (table_name,))
+
+    def transaction(self):
+        return Transaction(self.connection)
+
+    def create_table(self, table_name, attributes, key_columns):
+        columns = [("%s %s" % (quote_identifier(record["COLUMN_NAME"]), declared_type(record))).strip()
+                   for record in attributes]
+        if key_columns:
+            columns.append("Primary Key (%s)" % ", ".join(quote_identifier(column) for column in key_columns))
+        self.connection.execute("Drop Table If Exists %s" % quote_identifier(table_name))
+        self.connection.execute("Create Table %s (%s)" % (quote_identifier(table_name), ", ".join(columns)))
+
+    def index_statements(self, table_name):
+        """作り直す前のテーブルにあった索引 (主キー以外) の Create Index 文"""
+        return [sql for sql, in self.connection.execute(
+            "Select sql From sqlite_master Where type = 'index' And tbl_name = ? And sql Is Not Null",
+            (table_name,))]
+
+    def create_indexes(self, table_name, statements=()):
+        for statement in statements:
+            try:
+                self.connection.execute(statement)
+            except sqlite3.OperationalError as e:
+                # 列がなくなったなど
+                print("cannot recreate index of %s: %s" % (table_name, e), file=sys.stderr)
+        for columns in self.indexes.get(table_name, []):
+            if isinstance(columns, str):
+                columns = [columns]
+            self.connection.execute("Create Index If Not Exists %s On %s (%s)" % (
+                quote_identifier(index_name(table_name, columns)), quote_identifier(table_name),
+                ", ".join(quote_identifier(column) for column in columns)))
+
+    def load_hashes(self, table_name):
+        return dict(self.connection.execute(
+            "Select key, hash From %s Where table_name = ?" % ROWS_TABLE, (table_name,)))
+
+    def refresh_table(self, db, table_name, entry, signature, full=False, metrics=NULL_METRICS):
+        """ 主キーがあり、列が前と同じなら変わった行だけを書く．そうでなければ作り直す
+            全体を一つのトランザクションにするので、読む側には前の状態か新しい状態しか見えない
+        """
+        attributes = db.get_field_attributes(table_name)
+        field_names = [record["COLUMN_NAME"] for record in attributes]
+        data_types = [record["DATA_TYPE"] for record in attributes]
+        key_columns = db.get_primary_key(table_name)
+        columns = [[record["COLUMN_NAME"], declared_type(record)] for record in attributes]
+
+        incremental = (not full and key_columns and entry is not None
+                       and entry["columns"] == columns and entry["key_columns"] == key_columns)
+        delta = TableDelta(field_names, key_columns, self.load_hashes(table_name) if incremental else None)
+        adapt = make_adapter(data_types)
+        quoted_table = quote_identifier(table_name)
+        insert = "Insert Or Replace Into %s Values (%s)" % (quoted_table, ", ".join("?" * len(field_names)))
+        delete = "Delete From %s Where %s" % (
+            quoted_table, " And ".join("%s = ?" % quote_identifier(column) for column in delta.key_columns))
+        written = 0
+
+        def apply(changes):
+            nonlocal written
+            with metrics.timer("sink", rows=len(changes)):
+                upserts = [adapt(change.row) for change in changes if change.operation != DELETE]
+                deletes = [[adapt_datetime(value) for value in change.key]
+                           for change in changes if change.operation == DELETE]
+                if upserts:
+                    self.connection.executemany(insert, upserts)
+                if deletes:
+                    self.connection.executemany(delete, deletes)
+            written += len(changes)
+
+        with self.transaction():
+            # 前に indexes で作った索引は作り直したあとも残す
+            index_statements = [] if incremental else self.index_statements(table_name)
+            if not incremental:
+                self.create_table(table_name, attributes, key_columns)
+            pipeline = Pipeline([Stage("sink", apply)], self.queue_size)
+            pipeline.run(chunked(delta.changes(db.iterate_query(table_name, self.batch_size)), self.batch_size))
+            metrics.record_pipeline(pipeline.stats())
+            self.create_indexes(table_name, index_statements)
+
+            self.connection.execute("Delete From %s Where table_name = ?" % ROWS_TABLE, (table_name,))
+            if key_columns:
+                self.connection.executemany(
+                    "Insert Into %s Values (?, ?, ?)" % ROWS_TABLE,
+                    ((table_name, key, digest) for key, digest in delta.rows.items()))
+            self.connection.execute(
+                "Insert Or Replace Into %s Values (?, ?, ?, ?, ?, ?)" % TABLES_TABLE,
+                (table_name, json.dumps(columns), json.dumps(key_columns), signature, time.time(),
+                 len(delta.rows)))
+        return written
+
+
+class Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("Begin")
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.connection.execute("Commit" if exc_type is None else "Rollback")
+
+
+class MirroredDb:
+    """ 写しが max_age 秒より新しいあいだはクエリを写しで答える MsAccessDb の代わり
+        古ければ .mdb を開いて写し直し、終わったら閉じる (ロックを持ち続けない)
+    """
+
+    def __init__(self, db_name, mirror_path, max_age=300.0, tables=None, indexes=None, backend=None,
+                 batch_size=5000, metrics=None):
+        from . import MsAccessDb
+
+        self.db_name = db_name
+        self.max_age = max_age
+        self.tables = tables
+        self.backend = backend
+        self.metrics = metrics or NULL_METRICS
+        self.mirror = Mirror(mirror_path, indexes, batch_size)
+        self.db = MsAccessDb(mirror_path, backend="sqlite", metrics=metrics)
+
+    def close(self):
+        self.db.close()
+        self.mirror.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def is_fresh(self, now=None):
+        age = self.mirror.age(now)
+        return age is not None and age <= self.max_age
+
+    def refresh(self, full=False):
+        """.mdb を開いて写し直す．{テーブル名: 書いた行数}"""
+        from . import MsAccessDb
+
+        with MsAccessDb(self.db_name, self.backend, metrics=self.metrics) as source:
+            written = self.mirror.refresh(source, self.tables, full, self.metrics)
+        self.db.invalidate_schema()
+        return written
+
+    def ensure_fresh(self):
+        if not self.is_fresh():
+            self.refresh()
+        return self.db
+
+    def execute_query(self, query):
+        return self.ensure_fresh().execute_query(query)
+
+    def iterate_query(self, query, batch_size=None):
+        return self.ensure_fresh().iterate_query(query, batch_size)
+
+    def iterate_statement(self, statement, batch_size=None):
+        return self.ensure_fresh().iterate_statement(statement, batch_size)
+
+    def iterate_batches(self, query, batch_size=5000, columns=False):
+        return self.ensure_fresh().iterate_batches(query, batch_size, columns)
+
+    def First(self, query):
+        return self.ensure_fresh().First(query)
+
+    def count_rows(self, table_name):
+        return self.ensure_fresh().count_rows(table_name)
+
+    def get_table_names(self):
+        return self.ensure_fresh().get_table_names()
+
+    def get_field_names(self, table_name):
+        return self.ensure_fresh().get_field_names(table_name)
+
+    def get_primary_key(self, table_name):
+        return self.ensure_fresh().get_primary_key(table_name)
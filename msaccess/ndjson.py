@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+""" 一行に一つの JSON (NDJSON / JSON Lines) を書き出す
+
+    列の DATA_TYPE ごとにエンコード関数を一つ選んでおき、行のバッチを
+    まとめて文字列にしてからバイナリのストリームに書く．
+    日付やバイナリは MongoDB の Extended JSON (relaxed) と同じ形にするので、
+    bson.json_util.dumps で書いたものと同じ出力になる．
+    gzip と zstd (zstandard が必要) で圧縮できる
+"""
+import io
+import sys
+import math
+import json
+import functools
+import gzip
+import base64
+import decimal
+import datetime
+
+EPOCH = datetime.datetime(1970, 1, 1)
+MAX_YEAR = 9999
+
+
+def encode_string(value, ensure_ascii=True):
+    return json.dumps(value, ensure_ascii=ensure_ascii)
+
+
+def encode_int(value):
+    return str(int(value))
+
+
+def encode_bool(value):
+    return "true" if value else "false"
+
+
+def encode_float(value):
+    if math.isfinite(value):
+        return repr(float(value))
+    elif value != value:
+        return '{"$numberDouble": "NaN"}'
+    return '{"$numberDouble": "%s"}' % ("Infinity" if value > 0 else "-Infinity")
+
+
+def encode_decimal(value):
+    return '{"$numberDecimal": "%s"}' % value
+
+
+def encode_datetime(value):
+    if EPOCH.year <= value.year <= MAX_YEAR:
+        text = "%04d-%02d-%02dT%02d:%02d:%02d" % (
+            value.year, value.month, value.day, value.hour, value.minute, value.second)
+        milliseconds = value.microsecond // 1000
+        if milliseconds:
+            text += ".%03d" % milliseconds
+        return '{"$date": "%sZ"}' % text
+    milliseconds = (value.replace(tzinfo=None) - EPOCH) // datetime.timedelta(milliseconds=1)
+    return '{"$date": {"$numberLong": "%d"}}' % milliseconds
+
+
+def encode_binary(value):
+    return '{"$binary": {"base64": "%s", "subType": "00"}}' % base64.b64encode(bytes(value)).decode("ascii")
+
+
+def encode_value(value, ensure_ascii=True):
+    """型が分からない値．Python の型を見て決める"""
+    if value is None:
+        return "null"
+    elif isinstance(value, str):
+        return encode_string(value, ensure_ascii)
+    elif isinstance(value, bool):
+        return encode_bool(value)
+    elif isinstance(value, int):
+        return encode_int(value)
+    elif isinstance(value, float):
+        return encode_float(value)
+    elif isinstance(value, decimal.Decimal):
+        return encode_decimal(value)
+    elif isinstance(value, datetime.datetime):
+        return encode_datetime(value)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        return encode_binary(value)
+    elif isinstance(value, dict):
+        return "{" + ", ".join([encode_string(str(key), ensure_ascii) + ": " + encode_value(item, ensure_ascii)
+                                for key, item in value.items()]) + "}"
+    elif isinstance(value, (list, tuple)):
+        return "[" + ", ".join([encode_value(item, ensure_ascii) for item in value]) + "]"
+    raise TypeError("cannot encode %r as json" % (value,))
+
+
+def typed_encoder(python_types, encode, ensure_ascii):
+    """値の型が合っていれば encode、そうでなければ encode_value を使う"""
+    def encoder(value):
+        if type(value) in python_types:
+            return encode(value)
+        return encode_value(value, ensure_ascii)
+    return encoder
+
+
+def make_encoder(data_type, ensure_ascii=True):
+    """DATA_TYPE に合わせたエンコード関数．値は iterate_query で変換したあとのもの"""
+    if data_type in (8, 72, 129, 130, 200, 201, 202, 203):
+        return typed_encoder((str,), functools.partial(encode_string, ensure_ascii=ensure_ascii), ensure_ascii)
+    elif data_type in (2, 3, 16, 17, 18, 19, 20, 21):
+        return typed_encoder((int,), encode_int, ensure_ascii)
+    elif data_type == 11:
+        return typed_encoder((bool,), encode_bool, ensure_ascii)
+    elif data_type in (4, 5, 6, 14, 131, 139):
+        return typed_encoder((float,), encode_float, ensure_ascii)
+    elif data_type in (7, 133, 135):
+        return typed_encoder((datetime.datetime,), encode_datetime, ensure_ascii)
+    elif data_type in (128, 204, 205):
+        return typed_encoder((bytes, bytearray, memoryview), encode_binary, ensure_ascii)
+    return lambda value: encode_value(value, ensure_ascii)
+
+
+class NdjsonWriter:
+    """ field_names と DATA_TYPE から一行分のエンコードの仕方を決めておき、
+        行のバッチをまとめて stream (バイナリ) に書く
+    """
+
+    def __init__(self, stream, field_names, field_types, ensure_ascii=True, encoding="utf-8"):
+        self.stream = stream
+        self.encoding = encoding
+        self.prefixes = [json.dumps(name, ensure_ascii=ensure_ascii) + ": " for name in field_names]
+        self.encoders = [make_encoder(data_type, ensure_ascii) for data_type in field_types]
+        self.rows = 0
+
+    def encode_row(self, row):
+        return "{" + ", ".join([prefix + encode(value) if value is not None else prefix + "null"
+                                for prefix, encode, value in zip(self.prefixes, self.encoders, row)]) + "}"
+
+    def encode_rows(self, rows):
+        """行のバッチを改行つきの一つのバイト列にする"""
+        encode_row = self.encode_row
+        lines = [encode_row(row) for row in rows]
+        if not lines:
+            return b""
+        lines.append("")
+        return "\n".join(lines).encode(self.encoding)
+
+    def write(self, data, rows):
+        """encode_rows したものを書く"""
+        if data:
+            self.stream.write(data)
+            self.rows += rows
+
+    def write_rows(self, rows):
+        self.write(self.encode_rows(rows), len(rows))
+
+
+def binary_stdout():
+    stdout = sys.stdout
+    # msaccess_export の run() で codecs の StreamWriter に包まれていることがある
+    while not hasattr(stdout, "buffer") and hasattr(stdout, "stream"):
+        stdout = stdout.stream
+    return getattr(stdout, "buffer", stdout)
+
+
+class UnclosedStream(io.BufferedWriter):
+    """close しても下のストリームを閉じない (標準出力用)"""
+    def close(self):
+        self.flush()
+        self.raw.flush()
+
+
+class ClosingWrapper:
+    """圧縮ストリームを閉じたあとで下のファイルも閉じる"""
+    def __init__(self, stream, underlying):
+        self.stream = stream
+        self.underlying = underlying
+
+    def write(self, data):
+        return self.stream.write(data)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+        self.underlying.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def open_output(filename, compression=None, buffer_size=1 << 20):
+    """ バッファつきのバイナリのストリームを開く．filename が "-" なら標準出力
+        compression は None, "gzip", "zstd"．None ならファイルの拡張子 (.gz, .zst) で決める
+    """
+    if compression is None and filename != "-":
+        if filename.endswith(".gz"):
+            compression = "gzip"
+        elif filename.endswith(".zst"):
+            compression = "zstd"
+
+    if filename == "-":
+        sys.stdout.flush()
+        raw = binary_stdout()
+        stream = UnclosedStream(raw, buffer_size)
+    else:
+        stream = open(filename, "wb", buffering=buffer_size)
+
+    if compression is None or compression == "none":
+        return stream
+    elif compression == "gzip":
+        return ClosingWrapper(gzip.GzipFile(fileobj=stream, mode="wb", compresslevel=6), stream)
+    elif compression == "zstd":
+        import zstandard
+        return ClosingWrapper(zstandard.ZstdCompressor().stream_writer(stream, closefd=False), stream)
+    stream.close()
+    raise Exception("unknown compression: %s" % compression)
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+""" テーブルごとの処理をプロセスプールで並列に実行する
+
+    ワーカープロセスはそれぞれ自分の MsAccessDb の接続を一つだけ持つ．
+    大きいテーブルから先に投入して、最後に大きなテーブルだけが
+    残ってしまうのを避ける．結果は渡されたテーブルの順番で返す
+"""
+from concurrent.futures import ProcessPoolExecutor
+from . import MsAccessDb
+
+# ワーカープロセスごとの接続
+worker_db = None
+
+
+def open_worker_db(db_name, backend):
+    global worker_db
+    worker_db = MsAccessDb(db_name, backend)
+
+
+def run_table_job(func, table_name, args):
+    return func(worker_db, table_name, *args)
+
+
+def schedule_tables(db, table_names):
+    """行数の多いテーブルから順に並べる"""
+    sizes = dict((table_name, db.count_rows(table_name)) for table_name in table_names)
+    return sorted(table_names, key=lambda table_name: -sizes[table_name])
+
+
+def map_tables(db_name, table_names, func, jobs=1, backend=None, args=()):
+    """ func(db, table_name, *args) を各テーブルに対して実行し、
+        結果を table_names の順番のリストで返す
+    """
+    if jobs <= 1:
+        db = MsAccessDb(db_name, backend)
+        try:
+            return [func(db, table_name, *args) for table_name in table_names]
+        finally:
+            db.close()
+
+    db = MsAccessDb(db_name, backend)
+    try:
+        order = schedule_tables(db, table_names)
+        backend = db.backend.name if backend is None else backend
+    finally:
+        db.close()
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=open_worker_db,
+                             initargs=(db_name, backend)) as executor:
+        futures = dict((table_name, executor.submit(run_table_job, func, table_name, args))
+                       for table_name in order)
+        return [futures[table_name].result() for table_name in table_names]
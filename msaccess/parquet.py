@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+""" テーブルを Apache Arrow / Parquet に書き出す
+
+    Arrow の型は DATA_TYPE から決める．通貨や数値は float にせず
+    decimal のまま、日付は timestamp にする．
+    iterate_batches で row_group_size 行ずつ取り出して一つの row group にするので、
+    メモリは row_group_size に比例する分しか使わない
+"""
+from . import valueConverters, identity, typeNames
+
+# Arrow へは Decimal のまま渡す
+arrowConverters = dict(valueConverters)
+for data_type in (6, 14, 131, 139):
+    arrowConverters[data_type] = identity
+
+
+def arrow_type(attributes):
+    """adSchemaColumns の属性から Arrow の型を決める"""
+    import pyarrow as pa
+
+    type_name = typeNames.get(attributes["DATA_TYPE"])
+    if type_name == "adCurrency":
+        return pa.decimal128(19, 4)
+    elif type_name in ("adDecimal", "adNumeric", "adVarNumeric"):
+        return pa.decimal128(attributes.get("NUMERIC_PRECISION") or 28, attributes.get("NUMERIC_SCALE") or 0)
+    elif type_name in ("adDate", "adDBDate", "adDBTimeStamp"):
+        return pa.timestamp("us")
+    elif type_name in ("adBinary", "adVarBinary", "adLongVarBinary"):
+        return pa.binary()
+    elif type_name in arrowTypes:
+        return getattr(pa, arrowTypes[type_name])()
+    return pa.string()
+
+
+arrowTypes = {
+    "adTinyInt": "int8",
+    "adSmallInt": "int16",
+    "adInteger": "int32",
+    "adBigInt": "int64",
+    "adUnsignedTinyInt": "uint8",
+    "adUnsignedSmallInt": "uint16",
+    "adUnsignedInt": "uint32",
+    "adUnsignedBigInt": "uint64",
+    "adSingle": "float32",
+    "adDouble": "float64",
+    "adBoolean": "bool_",
+}
+
+
+def arrow_schema(db, table_name, field_names=None):
+    import pyarrow as pa
+
+    attributes = db.get_field_attributes(table_name)
+    if field_names is None:
+        field_names = [attribute["COLUMN_NAME"] for attribute in attributes]
+    return pa.schema([(field_name, arrow_type(attribute))
+                      for field_name, attribute in zip(field_names, attributes)])
+
+
+def iterate_record_batches(db, table_name, schema, row_group_size=65536):
+    import pyarrow as pa
+
+    for columns in db.iterate_batches(table_name, row_group_size, columns=True, converter_table=arrowConverters):
+        yield pa.record_batch([pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                              schema=schema)
+
+
+def write_parquet(db, table_name, path, row_group_size=65536, field_names=None, compression="snappy"):
+    """ table_name を path に書き出して行数を返す
+        field_names を渡すと列名をそれに置き換える
+    """
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(db, table_name, field_names)
+    count = 0
+    with pq.ParquetWriter(path, schema, compression=compression) as writer:
+        for batch in iterate_record_batches(db, table_name, schema, row_group_size):
+            writer.write_batch(batch, row_group_size=row_group_size)
+            count += batch.num_rows
+    return count
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+""" 段階ごとにスレッドを分けて流すパイプライン
+
+    最初の段階 (source) は呼び出したスレッドで回す．ADO のオブジェクトは
+    作ったスレッドのアパートメントでしか使えないので、取り出しはここで行う．
+    残りの段階はそれぞれ専用のスレッドで動き、段階の間は大きさに上限のある
+    キューでつなぐ．後ろの段階が詰まれば前の段階は空くまで待つ．
+
+        pipeline = Pipeline([Stage("serialize", encode), Stage("sink", write)], queue_size=4)
+        pipeline.run(db.iterate_batches("customer"))
+        pipeline.stats()
+
+    各段階の関数はバッチを一つ受け取って次の段階に渡すものを返す．最後の段階の戻り値は捨てる．
+    どこかの段階で例外が起きたら全体を止め、run がその例外を投げる
+"""
+import time
+import queue
+import threading
+from collections import OrderedDict
+
+END = object()
+POLL_SECONDS = 0.1
+
+
+def chunked(iterable, size):
+    """iterable を size 個ずつのリストにする"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Stage:
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.batches = 0
+        # func の中にいた時間と、前の段階を待っていた時間、次の段階が空くのを待っていた時間
+        self.busy_seconds = 0.0
+        self.input_wait_seconds = 0.0
+        self.output_wait_seconds = 0.0
+
+    def stats(self, elapsed):
+        return OrderedDict([
+            ("batches", self.batches),
+            ("busy_seconds", self.busy_seconds),
+            ("input_wait_seconds", self.input_wait_seconds),
+            ("output_wait_seconds", self.output_wait_seconds),
+            ("utilization", self.busy_seconds / elapsed if elapsed else None),
+        ])
+
+
+class BoundedQueue(queue.Queue):
+    """入れたときの深さを覚えておく queue.Queue"""
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize)
+        self.puts = 0
+        self.depth_total = 0
+        self.max_depth = 0
+
+    def _put(self, item):
+        super()._put(item)
+        depth = len(self.queue)
+        self.puts += 1
+        self.depth_total += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def stats(self):
+        return OrderedDict([
+            ("size", self.maxsize),
+            ("depth", self.qsize()),
+            ("max_depth", self.max_depth),
+            ("mean_depth", self.depth_total / self.puts if self.puts else 0.0),
+        ])
+
+
+class Pipeline:
+    def __init__(self, stages, queue_size=4, source_name="fetch"):
+        """ stages     : Stage のリスト．source のあとに順に流す
+            queue_size : 段階の間のキューに入れておけるバッチの数
+        """
+        self.source = Stage(source_name, None)
+        self.stages = list(stages)
+        self.queues = [BoundedQueue(queue_size) for stage in self.stages]
+        self.error = None
+        self.failed = threading.Event()
+        self.elapsed = 0.0
+
+    def put(self, q, item, stage):
+        """止められていれば False"""
+        started = time.perf_counter()
+        try:
+            while True:
+                try:
+                    q.put(item, timeout=POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    if self.failed.is_set():
+                        return False
+        finally:
+            stage.output_wait_seconds += time.perf_counter() - started
+
+    def get(self, q, stage):
+        """止められていれば END"""
+        started = time.perf_counter()
+        try:
+            while True:
+                try:
+                    return q.get(timeout=POLL_SECONDS)
+                except queue.Empty:
+                    if self.failed.is_set():
+                        return END
+        finally:
+            stage.input_wait_seconds += time.perf_counter() - started
+
+    def fail(self, e):
+        if self.error is None:
+            self.error = e
+        self.failed.set()
+
+    def work(self, index):
+        stage = self.stages[index]
+        input_queue = self.queues[index]
+        output_queue = self.queues[index + 1] if index + 1 < len(self.queues) else None
+        try:
+            while True:
+                batch = self.get(input_queue, stage)
+                if batch is END:
+                    break
+                started = time.perf_counter()
+                result = stage.func(batch)
+                stage.busy_seconds += time.perf_counter() - started
+                stage.batches += 1
+                if output_queue is not None and not self.put(output_queue, result, stage):
+                    break
+        except BaseException as e:
+            self.fail(e)
+        finally:
+            if output_queue is not None:
+                self.put(output_queue, END, stage)
+
+    def run(self, batches):
+        """batches (バッチを返す iterable) をこのスレッドで回して流す"""
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self.work, args=(i,), name="pipeline-%s" % stage.name, daemon=True)
+                   for i, stage in enumerate(self.stages)]
+        for thread in threads:
+            thread.start()
+
+        source = self.source
+        iterator = iter(batches)
+        try:
+            while not self.failed.is_set():
+                fetch_started = time.perf_counter()
+                batch = next(iterator, END)
+                source.busy_seconds += time.perf_counter() - fetch_started
+                if batch is END:
+                    break
+                source.batches += 1
+                if self.stages:
+                    if not self.put(self.queues[0], batch, source):
+                        break
+        except BaseException as e:
+            self.fail(e)
+        finally:
+            if self.stages:
+                self.put(self.queues[0], END, source)
+            for thread in threads:
+                thread.join()
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            self.elapsed = time.perf_counter() - started
+
+        if self.error is not None:
+            raise self.error
+        return source.batches
+
+    def queue_depths(self):
+        """今のキューの深さ．別のスレッドから見てもよい"""
+        return [q.qsize() for q in self.queues]
+
+    def stats(self):
+        stages = OrderedDict()
+        for stage in [self.source] + self.stages:
+            stages[stage.name] = stage.stats(self.elapsed)
+        for stage, q in zip(self.stages, self.queues):
+            stages[stage.name]["input_queue"] = q.stats()
+        return OrderedDict([("elapsed_seconds", self.elapsed), ("stages", stages)])
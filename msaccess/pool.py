@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+""" MsAccessDb の接続プール
+
+    Jet でファイルを開くのはクエリよりずっと重いので、接続を使い回す．
+
+        pool = get_pool("data.mdb", size=4)
+        with pool.connection() as db:
+            db.First("...")
+
+    ADO の接続は作ったスレッド (アパートメント) でしか使えないので、接続は開いた
+    スレッドにだけ貸し出し、閉じるのもそのスレッドで行う．別のスレッドが返したものも、
+    開いたスレッドが次に借りる．
+    ADO の接続を別のスレッドで使うときは、そのスレッドで
+    pythoncom.CoInitialize() しておくこと
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from . import MsAccessDb
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, db_name, size=4, backend=None, max_idle=300, health_check=None, **options):
+        """ size         : 同時に開いておく接続の数の上限
+            max_idle     : これより長く (秒) 使われなかった接続は閉じる
+            health_check : 貸し出す前に呼ぶ関数 (省略時は MsAccessDb.is_open)
+            options      : MsAccessDb に渡す引数
+        """
+        self.db_name = db_name
+        self.size = size
+        self.backend = backend
+        self.max_idle = max_idle
+        self.health_check = health_check or MsAccessDb.is_open
+        self.options = options
+        self.condition = threading.Condition()
+        # [(返された時刻, 開いたスレッド, MsAccessDb)] 最後に返されたものが最後
+        self.idle = []
+        # {id(MsAccessDb): 開いたスレッド} 貸し出し中のものも含む
+        self.owners = {}
+        # {開いたスレッド: [MsAccessDb]} もう使わないが、まだ閉じていない接続．opened には数えない
+        self.retired = {}
+        self.opened = 0
+        self.closed = False
+
+    def open_connection(self):
+        return MsAccessDb(self.db_name, self.backend, **self.options)
+
+    def close_connection(self, db):
+        try:
+            db.close()
+        except Exception:
+            pass
+
+    def retire(self, db):
+        """ もう使わない接続．このスレッドで開いたものなら今閉じるリストを返す
+            ほかのスレッドで開いたものは、そのスレッドが次に acquire か release するときに閉じる
+            condition を取った状態で呼ぶ
+        """
+        owner = self.owners.pop(id(db))
+        if owner is threading.current_thread() or not owner.is_alive():
+            # 開いたスレッドが終わっていれば、そのアパートメントで閉じることはもうできない
+            return [db]
+        self.retired.setdefault(owner, []).append(db)
+        return []
+
+    def collect_retired(self):
+        """このスレッドと、終わったスレッドが開いて使わなくなった接続．condition を取った状態で呼ぶ"""
+        closing = self.retired.pop(threading.current_thread(), [])
+        for owner in [owner for owner in self.retired if not owner.is_alive()]:
+            closing += self.retired.pop(owner)
+        return closing
+
+    def evict_idle(self):
+        """max_idle を過ぎた接続を捨てる．condition を取った状態で呼び、返したものを閉じる"""
+        deadline = time.time() - self.max_idle
+        expired = [db for released, thread, db in self.idle if released < deadline]
+        self.idle = [(released, thread, db) for released, thread, db in self.idle if released >= deadline]
+        self.opened -= len(expired)
+        closing = []
+        for db in expired:
+            closing += self.retire(db)
+        return closing
+
+    def take_idle(self, thread):
+        """thread が開いた空きの接続のうち最後に返されたもの．condition を取った状態で呼ぶ"""
+        for i in range(len(self.idle) - 1, -1, -1):
+            if self.idle[i][1] is thread:
+                return self.idle.pop(i)[2]
+        return None
+
+    def acquire(self, timeout=None):
+        """ 接続を借りる．このスレッドで開いた空きの接続がなければ新しく開く
+            size 個すべて開いていれば、ほかのスレッドの空きの接続を捨てて開き直す．
+            空きがなければ timeout 秒まで待つ
+        """
+        thread = threading.current_thread()
+        give_up = None if timeout is None else time.time() + timeout
+        closing = []
+        try:
+            with self.condition:
+                closing += self.collect_retired()
+                while True:
+                    if self.closed:
+                        raise Exception("connection pool is closed: %s" % self.db_name)
+                    closing += self.evict_idle()
+                    db = self.take_idle(thread)
+                    if db is not None:
+                        break
+                    if self.opened < self.size:
+                        self.opened += 1
+                        break
+                    if self.idle:
+                        # 数は変わらない (捨てた分をこのスレッドで開く)
+                        closing += self.retire(self.idle.pop(0)[2])
+                        break
+                    remaining = None if give_up is None else give_up - time.time()
+                    if remaining is not None and remaining <= 0:
+                        raise PoolTimeout("no connection available: %s" % self.db_name)
+                    self.condition.wait(remaining)
+        finally:
+            for closing_db in closing:
+                self.close_connection(closing_db)
+
+        if db is not None and not self.health_check(db):
+            with self.condition:
+                self.owners.pop(id(db))
+            self.close_connection(db)
+            db = None
+        if db is None:
+            try:
+                db = self.open_connection()
+            except Exception:
+                with self.condition:
+                    self.opened -= 1
+                    self.condition.notify()
+                raise
+            with self.condition:
+                self.owners[id(db)] = thread
+        return db
+
+    def release(self, db, broken=False):
+        """接続を返す．broken なら捨てる．どのスレッドから返してもよい"""
+        with self.condition:
+            closing = self.collect_retired()
+            if broken or self.closed:
+                self.opened -= 1
+                closing += self.retire(db)
+            else:
+                self.idle.append((time.time(), self.owners[id(db)], db))
+            self.condition.notify()
+        for closing_db in closing:
+            self.close_connection(closing_db)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        db = self.acquire(timeout)
+        broken = False
+        try:
+            yield db
+        except BaseException:
+            broken = not db.is_open()
+            raise
+        finally:
+            self.release(db, broken)
+
+    def close(self):
+        """ 空きの接続を捨てて、それ以上貸さない
+            ほかのスレッドで開いたものは、そのスレッドが次に acquire か release するときに閉じる
+        """
+        with self.condition:
+            self.closed = True
+            closing = self.collect_retired()
+            for released, thread, db in self.idle:
+                closing += self.retire(db)
+            self.opened -= len(self.idle)
+            self.idle = []
+            self.condition.notify_all()
+        for db in closing:
+            self.close_connection(db)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(db_name, **options):
+    """データベースのパスごとに一つのプールを返す．options は最初に作るときだけ使う"""
+    key = os.path.abspath(db_name)
+    with pools_lock:
+        pool = pools.get(key)
+        if pool is None or pool.closed:
+            pool = pools[key] = ConnectionPool(db_name, **options)
+        return pool
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+""" スキーマ情報のキャッシュ
+
+    テーブル一覧 (adSchemaTables)、全テーブルのカラム (adSchemaColumns)、
+    主キー (adSchemaPrimaryKeys) をそれぞれ一回の OpenSchema で読み込み、
+    TABLE_NAME ごとにまとめて持っておく．
+    ファイルにも保存でき、.mdb の更新時刻とサイズが変わっていなければ再利用する．
+    外部キー (adSchemaForeignKeys) は使うときだけ read_foreign_keys で読む
+"""
+import os
+import sys
+import pickle
+import hashlib
+import datetime
+
+adSchemaColumns = 4
+adSchemaTables = 20
+adSchemaPrimaryKeys = 28
+adSchemaForeignKeys = 27
+
+
+def plain_value(value):
+    """PyTime などを pickle できる普通の値にする"""
+    if isinstance(value, datetime.datetime):
+        return datetime.datetime(value.year, value.month, value.day,
+                                 value.hour, value.minute, value.second, value.microsecond)
+    elif value is None or isinstance(value, (str, int, float, bool, bytes)):
+        return value
+    return str(value)
+
+
+def read_records(recordset):
+    """Recordset の全行を {列名: 値} の辞書のリストにする"""
+    names = [field.Name for field in recordset.Fields]
+    records = []
+    while not recordset.EOF:
+        block = recordset.GetRows(1000)
+        for row in zip(*block):
+            records.append(dict(zip(names, [plain_value(value) for value in row])))
+    return records
+
+
+def read_foreign_keys(con):
+    """ 外部キー (リレーションシップ) ごとにまとめたリスト
+        [{"name", "parent_table", "parent_columns", "child_table", "child_columns"}]
+        parent が参照される側 (PK_TABLE_NAME)、child が参照する側 (FK_TABLE_NAME)．列は ORDINAL の順
+    """
+    foreign_keys = {}
+    for record in sorted(read_records(con.OpenSchema(adSchemaForeignKeys)),
+                         key=lambda record: record["ORDINAL"]):
+        key = (record["FK_NAME"], record["PK_TABLE_NAME"], record["FK_TABLE_NAME"])
+        foreign_key = foreign_keys.get(key)
+        if foreign_key is None:
+            foreign_key = foreign_keys[key] = {
+                "name": record["FK_NAME"],
+                "parent_table": record["PK_TABLE_NAME"], "parent_columns": [],
+                "child_table": record["FK_TABLE_NAME"], "child_columns": []}
+        foreign_key["parent_columns"].append(record["PK_COLUMN_NAME"])
+        foreign_key["child_columns"].append(record["FK_COLUMN_NAME"])
+    return sorted(foreign_keys.values(), key=lambda foreign_key: (foreign_key["child_table"], foreign_key["name"] or ""))
+
+
+def file_signature(db_name):
+    """(更新時刻, サイズ)．ファイルでなければ None"""
+    try:
+        stat = os.stat(db_name)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+class SchemaCatalog:
+    def __init__(self, tables, columns, primary_keys):
+        # [(TABLE_NAME, TABLE_TYPE)]
+        self.tables = tables
+        # {TABLE_NAME: [カラムの属性の辞書]} ORDINAL_POSITION の順
+        self.columns = columns
+        # {TABLE_NAME: [COLUMN_NAME]} ORDINAL の順
+        self.primary_keys = primary_keys
+
+    @classmethod
+    def load(cls, con):
+        tables = [(record["TABLE_NAME"], record["TABLE_TYPE"])
+                  for record in read_records(con.OpenSchema(adSchemaTables))]
+
+        columns = {}
+        for record in read_records(con.OpenSchema(adSchemaColumns)):
+            columns.setdefault(record["TABLE_NAME"], []).append(record)
+        for records in columns.values():
+            records.sort(key=lambda record: record["ORDINAL_POSITION"])
+
+        primary_keys = {}
+        for record in sorted(read_records(con.OpenSchema(adSchemaPrimaryKeys)),
+                             key=lambda record: record["ORDINAL"]):
+            primary_keys.setdefault(record["TABLE_NAME"], []).append(record["COLUMN_NAME"])
+
+        return cls(tables, columns, primary_keys)
+
+    @classmethod
+    def cache_path(cls, cache_directory, db_name):
+        key = hashlib.sha1(os.path.abspath(db_name).encode("utf-8")).hexdigest()
+        return os.path.join(cache_directory, "schema-%s.pickle" % key)
+
+    @classmethod
+    def load_cached(cls, con, db_name, cache_directory=None):
+        """ cache_directory があればそこに保存したものを使う．
+            .mdb の更新時刻かサイズが変わっていれば読み直す
+        """
+        signature = file_signature(db_name)
+        if not cache_directory or signature is None:
+            return cls.load(con)
+
+        path = cls.cache_path(cache_directory, db_name)
+        try:
+            with open(path, "rb") as f:
+                cached_signature, catalog = pickle.load(f)
+            if cached_signature == signature:
+                return catalog
+        except (OSError, EOFError, pickle.PickleError, ValueError, AttributeError):
+            pass
+
+        catalog = cls.load(con)
+        try:
+            os.makedirs(cache_directory, exist_ok=True)
+            temporary_path = path + ".tmp"
+            with open(temporary_path, "wb") as f:
+                pickle.dump((signature, catalog), f)
+            os.replace(temporary_path, path)
+        except OSError as e:
+            print("cannot write schema cache '%s': %s" % (path, e), file=sys.stderr)
+        return catalog
+
+    def table_names(self, schema_type="TABLE"):
+        return [name for name, table_type in self.tables if table_type == str(schema_type)]
+
+    def field_attributes(self, table_name):
+        """呼び出し側で書き換えてもよいようにコピーを返す"""
+        return [dict(record) for record in self.columns.get(table_name, [])]
+
+    def field_names(self, table_name):
+        return [record["COLUMN_NAME"] for record in self.columns.get(table_name, [])]
+
+    def field_types(self, table_name):
+        return [record["DATA_TYPE"] for record in self.columns.get(table_name, [])]
+
+    def primary_key(self, table_name):
+        return list(self.primary_keys.get(table_name, []))
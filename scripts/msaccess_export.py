@@ -2,11 +2,23 @@
 # encoding: utf-8
 import begin
 import msaccess
+import msaccess.parallel
+import msaccess.delta
+import msaccess.checkpoint
+import msaccess.ndjson
+import msaccess.metrics
+import msaccess.pipeline
+import msaccess.largefields
+import msaccess.denormalize
+import msaccess.mirror
 import locale
 import codecs
 import sys
+import os
+import time
+import shutil
+import tempfile
 import bson.json_util
-from collections import defaultdict
 
 OUTPUT_ENCODING = "utf-8"
 INPUT_ENCODING = "utf-8"
@@ -30,7 +42,85 @@ def open_input_stream(filename):
 def read_yaml(filename):
     with open_input_stream(filename) as f:
         import yaml
-        return yaml.load(f.read())
+        return yaml.safe_load(f.read())
+
+
+def make_metrics(metrics_output=None, progress=False):
+    """Metrics for --metrics-output and --progress, or one that counts nothing."""
+    if metrics_output or progress:
+        return msaccess.metrics.Metrics(progress=progress)
+    return msaccess.metrics.NULL_METRICS
+
+
+def write_metrics(metrics, metrics_output=None, metrics_format=None):
+    if metrics_output:
+        metrics.write(metrics_output, metrics_format)
+
+
+def total_rows_for_progress(db, table_name, progress):
+    """Row count for the ETA; only counted when progress is shown."""
+    return db.count_rows(table_name) if progress else None
+
+
+def run_pipeline(batches, stages, metrics=msaccess.metrics.NULL_METRICS, queue_size=4):
+    """Fetch batches on this thread and pass them through stages, each on its own thread.
+
+    stages is a list of (name, func). Queue depths and stage utilization
+    are kept in metrics.
+    """
+    pipeline = msaccess.pipeline.Pipeline([msaccess.pipeline.Stage(name, func) for name, func in stages],
+                                          queue_size)
+    pipeline.run(batches)
+    metrics.record_pipeline(pipeline.stats())
+    return pipeline
+
+
+def make_large_field_policy(large_fields, large_field_directory=None, mongodb=None):
+    """Policy for memo and OLE object columns: inline, skip, hash, file or gridfs (also called chunks)."""
+    if not large_fields:
+        return None
+    if large_fields == "file":
+        if not large_field_directory:
+            raise Exception("--large-fields file requires --large-field-directory")
+        return msaccess.largefields.ExternalFilePolicy(large_field_directory)
+    if large_fields in ("gridfs", "chunks"):
+        if mongodb is None:
+            raise Exception("--large-fields {0} is only for export_mongodb".format(large_fields))
+        return msaccess.largefields.ChunkCollectionPolicy(mongodb["fs.chunks"], mongodb["fs.files"])
+    return msaccess.largefields.make_policy(large_fields)
+
+
+def iterate_table_batches(db, table_name, batch_size, large_field_policy=None):
+    """Batches of rows; with a large field policy, long columns are read chunk by chunk."""
+    if large_field_policy is None:
+        return db.iterate_batches(table_name, batch_size)
+    return msaccess.pipeline.chunked(db.iterate_large_fields(table_name, large_field_policy), batch_size)
+
+
+def translate_stage(translator, metrics):
+    def translate(rows):
+        with metrics.timer("translate", rows=len(rows)):
+            return [translator.translate_row(fields) for fields in rows]
+    return translate
+
+
+def json_array_stage(metrics):
+    """Serialize batches of documents as consecutive parts of one json array."""
+    separators = iter([""])
+
+    def serialize(documents):
+        with metrics.timer("serialize", rows=len(documents)) as timer:
+            text = next(separators, ", ") + ", ".join([bson.json_util.dumps(document) for document in documents])
+            timer.bytes = len(text)
+        return text
+    return serialize
+
+
+def write_stage(of, metrics):
+    def write(text):
+        with metrics.timer("sink", bytes=len(text)):
+            of.write(text)
+    return write
 
 
 def dump_yaml(filename, data):
@@ -70,10 +160,46 @@ def columns(mdb):
         print("/".join([table_name,field_name]))
 
 
+class IdentityTranslation(dict):
+    """Translation dictionary that keeps every name as it is."""
+    def __missing__(self, key):
+        return key
+
+
 def translate_database_entry(table_name, table_entry, translation_dict):
     return translation_dict[table_name+"/"+table_entry].split("/")[1]
 
 
+def find_original_table_name(db, table_name, translation_dict):
+    """The table whose translated name is table_name."""
+    original_table_names = [t_name for t_name in db.get_table_names() if translation_dict[t_name] == table_name]
+    if len(original_table_names) != 1:
+        raise Exception("not found table: {0}".format(table_name))
+    return original_table_names[0]
+
+
+class TableTranslator:
+    """Translate rows of one table.
+
+    Column names are looked up in the translation dictionary once, when
+    the translator is built, instead of once per cell.
+    """
+    def __init__(self, table_name, field_names, translation_dict):
+        self.table_name = table_name
+        self.translated_table_name = translation_dict[table_name]
+        self.original_field_names = list(field_names)
+        self.field_names = [translate_database_entry(table_name, field_name, translation_dict)
+                            for field_name in self.original_field_names]
+
+    @classmethod
+    def from_db(cls, db, table_name, translation_dict):
+        return cls(table_name, db.get_field_names(table_name), translation_dict)
+
+    def translate_row(self, fields):
+        """Make a translated document from a positional row."""
+        return dict(zip(self.field_names, fields))
+
+
 def translate_mongo_document(table_name, doc, translation_dict):
     translated_entry = {}
     for doc_key, doc_value in doc.items():
@@ -85,11 +211,14 @@ def translate_database(db, translation_dict):
     ret = {}
     for table_key, table_value in db.items():
         translated_table = translation_dict[table_key]
+        translated_keys = {}
         table_data = []
         for table_entry in table_value:
             translated_entry = {}
             for entry_key, entry_value in table_entry.items():
-                translated_entry[translate_database_entry(table_key, entry_key, translation_dict)] = entry_value
+                if entry_key not in translated_keys:
+                    translated_keys[entry_key] = translate_database_entry(table_key, entry_key, translation_dict)
+                translated_entry[translated_keys[entry_key]] = entry_value
             table_data.append(translated_entry)
         ret[translated_table] = table_data
     return ret
@@ -109,102 +238,628 @@ def list_tables(mdb=None, translation_words=None):
         print("{0}: {1}".format(translation_dict[table_name], table_name))
 
 @begin.subcommand
-def dump_table(table_name=None, output="-", mdb=None, translation_words=None):
+@begin.convert(commit_every=int, batch_size=int, queue_size=int)
+def dump_table(table_name=None, output="-", mdb=None, translation_words=None, checkpoint=None, commit_every=10000,
+               compression=None, batch_size=5000, metrics_output=None, metrics_format=None, progress=False,
+               queue_size=4, large_fields=None, large_field_directory=None):
     """Dump a table as json.
+
+    One document is written per line, in the same format as
+    bson.json_util.dumps. Rows are fetched batch_size at a time on the
+    main thread, while earlier batches are encoded and written on two
+    more threads; at most --queue-size batches wait between two stages.
+    With --compression gzip or
+    zstd (or an output file ending in .gz or .zst) the output is
+    compressed; zstd needs the zstandard package.
+
+    With --checkpoint FILE, progress is recorded in FILE every
+    commit_every rows, by the last written primary key and the output
+    offset. Running the same command again after a failure truncates
+    the output to the last checkpoint and continues from there. The
+    table needs a single column primary key, and the output cannot be
+    compressed.
+
+    Memo and OLE object columns are normally read whole. With
+    --large-fields they are read chunk by chunk instead and replaced by
+    {"size", "sha1"} (hash), by None (skip), or written to
+    --large-field-directory and replaced by their path there (file).
+
+    With --metrics-output FILE ("-" for stderr), rows, bytes and seconds
+    per stage and the number of ADO calls are written to FILE at the end,
+    as json or, with --metrics-format prometheus or a .prom file name, in
+    the Prometheus text format. With --progress, progress and an ETA
+    are printed to stderr.
     """
-    db = msaccess.MsAccessDb(mdb)
-    db_data = dict()
+    metrics = make_metrics(metrics_output, progress)
+    db = msaccess.MsAccessDb(mdb, metrics=metrics)
 
     translation_dict = {}
     if translation_words:
         translation_dict = read_yaml(translation_words)
 
-    original_table_names = [t_name for t_name in db.get_table_names() if translation_dict[t_name] == table_name ]
-    
-    if len(original_table_names) != 1:
-        raise Exception("not found table: {0}".format(table_name))
-    
-    original_table_name = original_table_names[0]
+    original_table_name = find_original_table_name(db, table_name, translation_dict)
+
+    print("extract {0}".format(table_name), file=sys.stderr)
+    translator = TableTranslator.from_db(db, original_table_name, translation_dict)
+    writer_options = (translator.field_names, db.schema.field_types(original_table_name))
+
+    large_field_policy = make_large_field_policy(large_fields, large_field_directory)
+
+    if checkpoint:
+        if output == "-":
+            raise Exception("--checkpoint requires an output file")
+        if large_field_policy:
+            raise Exception("--checkpoint cannot be combined with --large-fields")
+        if compression or output.endswith((".gz", ".zst")):
+            raise Exception("--checkpoint cannot be combined with --compression")
+        table_checkpoint = msaccess.checkpoint.Checkpoint(checkpoint, original_table_name)
+        writer = msaccess.ndjson.NdjsonWriter(None, *writer_options)
+        with metrics.table(table_name, total_rows_for_progress(db, original_table_name, progress)):
+            msaccess.checkpoint.write_lines_with_checkpoint(
+                db, original_table_name, output, table_checkpoint, writer.encode_row, commit_every, OUTPUT_ENCODING)
+        table_checkpoint.clear()
+        write_metrics(metrics, metrics_output, metrics_format)
+        return
+
+    with msaccess.ndjson.open_output(output, compression) as of:
+        writer = msaccess.ndjson.NdjsonWriter(of, *writer_options, encoding=OUTPUT_ENCODING)
+
+        def serialize(rows):
+            with metrics.timer("serialize", rows=len(rows)) as timer:
+                data = writer.encode_rows(rows)
+                timer.bytes = len(data)
+            return data, len(rows)
+
+        def sink(batch):
+            data, rows = batch
+            with metrics.timer("sink", rows=rows, bytes=len(data)):
+                writer.write(data, rows)
+
+        with metrics.table(table_name, total_rows_for_progress(db, original_table_name, progress)):
+            run_pipeline(iterate_table_batches(db, original_table_name, batch_size, large_field_policy),
+                         [("serialize", serialize), ("sink", sink)], metrics, queue_size)
+    write_metrics(metrics, metrics_output, metrics_format)
+
+
+def write_table_json_array(of, db, table_name, translation_dict, metrics=msaccess.metrics.NULL_METRICS,
+                           batch_size=1000, queue_size=4):
+    """Write one table as a json array; translation, serialization and writing run on their own threads."""
+    translator = TableTranslator.from_db(db, table_name, translation_dict)
+    of.write("[")
+    run_pipeline(db.iterate_batches(table_name, batch_size),
+                 [("translate", translate_stage(translator, metrics)),
+                  ("serialize", json_array_stage(metrics)),
+                  ("sink", write_stage(of, metrics))], metrics, queue_size)
+    of.write("]")
+
+
+def dump_table_fragment(db, table_name, translation_dict, directory):
+    """Write one table as a json array into a file in directory."""
+    fd, path = tempfile.mkstemp(suffix=".json", dir=directory)
+    os.close(fd)
+    with codecs.open(path, "w", OUTPUT_ENCODING) as of:
+        write_table_json_array(of, db, table_name, translation_dict)
+    return path
 
-    db_data = dict()
-    table_data = []
 
-    print("extract {0}".format(table_name))
-    field_names = [field_name for field_name in db.get_field_names(original_table_name)]
-    for fields in db.iterate_query(original_table_name):
-        fields = [msaccess.MsAccessDb.regulate_value_for_mongodb(field) for field in fields]
-        table_data.append(dict(zip(field_names, fields)))
-        
-    db_data[original_table_name] = table_data
-
-    print("translate...")
-    db_data = translate_database(db_data, translation_dict)
-    table_data = db_data[table_name]
-
-    print("write out...")
-    with open_output_stream(output) as of:
-        for document in table_data:
-            print(bson.json_util.dumps(document), file=of)
-        
 @begin.subcommand
-def dump_mongodb_json(output=None, mdb=None, translation_words=None):
+@begin.convert(jobs=int, queue_size=int)
+def dump_mongodb_json(output=None, mdb=None, translation_words=None, jobs=1, metrics_output=None,
+                      metrics_format=None, progress=False, queue_size=4):
     """Dump database as json.
+
+    Rows are fetched in batches on the main thread and translated,
+    serialized and written out on one thread per stage, with at most
+    --queue-size batches waiting between two stages, so memory usage
+    does not grow with the size of the database. With --jobs N, tables
+    are dumped by N worker processes into temporary files, largest table
+    first, and then joined in table order.
+
+    --metrics-output, --metrics-format and --progress are as for
+    dump_table. With --jobs, work done in the worker processes is not
+    counted.
     """
-    db = msaccess.MsAccessDb(mdb)
-    db_data = dict()
+    metrics = make_metrics(metrics_output, progress)
+    db = msaccess.MsAccessDb(mdb, metrics=metrics)
 
     translation_dict = {}
     if translation_words:
         translation_dict = read_yaml(translation_words)
 
-    for table_name in db.get_table_names():
-        print("extract {0}...".format(translation_dict[table_name]))
-        
-        table_data = []
+    table_names = db.get_table_names()
+
+    with tempfile.TemporaryDirectory() as directory:
+        fragments = None
+        if jobs > 1:
+            print("extract {0} tables with {1} jobs...".format(len(table_names), jobs), file=sys.stderr)
+            fragments = msaccess.parallel.map_tables(
+                mdb, table_names, dump_table_fragment, jobs, args=(translation_dict, directory))
+
+        with open_output_stream(output) as of:
+            of.write("{")
+            for i, table_name in enumerate(table_names):
+                translated_table_name = translation_dict[table_name]
+                if i:
+                    of.write(", ")
+                of.write(bson.json_util.dumps(translated_table_name))
+                of.write(": ")
+                if fragments:
+                    with codecs.open(fragments[i], "r", OUTPUT_ENCODING) as f:
+                        shutil.copyfileobj(f, of)
+                else:
+                    print("extract {0}...".format(translated_table_name), file=sys.stderr)
+                    with metrics.table(translated_table_name, total_rows_for_progress(db, table_name, progress)):
+                        write_table_json_array(of, db, table_name, translation_dict, metrics,
+                                               queue_size=queue_size)
+            of.write("}")
+    write_metrics(metrics, metrics_output, metrics_format)
+
+class InsertStage:
+    """Pipeline sink inserting each batch of documents with one insert_many.
+
+    count is the number of documents inserted so far.
+    """
 
-        field_names = [field_name for field_name in db.get_field_names(table_name)]
-        for fields in db.iterate_query(table_name):
-            fields = [msaccess.MsAccessDb.regulate_value_for_mongodb(field) for field in fields]
-            table_data.append(dict(zip(field_names, fields)))
-        db_data[table_name] = table_data
+    def __init__(self, collection, ordered=True, metrics=msaccess.metrics.NULL_METRICS):
+        self.collection = collection
+        self.ordered = ordered
+        self.metrics = metrics
+        self.count = 0
 
-    print("translate...")
+    def __call__(self, documents):
+        with self.metrics.timer("sink", rows=len(documents)):
+            self.collection.insert_many(documents, ordered=self.ordered)
+        self.count += len(documents)
 
-    db_data = translate_database(db_data, translation_dict)
 
-    print("write out...")
-    with open_output_stream(output) as of:
-        of.write(bson.json_util.dumps(db_data))
+def export_table_to_collection(db, table_name, collection, translation_dict, batch_size, ordered,
+                               metrics=msaccess.metrics.NULL_METRICS, queue_size=4, large_field_policy=None):
+    """Insert a table batch_size documents at a time; translating and inserting run on their own threads."""
+    started = time.time()
+    translator = TableTranslator.from_db(db, table_name, translation_dict)
+    insert = InsertStage(collection, ordered, metrics)
+    run_pipeline(iterate_table_batches(db, table_name, batch_size, large_field_policy),
+                 [("translate", translate_stage(translator, metrics)), ("sink", insert)], metrics, queue_size)
+    return insert.count, max(time.time() - started, 1e-9)
+
+
+def export_table_with_checkpoint(db, table_name, collection, translation_dict, batch_size, ordered, checkpoint,
+                                 metrics=msaccess.metrics.NULL_METRICS, queue_size=4):
+    """Export a table in primary key order, recording the last inserted key.
+
+    When resuming, documents past the checkpoint (from a batch that may
+    have been only partly written) are deleted before continuing. The
+    checkpoint is saved by the inserting thread after each insert_many.
+    """
+    started = time.time()
+    translator = TableTranslator.from_db(db, table_name, translation_dict)
+    key_column = msaccess.checkpoint.single_key_column(db, table_name)
+    key_index = translator.original_field_names.index(key_column)
+    key_field = translator.field_names[key_index]
+
+    state = checkpoint.load()
+    if state:
+        after, count = state["last_key"], state["rows"]
+        if after is not None:
+            collection.delete_many({key_field: {"$gt": after}})
+        else:
+            collection.drop()
+    else:
+        after, count = None, 0
+        collection.drop()
+
+    translate = translate_stage(translator, metrics)
+    insert_documents = InsertStage(collection, ordered, metrics)
+
+    def translate_keyed(rows):
+        return translate(rows), rows[-1][key_index]
+
+    def insert(batch):
+        nonlocal after, count
+        documents, last_key = batch
+        insert_documents(documents)
+        count += len(documents)
+        after = last_key
+        checkpoint.save(after, count)
+
+    run_pipeline(msaccess.pipeline.chunked(db.iterate_keyed(table_name, key_column, after), batch_size),
+                 [("translate", translate_keyed), ("sink", insert)], metrics, queue_size)
+    checkpoint.save(after, count, done=True)
+    return count, max(time.time() - started, 1e-9)
+
+
+def translated_key_fields(translator, key_columns):
+    return [translator.field_names[translator.original_field_names.index(column)] for column in key_columns]
+
+
+def make_delta_state(state_directory, mdb, *consumer):
+    """DeltaState of mdb for one consumer of its changes (an output file, or a mongodb host and database)."""
+    return msaccess.delta.DeltaState(state_directory, [os.path.abspath(mdb)] + list(consumer))
+
+
+def export_table_changes_to_collection(db, table_name, collection, translation_dict, batch_size, ordered,
+                                       state, metrics=msaccess.metrics.NULL_METRICS, queue_size=4):
+    """Apply only the rows changed since the last run, as upserts and deletes.
+
+    On the first run for a table the collection is reloaded from scratch.
+    """
+    from pymongo import ReplaceOne, DeleteOne
+
+    started = time.time()
+    translator = TableTranslator.from_db(db, table_name, translation_dict)
+    delta, changes = msaccess.delta.iterate_table_changes(db, table_name, state)
+    key_fields = translated_key_fields(translator, delta.key_columns)
+    if delta.first_run:
+        collection.drop()
+
+    count = 0
+
+    def make_requests(batch):
+        requests = []
+        with metrics.timer("translate", rows=len(batch)):
+            for change in batch:
+                key = dict(zip(key_fields, change.key))
+                if change.operation == msaccess.delta.DELETE:
+                    requests.append(DeleteOne(key))
+                else:
+                    requests.append(ReplaceOne(key, translator.translate_row(change.row), upsert=True))
+        return requests
+
+    def write(requests):
+        nonlocal count
+        with metrics.timer("sink", rows=len(requests)):
+            collection.bulk_write(requests, ordered=ordered)
+        count += len(requests)
+
+    run_pipeline(msaccess.pipeline.chunked(changes, batch_size),
+                 [("translate", make_requests), ("sink", write)], metrics, queue_size)
+
+    state.save(table_name, delta.key_columns, delta.rows)
+    return count, max(time.time() - started, 1e-9)
+
+
+def export_table_job(db, table_name, host, output, translation_dict, batch_size, ordered, delta_state=None,
+                     queue_size=4):
+    """Export one table from a worker process with its own mongodb client."""
+    import pymongo
+
+    with pymongo.MongoClient(host) as con:
+        collection = con[output][translation_dict[table_name]]
+        if delta_state:
+            return export_table_changes_to_collection(
+                db, table_name, collection, translation_dict, batch_size, ordered, delta_state,
+                queue_size=queue_size)
+        return export_table_to_collection(db, table_name, collection, translation_dict, batch_size, ordered,
+                                          queue_size=queue_size)
+
+
+def print_throughput(translated_table_name, count, elapsed, file=None):
+    file = file or sys.stdout
+    print("{0}: {1} documents in {2:.1f} sec ({3:.0f} docs/sec)".format(
+        translated_table_name, count, elapsed, count / elapsed), file=file)
+    file.flush()
+
 
 @begin.subcommand
-def export_mongodb(output, mdb, translation_words=None):
+@begin.convert(batch_size=int, jobs=int, queue_size=int)
+def export_mongodb(output, mdb, translation_words=None, host="localhost", batch_size=1000, ordered=True, jobs=1,
+                   incremental=False, state_directory=".msaccess_state", checkpoint_directory=None,
+                   metrics_output=None, metrics_format=None, progress=False, queue_size=4, large_fields=None,
+                   large_field_directory=None):
     """export to mongodb.
+
+    Documents are written with insert_many, batch_size at a time. Pass
+    --no-ordered to let the server continue past failed documents.
+    Rows are fetched on the main thread while earlier batches are
+    translated and inserted on their own threads, with at most
+    --queue-size batches waiting between two stages.
+    With --jobs N, tables are exported by N worker processes, largest
+    table first.
+
+    With --incremental the database is not dropped. Only rows that
+    changed since the last run are written, as upserts and deletes keyed
+    on the primary key. Row hashes are kept in state_directory, apart
+    for each mdb and each host and database.
+
+    With --checkpoint-directory DIR, each table is exported in primary
+    key order and the last inserted key is recorded in DIR after every
+    batch. If DIR still holds checkpoints from a failed run, the database
+    is kept, finished tables are skipped and the others continue after
+    their last key.
+
+    --metrics-output, --metrics-format and --progress are as for
+    dump_table. With --jobs, work done in the worker processes is not
+    counted.
+
+    --large-fields is as for dump_table, plus gridfs, which writes memo
+    and OLE object values to the fs.chunks and fs.files collections in
+    GridFS layout and replaces them by {"files_id", "length", "sha1"}.
+    It cannot be combined with --incremental, --checkpoint-directory or
+    --jobs.
     """
     import pymongo
 
-    db = msaccess.MsAccessDb(mdb)
-    db_data = dict()
+    metrics = make_metrics(metrics_output, progress)
+    db = msaccess.MsAccessDb(mdb, metrics=metrics)
 
-    with pymongo.Connection("localhost") as con:
-        con.drop_database(output)
+    if translation_words:
+        translation_dict = read_yaml(translation_words)
+    else:
+        translation_dict = IdentityTranslation()
+
+    table_names = db.get_table_names()
+    delta_state = None
+    if incremental:
+        delta_state = make_delta_state(state_directory, mdb, "mongodb", host, output)
+
+    checkpoints = None
+    if checkpoint_directory:
+        if incremental or jobs > 1:
+            raise Exception("--checkpoint-directory cannot be combined with --incremental or --jobs")
+        checkpoints = msaccess.checkpoint.CheckpointStore(checkpoint_directory)
+    if large_fields and (incremental or checkpoints or jobs > 1):
+        raise Exception("--large-fields cannot be combined with --incremental, --checkpoint-directory or --jobs")
+
+    with pymongo.MongoClient(host) as con:
+        if checkpoints and checkpoints.exists():
+            print("resuming from {0}".format(checkpoint_directory))
+        elif not incremental:
+            con.drop_database(output)
         mongodb = con[output]
+        large_field_policy = make_large_field_policy(large_fields, large_field_directory, mongodb)
 
-        if translation_words:
-            translation_dict = read_yaml(translation_words)
-        else:
-            translation_dict = defaultdict(lambda x: x)
-
-        for table_name in db.get_table_names():
+        if jobs > 1:
+            print("exporting {0} tables with {1} jobs...".format(len(table_names), jobs))
+            sys.stdout.flush()
+            results = msaccess.parallel.map_tables(
+                mdb, table_names, export_table_job, jobs,
+                args=(host, output, translation_dict, batch_size, ordered, delta_state, queue_size))
+            for table_name, (count, elapsed) in zip(table_names, results):
+                print_throughput(translation_dict[table_name], count, elapsed)
+            write_metrics(metrics, metrics_output, metrics_format)
+            return
+
+        for table_name in table_names:
             translated_table_name = translation_dict[table_name]
-            collection = mongodb[translated_table_name]
-            field_names = [field_name for field_name in db.get_field_names(table_name)]
-            print("exporting {0}...", translated_table_name)
+            print("exporting {0}...".format(translated_table_name))
             sys.stdout.flush()
 
-            for fields in db.iterate_query(table_name):
-                fields = [msaccess.MsAccessDb.regulate_value_for_mongodb(field) for field in fields]
-                collection.insert(translate_mongo_document(table_name, dict(zip(field_names, fields)), translation_dict))
-                break
+            collection = mongodb[translated_table_name]
+            if checkpoints:
+                checkpoint = checkpoints.checkpoint(table_name)
+                state = checkpoint.load()
+                if state and state["done"]:
+                    print("{0}: already exported".format(translated_table_name))
+                    continue
+            with metrics.table(translated_table_name, total_rows_for_progress(db, table_name, progress)):
+                if checkpoints:
+                    count, elapsed = export_table_with_checkpoint(
+                        db, table_name, collection, translation_dict, batch_size, ordered, checkpoint, metrics,
+                        queue_size)
+                elif incremental:
+                    count, elapsed = export_table_changes_to_collection(
+                        db, table_name, collection, translation_dict, batch_size, ordered, delta_state, metrics,
+                        queue_size)
+                else:
+                    count, elapsed = export_table_to_collection(
+                        db, table_name, collection, translation_dict, batch_size, ordered, metrics, queue_size,
+                        large_field_policy)
+            print_throughput(translated_table_name, count, elapsed)
+
+        if checkpoints:
+            checkpoints.clear()
+    write_metrics(metrics, metrics_output, metrics_format)
+
+
+def make_relations(db, table_name, relations=None, depth=1):
+    """Relations to embed into table_name, from a yaml file or from the foreign keys."""
+    if relations:
+        return msaccess.denormalize.relations_from_config(read_yaml(relations), table_name)
+    return msaccess.denormalize.relations_from_foreign_keys(db.get_foreign_keys(), table_name, depth)
+
+
+def make_denormalizer(db, relation, translation_dict, batch_size, max_rows_in_memory, spill_directory):
+    """Denormalizer making translated documents; embedded arrays default to the translated table names."""
+    translators = {}
+    for table_relation in relation.walk():
+        translators[table_relation.table] = TableTranslator.from_db(db, table_relation.table, translation_dict)
+        if table_relation is not relation and not table_relation.name:
+            table_relation.name = translation_dict[table_relation.table]
+
+    def make_document(table_name, row):
+        return translators[table_name].translate_row(row)
+
+    return msaccess.denormalize.Denormalizer(db, relation, make_document, batch_size, max_rows_in_memory,
+                                             spill_directory)
+
+
+@begin.subcommand
+@begin.convert(depth=int, batch_size=int, max_rows_in_memory=int, queue_size=int)
+def export_denormalized(table_name, output, mdb, translation_words=None, relations=None, depth=1,
+                        host="localhost", output_format="mongodb", compression=None, batch_size=1000, ordered=True,
+                        max_rows_in_memory=1000000, spill_directory=None, metrics_output=None,
+                        metrics_format=None, progress=False, queue_size=4):
+    """Export a table with its related tables embedded as arrays.
+
+    Each related table is read once and indexed in memory by its join
+    columns, then table_name is read once and every document gets the
+    matching rows as arrays, instead of joining in Jet. Related tables
+    come from --relations FILE, a yaml file like
+
+        table: customer
+        embed:
+          - table: orders
+            as: Orders
+            join: {id: customer_id}
+            embed:
+              - table: order_items
+                join: {order_id: order_id}
+
+    with original table and column names (join maps parent columns to
+    child columns, as defaults to the translated table name). Without
+    it, tables referring to table_name by a foreign key are embedded,
+    down to --depth levels.
+
+    table_name is the translated name. Documents are inserted into the
+    collection of that name in database output, or with --output-format
+    json written to the file output ("-" for stdout) one per line, as
+    for dump_table. An index larger than --max-rows-in-memory rows is
+    kept in a temporary file in --spill-directory instead.
+
+    --metrics-output, --metrics-format and --progress are as for
+    dump_table.
+    """
+    metrics = make_metrics(metrics_output, progress)
+    db = msaccess.MsAccessDb(mdb, metrics=metrics)
+
+    if translation_words:
+        translation_dict = read_yaml(translation_words)
+    else:
+        translation_dict = IdentityTranslation()
+
+    original_table_name = find_original_table_name(db, table_name, translation_dict)
+    relation = make_relations(db, original_table_name, relations, depth)
+    for table_relation in relation.walk():
+        if table_relation is not relation:
+            print("embedding {0}".format(table_relation.table), file=sys.stderr)
+
+    with make_denormalizer(db, relation, translation_dict, batch_size, max_rows_in_memory,
+                           spill_directory) as denormalizer:
+        started = time.time()
+        denormalizer.build_indexes()
+        count = 0
+        with metrics.table(table_name, total_rows_for_progress(db, original_table_name, progress)):
+            if output_format == "json":
+                with msaccess.ndjson.open_output(output, compression) as of:
+                    def serialize(documents):
+                        nonlocal count
+                        count += len(documents)
+                        with metrics.timer("serialize", rows=len(documents)) as timer:
+                            data = "".join([bson.json_util.dumps(document) + "\n"
+                                            for document in documents]).encode(OUTPUT_ENCODING)
+                            timer.bytes = len(data)
+                        return data
+
+                    def write(data):
+                        with metrics.timer("sink", bytes=len(data)):
+                            of.write(data)
+
+                    run_pipeline(denormalizer.iterate_rows(),
+                                 [("join", denormalizer.embed_rows), ("serialize", serialize), ("sink", write)],
+                                 metrics, queue_size)
+            elif output_format == "mongodb":
+                import pymongo
+
+                with pymongo.MongoClient(host) as con:
+                    collection = con[output][table_name]
+                    collection.drop()
+                    insert = InsertStage(collection, ordered, metrics)
+                    run_pipeline(denormalizer.iterate_rows(),
+                                 [("join", denormalizer.embed_rows), ("sink", insert)], metrics, queue_size)
+                    count = insert.count
+            else:
+                raise Exception("unknown output format: {0}".format(output_format))
+    print_throughput(table_name, count, max(time.time() - started, 1e-9), sys.stderr)
+    write_metrics(metrics, metrics_output, metrics_format)
+
+
+@begin.subcommand
+def dump_changes(output="-", mdb=None, translation_words=None, state_directory=".msaccess_state"):
+    """Dump rows changed since the last run as a json lines change log.
+
+    Each line has the table, the operation (insert, update or delete),
+    the primary key and the new document. Row hashes are kept in
+    state_directory, apart for each mdb and output file; the first run
+    reports every row as an insert.
+    """
+    db = msaccess.MsAccessDb(mdb)
+
+    if translation_words:
+        translation_dict = read_yaml(translation_words)
+    else:
+        translation_dict = IdentityTranslation()
+
+    state = make_delta_state(state_directory, mdb, "changes", output if output == "-" else os.path.abspath(output))
+    with open_output_stream(output) as of:
+        for table_name in db.get_table_names():
+            translator = TableTranslator.from_db(db, table_name, translation_dict)
+            delta, changes = msaccess.delta.iterate_table_changes(db, table_name, state)
+            key_fields = translated_key_fields(translator, delta.key_columns)
+            count = 0
+            for change in changes:
+                document = translator.translate_row(change.row) if change.row is not None else None
+                print(bson.json_util.dumps({
+                    "table": translator.translated_table_name,
+                    "operation": change.operation,
+                    "key": dict(zip(key_fields, change.key)),
+                    "document": document}), file=of)
+                count += 1
+            of.flush()
+            state.save(table_name, delta.key_columns, delta.rows)
+            print("{0}: {1} changes".format(translator.translated_table_name, count), file=sys.stderr)
+
+
+@begin.subcommand
+@begin.convert(row_group_size=int)
+def export_parquet(output_directory, mdb, translation_words=None, table_name=None, row_group_size=65536,
+                   compression="snappy"):
+    """Export tables as parquet files, one file per table.
+
+    Rows are read row_group_size at a time and written as one row group,
+    so memory usage is bounded by the row group size.
+    """
+    db = msaccess.MsAccessDb(mdb)
+
+    if translation_words:
+        translation_dict = read_yaml(translation_words)
+    else:
+        translation_dict = IdentityTranslation()
+
+    os.makedirs(output_directory, exist_ok=True)
+    for original_table_name in db.get_table_names():
+        translator = TableTranslator.from_db(db, original_table_name, translation_dict)
+        if table_name and translator.translated_table_name != table_name:
+            continue
+        path = os.path.join(output_directory, translator.translated_table_name + ".parquet")
+        print("exporting {0}...".format(path))
+        sys.stdout.flush()
+        started = time.time()
+        count = db.export_parquet(original_table_name, path, row_group_size, translator.field_names, compression)
+        print_throughput(translator.translated_table_name, count, max(time.time() - started, 1e-9))
+
+
+@begin.subcommand
+@begin.convert(batch_size=int)
+def export_sqlite(output, mdb, table_name=None, indexes=None, full=False, batch_size=5000, metrics_output=None,
+                  metrics_format=None, progress=False):
+    """Copy tables into the SQLite file output, for running queries there.
+
+    Tables and columns keep their original names. Column types are
+    declared so that MsAccessDb(output, backend="sqlite") reads back the
+    same values, and primary keys are kept. --indexes FILE is a yaml
+    file of {table: [column, or list of columns]} to index as well.
+
+    Each table is written in one transaction with executemany. Running
+    again only writes rows that changed since the last run, compared by
+    a hash per primary key; tables are skipped if the database file has
+    the same modification time and size. Tables without a primary key,
+    tables whose columns changed, and all tables with --full are
+    copied again from scratch.
+
+    --metrics-output, --metrics-format and --progress are as for
+    dump_table.
+    """
+    metrics = make_metrics(metrics_output, progress)
+    db = msaccess.MsAccessDb(mdb, metrics=metrics)
+
+    table_names = [table_name] if table_name else None
+    with msaccess.mirror.Mirror(output, read_yaml(indexes) if indexes else None, batch_size) as mirror:
+        started = time.time()
+        written = mirror.refresh(db, table_names, full, metrics)
+        for name, count in written.items():
+            print("{0}: {1} rows written".format(name, count))
+        print("{0} rows written in {1:.1f} sec".format(sum(written.values()), time.time() - started))
+    write_metrics(metrics, metrics_output, metrics_format)
 
 
 @begin.subcommand
@@ -217,7 +872,7 @@ def export_schema(output=None, mdb=None, translation_words=None):
     if translation_words:
         translation_dict = read_yaml(translation_words)
     else:
-        translation_dict = defaultdict(lambda x: x)
+        translation_dict = IdentityTranslation()
 
     ret = {}
 
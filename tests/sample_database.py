@@ -0,0 +1,58 @@
+import sqlite3
+import datetime
+
+schema = """
+Create Table customer (
+    id Integer Primary Key,
+    name Text(50) Not Null,
+    joined DateTime,
+    balance Currency,
+    active YesNo
+);
+Create Table orders (
+    order_id Integer Primary Key,
+    customer_id Integer Not Null References customer (id),
+    amount Double,
+    note Memo
+);
+Create View rich_customer As Select * From customer Where balance > 100;
+"""
+
+
+def create_sample_database(path, customers=5, orders_per_customer=2):
+    """テスト用に Access っぽい型を持った SQLite のデータベースを作る"""
+    con = sqlite3.connect(path)
+    con.executescript(schema)
+    for i in range(1, customers + 1):
+        con.execute("Insert Into customer Values (?, ?, ?, ?, ?)",
+                    (i, "customer%d" % i, (datetime.datetime(2015, 1, 1, 12, 30) + datetime.timedelta(days=i - 1)).isoformat(" "),
+                     "%d.25" % (i * 50), i % 2))
+        for j in range(orders_per_customer):
+            order_id = i * 100 + j
+            con.execute("Insert Into orders Values (?, ?, ?, ?)",
+                        (order_id, i, order_id * 1.5, "note %d" % order_id))
+    con.commit()
+    con.close()
+    return path
+
+
+translation_words = {
+    "customer": "Customer",
+    "customer/id": "Customer/Id",
+    "customer/name": "Customer/Name",
+    "customer/joined": "Customer/JoinedAt",
+    "customer/balance": "Customer/Balance",
+    "customer/active": "Customer/IsActive",
+    "orders": "Order",
+    "orders/order_id": "Order/Id",
+    "orders/customer_id": "Order/CustomerId",
+    "orders/amount": "Order/Amount",
+    "orders/note": "Order/Note",
+}
+
+
+def create_translation_words(path):
+    import yaml
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(translation_words, f, allow_unicode=True)
+    return path
@@ -0,0 +1,62 @@
+from unittest import IsolatedAsyncioTestCase
+import os
+import asyncio
+import tempfile
+from msaccess.aio import AsyncMsAccessDb, map_databases
+from tests.sample_database import create_sample_database
+
+
+class TestAsyncMsAccessDb(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.mdbs = [create_sample_database(os.path.join(self.directory.name, "sample%d.db" % i), customers=i + 1)
+                     for i in range(4)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def test_iterate_query(self):
+        async with AsyncMsAccessDb(self.mdbs[3], backend="sqlite", batch_size=3) as db:
+            rows = [row async for row in db.iterate_query("orders")]
+            self.assertEqual(len(rows), 8)
+            self.assertEqual(rows[0][0], 100)
+            self.assertEqual(await db.get_table_names(), ["customer", "orders"])
+            self.assertEqual((await db.First("customer Where id = 2"))[1], "customer2")
+
+    async def test_backpressure(self):
+        async with AsyncMsAccessDb(self.mdbs[3], backend="sqlite", batch_size=1, prefetch=1) as db:
+            fetched = []
+            iterate_batches = db.db.iterate_batches
+
+            def counting_batches(*args):
+                for batch in iterate_batches(*args):
+                    fetched.append(batch)
+                    yield batch
+
+            db.db.iterate_batches = counting_batches
+            rows = db.iterate_query("orders")
+            await rows.__anext__()
+            await asyncio.sleep(0.05)
+            # 受け取った 1 つ、queue の 1 つ、queue に入るのを待っている 1 つ
+            self.assertLessEqual(len(fetched), 3)
+            await rows.aclose()
+
+    async def test_error(self):
+        async with AsyncMsAccessDb(self.mdbs[0], backend="sqlite") as db:
+            with self.assertRaises(Exception):
+                [row async for row in db.iterate_query("missing_table")]
+
+    async def test_map_databases(self):
+        running = []
+        peak = []
+
+        async def count_orders(db):
+            running.append(db)
+            peak.append(len(running))
+            count = len([row async for row in db.iterate_query("orders")])
+            running.remove(db)
+            return count
+
+        counts = await map_databases(self.mdbs, count_orders, concurrency=2, backend="sqlite")
+        self.assertEqual(counts, [2, 4, 6, 8])
+        self.assertLessEqual(max(peak), 2)
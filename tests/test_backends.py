@@ -0,0 +1,82 @@
+from unittest import TestCase
+import os
+import datetime
+import tempfile
+from unittest import mock
+import msaccess
+from msaccess.backends import get_backend, SqliteBackend
+from tests.sample_database import create_sample_database
+
+
+class TestSqliteBackend(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = create_sample_database(os.path.join(self.directory.name, "sample.db"))
+        self.db = msaccess.MsAccessDb(path, backend="sqlite")
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_get_backend(self):
+        self.assertIsInstance(get_backend("sqlite"), SqliteBackend)
+        self.assertRaises(Exception, get_backend, "unknown")
+
+    def test_get_schema_names(self):
+        self.assertEqual(self.db.get_table_names(), ["customer", "orders"])
+        self.assertEqual(self.db.get_schema_names("VIEW"), ["rich_customer"])
+
+    def test_get_field_names(self):
+        self.assertEqual(self.db.get_field_names("orders"), ["order_id", "customer_id", "amount", "note"])
+
+    def test_get_easy_schema(self):
+        schema = self.db.GetEasySchema("customer")
+        self.assertEqual(schema["joined"]["Type"], "adDate")
+        self.assertEqual(schema["balance"]["Type"], "adCurrency")
+        self.assertFalse(schema["name"]["IsNullable"])
+
+    def test_iterate_query(self):
+        rows = list(self.db.iterate_query("customer"))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0], [1, "customer1", datetime.datetime(2015, 1, 1, 12, 30), 50.25, True])
+        self.assertEqual(list(self.db.iterate_query("customer", batch_size=2)), rows)
+
+    def test_query_definitions(self):
+        self.db.CreateQueryDefinition("big_orders", "Select * From orders Where amount > 200")
+        self.assertTrue(self.db.HasProcedure("big_orders"))
+        self.assertTrue(self.db.HasView("rich_customer"))
+        self.assertEqual(self.db.GetQueryDefinitionNames(), ["big_orders", "rich_customer"])
+        self.db.DeleteQueryDefinition("big_orders")
+        self.assertFalse(self.db.HasProcedure("big_orders"))
+
+    def test_query_definition_stored_as_view(self):
+        # Jet は引数のない Select を Procedures に追加してもビューとして保存する
+        self.assertEqual(self.db.GetViewNames(), ["rich_customer"])
+        cat = self.db.cat
+
+        def append_view(name, command):
+            cat.execute("Create View [%s] As %s" % (name, command.CommandText))
+
+        with mock.patch.object(cat.Procedures, "append", append_view):
+            self.db.CreateQueryDefinition("big_orders", "Select * From orders Where amount > 200")
+        self.assertTrue(self.db.HasView("big_orders"))
+        self.assertFalse(self.db.HasProcedure("big_orders"))
+
+    def test_query_definition_index(self):
+        self.assertEqual(self.db.GetProcedureNames(), [])
+        self.db.CreateQueryDefinition("big_orders", "Select * From orders Where amount > 200")
+        self.assertIn("big_orders", self.db.procedure_index)
+        self.assertEqual(self.db.GetQueryDefinitionObject("big_orders").Command.CommandText,
+                         "Select * From orders Where amount > 200")
+
+        # 他の接続で追加されたものは invalidate するまで見えない
+        other = msaccess.MsAccessDb(self.db.db_name, backend="sqlite")
+        other.CreateQueryDefinition("small_orders", "Select * From orders Where amount < 200")
+        other.close()
+        self.assertFalse(self.db.HasProcedure("small_orders"))
+        self.db.invalidate_query_definitions()
+        self.assertTrue(self.db.HasProcedure("small_orders"))
+
+        self.db.DeleteQueryDefinition("rich_customer")
+        self.assertEqual(self.db.GetViewNames(), [])
+        self.assertRaises(Exception, self.db.GetQueryDefinitionObject, "rich_customer")
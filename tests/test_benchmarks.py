@@ -0,0 +1,38 @@
+from unittest import TestCase
+import decimal
+import datetime
+import msaccess
+from benchmarks.synthetic import SyntheticTable, SyntheticBackend, parse_mix, columnMixes
+from benchmarks.bench_pipeline import run_stages
+
+
+class TestSyntheticTable(TestCase):
+    def test_values_match_types(self):
+        table = SyntheticTable("sample", "adInteger,adCurrency,adDate,adVarWChar", 10)
+        self.assertEqual(table.types, [3, 6, 7, 202])
+        self.assertEqual(table.rows[3][:3], (3, table.rows[3][1], datetime.datetime(2015, 1, 1, 0, 3, 3)))
+        self.assertIsInstance(table.rows[3][1], decimal.Decimal)
+
+    def test_unknown_type(self):
+        with self.assertRaises(Exception):
+            parse_mix("adIDispatch")
+
+    def test_backend(self):
+        table = SyntheticTable("sample", "all", 7, null_ratio=0.5)
+        with msaccess.MsAccessDb("sample", backend=SyntheticBackend([table])) as db:
+            self.assertEqual(db.get_table_names(), ["sample"])
+            self.assertEqual(db.schema.field_types("sample"), columnMixes["all"])
+            self.assertEqual(db.get_primary_key("sample"), [table.field_names[0]])
+            rows = [row for block in db.iterate_batches("sample", 3) for row in block]
+            self.assertEqual(rows, list(db.iterate_query("sample")))
+            self.assertEqual(len(rows), 7)
+            self.assertNotIn(None, [row[0] for row in rows])
+
+
+class TestBenchPipeline(TestCase):
+    def test_every_stage_sees_every_row(self):
+        results = run_stages(50, "mixed", 0.2, batch_size=20, repeat=1)
+        self.assertEqual(len(results), 11)
+        for name, count, elapsed, peak in results:
+            self.assertEqual(count, 50, name)
+            self.assertGreaterEqual(peak, 0)
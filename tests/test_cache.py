@@ -0,0 +1,126 @@
+from unittest import TestCase
+import os
+import sqlite3
+import tempfile
+import msaccess
+from msaccess.cache import QueryCache, normalize_sql, cache_key, is_select
+from tests.sample_database import create_sample_database
+
+
+class TestNormalizeSql(TestCase):
+    def test_normalize(self):
+        self.assertEqual(normalize_sql("Select  *\n From [My Table]  Where name = 'A  b';"),
+                         "select * from [My Table] where name = 'A  b'")
+        self.assertEqual(normalize_sql("select * from t where d = #2015/01/01#"),
+                         normalize_sql("SELECT *  FROM t WHERE d = #2015/01/01#;"))
+        self.assertNotEqual(cache_key("select ?", [1]), cache_key("select ?", [2]))
+
+    def test_is_select(self):
+        self.assertTrue(is_select("  (Select Sum(amount) From orders)"))
+        self.assertFalse(is_select("Update orders Set amount = 0"))
+        self.assertFalse(is_select("Select * Into archive From orders"))
+        self.assertTrue(is_select("Select [Into], name From t Where name = ' into '"))
+
+
+class TestQueryCache(TestCase):
+    def test_lru_by_entries_and_bytes(self):
+        cache = QueryCache(max_entries=2)
+        cache.put("a", [[1]])
+        cache.put("b", [[2]])
+        cache.get("a")
+        cache.put("c", [[3]])
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), [(1,)])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+        cache = QueryCache(max_bytes=200)
+        cache.put("big", [["x" * 500]])
+        self.assertIsNone(cache.get("big"))
+
+    def test_ttl(self):
+        cache = QueryCache(ttl=10)
+        cache.put("a", [[1]])
+        cache.entries["a"].created -= 11
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expired"], 1)
+
+    def test_large_results_are_not_kept(self):
+        cache = QueryCache(max_rows=3)
+        self.assertEqual(list(cache.iterate("a", lambda: iter([[i] for i in range(5)]))), [[i] for i in range(5)])
+        self.assertEqual(list(cache.iterate("b", lambda: iter([[1], [2]]))), [[1], [2]])
+        self.assertEqual(list(cache.entries), ["b"])
+
+    def test_disk_tier(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = QueryCache(directory=directory)
+            cache.check((1.0, 10))
+            cache.put("a", [[1, "x"], [2, None]])
+            cache.put("empty", [])
+
+            cache = QueryCache(directory=directory)
+            cache.check((1.0, 10))
+            self.assertEqual(cache.get("a"), [(1, "x"), (2, None)])
+            self.assertEqual(cache.get("empty"), [])
+            self.assertEqual(cache.stats()["disk_hits"], 2)
+
+            cache = QueryCache(directory=directory)
+            cache.check((2.0, 10))
+            self.assertIsNone(cache.get("a"))
+
+            cache.invalidate()
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_disk_size_limit(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = QueryCache(directory=directory, max_disk_bytes=300)
+            for i in range(10):
+                cache.put("key%d" % i, [[os.urandom(50)]])
+            self.assertLessEqual(cache.disk_bytes, 300)
+            self.assertLessEqual(sum(os.path.getsize(os.path.join(directory, name))
+                                     for name in os.listdir(directory)), 300)
+
+
+class TestResultCacheOnDb(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.mdb = create_sample_database(os.path.join(self.directory.name, "sample.db"))
+        self.metrics = msaccess.metrics.Metrics()
+        self.db = msaccess.MsAccessDb(self.mdb, backend="sqlite", metrics=self.metrics, result_cache=True)
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def executions(self):
+        return self.metrics.com_calls.get("Execute", 0)
+
+    def test_first_is_cached(self):
+        total = self.db.First("(Select Sum(amount) From orders)")
+        self.assertEqual(self.db.First("(select sum(amount)  from orders)"), total)
+        self.assertEqual(self.executions(), 1)
+        self.assertEqual(self.db.result_cache.stats()["hits"], 1)
+
+    def test_prepared_is_cached_per_parameters(self):
+        self.assertEqual(self.db.first_prepared("Select name From customer Where id = ?", [1]), ["customer1"])
+        self.assertEqual(self.db.first_prepared("Select name From customer Where id = ?", [2]), ["customer2"])
+        self.assertEqual(self.db.first_prepared("Select name From customer Where id = ?", [1]), ["customer1"])
+        self.assertEqual(self.db.result_cache.stats()["misses"], 2)
+
+    def test_invalidated_when_file_changes(self):
+        self.assertEqual(len(list(self.db.iterate_query("orders"))), 10)
+        con = sqlite3.connect(self.mdb)
+        con.execute("Delete From orders Where order_id = 100")
+        con.commit()
+        con.close()
+        stat = os.stat(self.mdb)
+        os.utime(self.mdb, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(len(list(self.db.iterate_query("orders"))), 9)
+        self.assertEqual(self.db.result_cache.stats()["invalidations"], 1)
+
+    def test_invalidated_by_query_definitions_and_updates(self):
+        list(self.db.iterate_query("customer"))
+        self.db.CreateQueryDefinition("all_orders", "Select * From orders")
+        self.assertEqual(len(self.db.result_cache.entries), 0)
+        list(self.db.iterate_query("customer"))
+        self.db.execute_query("Update customer Set name = 'x' Where id = 1")
+        self.assertEqual(self.db.First("(Select name From customer Where id = 1)"), ["x"])
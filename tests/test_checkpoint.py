@@ -0,0 +1,70 @@
+from unittest import TestCase
+import os
+import json
+import decimal
+import datetime
+import tempfile
+import msaccess
+from msaccess.checkpoint import Checkpoint, write_lines_with_checkpoint
+from tests.sample_database import create_sample_database
+
+
+class Interrupted(Exception):
+    pass
+
+
+class TestCheckpoint(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = msaccess.MsAccessDb(
+            create_sample_database(self.path("sample.db"), customers=10), backend="sqlite")
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_save_and_load(self):
+        checkpoint = Checkpoint(self.path("state/customer.checkpoint"), "customer")
+        self.assertIsNone(checkpoint.load())
+        checkpoint.save(datetime.datetime(2015, 1, 2), 10, 300)
+        state = checkpoint.load()
+        self.assertEqual(state["last_key"], datetime.datetime(2015, 1, 2))
+        self.assertEqual((state["rows"], state["offset"], state["done"]), (10, 300, False))
+        self.assertRaises(Exception, Checkpoint(checkpoint.path, "orders").load)
+        checkpoint.save(decimal.Decimal("12.50"), 11, 330)
+        self.assertEqual(checkpoint.load()["last_key"], decimal.Decimal("12.50"))
+
+    def test_iterate_keyed(self):
+        keys = [row[0] for row in self.db.iterate_keyed("orders", "order_id", after=501)]
+        self.assertEqual(keys[0], 600)
+        self.assertEqual(len(keys), 10)
+
+    def test_resume(self):
+        checkpoint = Checkpoint(self.path("orders.checkpoint"), "orders")
+        output = self.path("orders.json")
+        written = []
+
+        def encode_row_and_fail(row):
+            if len(written) == 7:
+                raise Interrupted()
+            written.append(row[0])
+            return json.dumps(row)
+
+        self.assertRaises(Interrupted, write_lines_with_checkpoint,
+                          self.db, "orders", output, checkpoint, encode_row_and_fail, commit_every=3)
+        self.assertEqual(checkpoint.load()["rows"], 6)
+
+        rows = write_lines_with_checkpoint(self.db, "orders", output, checkpoint, json.dumps, commit_every=3)
+        self.assertEqual(rows, 20)
+        with open(output, encoding="utf-8") as f:
+            self.assertEqual([json.loads(line) for line in f], list(self.db.iterate_keyed("orders", "order_id")))
+        self.assertTrue(checkpoint.load()["done"])
+
+    def test_resume_without_output(self):
+        checkpoint = Checkpoint(self.path("orders.checkpoint"), "orders")
+        checkpoint.save(101, 2, 100)
+        with self.assertRaisesRegex(Exception, "remove the checkpoint"):
+            write_lines_with_checkpoint(self.db, "orders", self.path("orders.json"), checkpoint, json.dumps)
@@ -0,0 +1,51 @@
+from unittest import TestCase, skipIf
+import os
+import array
+import datetime
+import tempfile
+import msaccess
+from tests.sample_database import create_sample_database
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TestColumnBatch(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = msaccess.MsAccessDb(
+            create_sample_database(os.path.join(self.directory.name, "sample.db")), backend="sqlite")
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_array_columns(self):
+        batches = list(self.db.iterate_column_batches("customer", 3))
+        self.assertEqual([len(batch) for batch in batches], [3, 2])
+        batch = batches[0]
+        self.assertEqual(batch.column("balance"), array.array("d", [50.25, 100.25, 150.25]))
+        self.assertEqual(batch.column("name"), ["customer1", "customer2", "customer3"])
+        self.assertEqual(batch.column("id").typecode, "i")
+        self.assertEqual(batch.column("joined").typecode, "q")
+        self.assertEqual(batch.column_values(2)[1], datetime.datetime(2015, 1, 2, 12, 30))
+
+    def test_to_rows(self):
+        rows = [row for batch in self.db.iterate_column_batches("customer", 2) for row in batch.to_rows()]
+        self.assertEqual(rows, list(self.db.iterate_query("customer")))
+
+    def test_null_column(self):
+        self.db.execute_query("Update orders Set amount = Null Where order_id = 100")
+        batch = next(self.db.iterate_column_batches("orders", 2))
+        self.assertEqual(batch.column("amount"), [None, 151.5])
+        self.assertFalse(batch.is_typed(2))
+
+    @skipIf(numpy is None, "numpy is not installed")
+    def test_numpy_columns(self):
+        batch = next(self.db.iterate_column_batches("customer", 5, numpy=True))
+        self.assertEqual(batch.column("balance").dtype, numpy.float64)
+        self.assertEqual(batch.column("active").dtype, numpy.bool_)
+        self.assertEqual(str(batch.column("joined").dtype), "datetime64[us]")
+        self.assertEqual(batch.to_rows(), list(self.db.iterate_query("customer")))
@@ -0,0 +1,57 @@
+from unittest import TestCase
+import os
+import decimal
+import datetime
+import tempfile
+from msaccess.delta import TableDelta, DeltaState, INSERT, UPDATE, DELETE, encode_key, decode_key
+
+
+class TestTableDelta(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state = DeltaState(os.path.join(self.directory.name, "state"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_delta(self, rows, key_columns=("id",)):
+        delta = TableDelta(["id", "name"], key_columns, self.state.load("table"))
+        changes = [(change.operation, change.key) for change in delta.changes(rows)]
+        self.state.save("table", delta.key_columns, delta.rows)
+        return delta, changes
+
+    def test_changes(self):
+        delta, changes = self.run_delta([[1, "a"], [2, "b"]])
+        self.assertTrue(delta.first_run)
+        self.assertEqual(changes, [(INSERT, [1]), (INSERT, [2])])
+
+        delta, changes = self.run_delta([[1, "a"], [2, "B"], [3, "c"]])
+        self.assertFalse(delta.first_run)
+        self.assertEqual(changes, [(UPDATE, [2]), (INSERT, [3])])
+
+        delta, changes = self.run_delta([[2, "B"]])
+        self.assertEqual(changes, [(DELETE, [1]), (DELETE, [3])])
+
+    def test_without_primary_key(self):
+        self.run_delta([[1, "a"]], key_columns=())
+        delta, changes = self.run_delta([[1, "b"]], key_columns=())
+        self.assertEqual(delta.key_columns, ["id", "name"])
+        self.assertEqual(changes, [(INSERT, [1, "b"]), (DELETE, [1, "a"])])
+
+    def test_deleted_keys_keep_their_types(self):
+        visited = datetime.datetime(2015, 1, 2, 3, 4, 5)
+        self.run_delta([[visited, "a"], [visited.replace(day=3), "b"]], key_columns=())
+        delta, changes = self.run_delta([[visited.replace(day=3), "b"]], key_columns=())
+        self.assertEqual(changes, [(DELETE, [visited, "a"])])
+
+    def test_scope(self):
+        self.run_delta([[1, "a"]])
+        other = DeltaState(self.state.directory, ["other.mdb", "changes.json"])
+        self.assertIsNone(other.load("table"))
+        other.save("table", ["id"], {})
+        self.assertEqual(other.load("table"), {})
+        self.assertEqual(len(self.state.load("table")), 1)
+
+    def test_encode_key(self):
+        values = [1, "a", None, datetime.datetime(2015, 1, 2), decimal.Decimal("1.50"), b"\x00\xff"]
+        self.assertEqual(decode_key(encode_key(values)), values)
@@ -0,0 +1,153 @@
+from unittest import TestCase
+import os
+import decimal
+import sqlite3
+import tempfile
+import msaccess
+from msaccess.denormalize import (Relation, HashIndex, Denormalizer, normalize_key, relations_from_config,
+                                  relations_from_foreign_keys)
+from tests.sample_database import create_sample_database
+
+
+class TestHashIndex(TestCase):
+    def test_in_memory(self):
+        with HashIndex() as index:
+            index.add((1,), "a")
+            index.add((2,), "b")
+            index.add((1,), "c")
+            index.finish()
+            self.assertFalse(index.spilled)
+            self.assertEqual(index.get((1,)), ["a", "c"])
+            self.assertEqual(index.get((3,)), [])
+
+    def test_spill(self):
+        with tempfile.TemporaryDirectory() as directory:
+            index = HashIndex(max_rows=2, directory=directory)
+            for i in range(10):
+                index.add((i % 3, "k"), {"i": i})
+            index.finish()
+            self.assertTrue(index.spilled)
+            self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertEqual(index.get((1, "k")), [{"i": 1}, {"i": 4}, {"i": 7}])
+            index.close()
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_normalize_key(self):
+        self.assertEqual(normalize_key([1.0, "a"]), (1, "a"))
+        self.assertIsNone(normalize_key([1, None]))
+        self.assertEqual(normalize_key([decimal.Decimal("1.00"), decimal.Decimal("0.5"), True]), (1, 0.5, 1))
+        self.assertIsInstance(normalize_key([decimal.Decimal("1.00")])[0], int)
+        self.assertIsInstance(normalize_key([decimal.Decimal("0.1")])[0], decimal.Decimal)
+
+    def test_spilled_keys_match_like_in_memory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            index = HashIndex(max_rows=1, directory=directory)
+            index.add(normalize_key([decimal.Decimal("1")]), "a")
+            index.add(normalize_key([2.0]), "b")
+            index.finish()
+            self.assertTrue(index.spilled)
+            self.assertEqual(index.get(normalize_key([1])), ["a"])
+            self.assertEqual(index.get(normalize_key([decimal.Decimal("2.0")])), ["b"])
+            index.close()
+
+
+class TestRelations(TestCase):
+    foreign_keys = [
+        {"name": "a", "parent_table": "customer", "parent_columns": ["id"],
+         "child_table": "orders", "child_columns": ["customer_id"]},
+        {"name": "b", "parent_table": "orders", "parent_columns": ["order_id"],
+         "child_table": "order_item", "child_columns": ["order_id"]},
+        {"name": "c", "parent_table": "order_item", "parent_columns": ["id"],
+         "child_table": "customer", "child_columns": ["last_item_id"]},
+    ]
+
+    def test_from_foreign_keys(self):
+        relation = relations_from_foreign_keys(self.foreign_keys, "customer", depth=5)
+        self.assertEqual([r.table for r in relation.walk()], ["customer", "orders", "order_item"])
+        self.assertEqual(relation.children[0].parent_columns, ["id"])
+        self.assertEqual(relation.children[0].child_columns, ["customer_id"])
+        self.assertEqual(len(relations_from_foreign_keys(self.foreign_keys, "customer").children[0].children), 0)
+
+    def test_two_foreign_keys_to_the_same_table(self):
+        foreign_keys = [
+            {"name": "a", "parent_table": "customer", "parent_columns": ["id"],
+             "child_table": "orders", "child_columns": ["billing_id"]},
+            {"name": "b", "parent_table": "customer", "parent_columns": ["id"],
+             "child_table": "orders", "child_columns": ["shipping_id"]},
+            {"name": "c", "parent_table": "customer", "parent_columns": ["id"],
+             "child_table": "note", "child_columns": ["customer_id"]},
+        ]
+        relation = relations_from_foreign_keys(foreign_keys, "customer")
+        self.assertEqual([child.name for child in relation.children], ["orders_billing_id", "orders_shipping_id", None])
+
+    def test_from_config(self):
+        config = {"table": "customer", "embed": [
+            {"table": "orders", "as": "Orders", "join": {"id": "customer_id"},
+             "embed": [{"table": "order_item", "join": {"order_id": "order_id"}}]}]}
+        relation = relations_from_config(config, "customer")
+        self.assertEqual(relation.children[0].name, "Orders")
+        self.assertEqual(relation.to_config(), config)
+        with self.assertRaises(Exception):
+            relations_from_config(config, "orders")
+        with self.assertRaises(Exception):
+            relations_from_config({"embed": [{"table": "orders"}]}, "customer")
+
+
+class TestDenormalizer(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = create_sample_database(os.path.join(self.directory.name, "sample.db"))
+        con = sqlite3.connect(path)
+        con.execute("Create Table order_item (order_id Integer References orders (order_id), item Text(20))")
+        con.executemany("Insert Into order_item Values (?, ?)",
+                        [(100, "pen"), (100, "ink"), (301, "paper"), (None, "lost")])
+        con.commit()
+        con.close()
+        self.db = msaccess.MsAccessDb(path, backend="sqlite")
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_foreign_keys(self):
+        self.assertEqual(self.db.get_foreign_keys(), [
+            {"name": "orders_order_item_0", "parent_table": "orders", "parent_columns": ["order_id"],
+             "child_table": "order_item", "child_columns": ["order_id"]},
+            {"name": "customer_orders_0", "parent_table": "customer", "parent_columns": ["id"],
+             "child_table": "orders", "child_columns": ["customer_id"]},
+        ])
+
+    def test_nested_documents(self):
+        relation = relations_from_foreign_keys(self.db.get_foreign_keys(), "customer", depth=2)
+        with Denormalizer(self.db, relation, batch_size=2) as denormalizer:
+            documents = [document for batch in denormalizer.iterate_batches() for document in batch]
+        self.assertEqual(len(documents), 5)
+        first = documents[0]
+        self.assertEqual(first["name"], "customer1")
+        self.assertEqual([order["order_id"] for order in first["orders"]], [100, 101])
+        self.assertEqual([item["item"] for item in first["orders"][0]["order_item"]], ["pen", "ink"])
+        self.assertEqual(first["orders"][1]["order_item"], [])
+        self.assertEqual(documents[2]["orders"][1]["order_item"][0]["item"], "paper")
+
+    def test_spilled_indexes_give_the_same_documents(self):
+        relation = relations_from_foreign_keys(self.db.get_foreign_keys(), "customer", depth=2)
+        expected = [document for batch in Denormalizer(self.db, relation).iterate_batches() for document in batch]
+        spilled = Denormalizer(self.db, relation, max_rows_in_memory=1, spill_directory=self.directory.name)
+        documents = [document for batch in spilled.iterate_batches() for document in batch]
+        self.assertEqual(documents, expected)
+        self.assertEqual(os.listdir(self.directory.name), ["sample.db"])
+
+    def test_embedding_twice_under_one_name(self):
+        relation = Relation("customer", children=[Relation("orders", ["id"], ["customer_id"]),
+                                                  Relation("orders", ["id"], ["order_id"])])
+        with self.assertRaises(Exception):
+            Denormalizer(self.db, relation)
+
+    def test_each_table_is_read_once(self):
+        metrics = msaccess.metrics.Metrics()
+        self.db.metrics = metrics
+        relation = Relation("customer", children=[Relation("orders", ["id"], ["customer_id"], "orders")])
+        documents = [document for batch in Denormalizer(self.db, relation).iterate_batches() for document in batch]
+        self.assertEqual(sum(len(document["orders"]) for document in documents), 10)
+        self.assertEqual(metrics.com_calls["Execute"], 2)
+        self.assertEqual(metrics.summary()["tables"]["orders"]["index"]["rows"], 10)
@@ -0,0 +1,64 @@
+from unittest import TestCase
+from decimal import Decimal
+import msaccess
+
+
+class FakeField:
+    def __init__(self, data_type):
+        self.Type = data_type
+
+
+class FakeRecordset:
+    """Fields の型と GetRows だけを真似する Recordset"""
+    def __init__(self, rows, types=(3, 202, 6)):
+        self.rows = rows
+        self.Fields = [FakeField(data_type) for data_type in types]
+        self.position = 0
+        self.calls = 0
+
+    @property
+    def EOF(self):
+        return self.position >= len(self.rows)
+
+    def GetRows(self, count):
+        self.calls += 1
+        block = self.rows[self.position:self.position + count]
+        self.position += len(block)
+        return tuple(zip(*block))
+
+
+class TestFetchBatches(TestCase):
+    def setUp(self):
+        self.rows = [[i, "name%d" % i, Decimal("1.5")] for i in range(10)]
+
+    def test_rows(self):
+        recordset = FakeRecordset(self.rows)
+        batches = list(msaccess.fetch_batches(recordset, 4))
+        self.assertEqual([len(batch) for batch in batches], [4, 4, 2])
+        self.assertEqual(batches[0][1], [1, "name1", 1.5])
+        self.assertEqual(recordset.calls, 3)
+
+    def test_columns(self):
+        batches = list(msaccess.fetch_batches(FakeRecordset(self.rows), 4, columns=True))
+        self.assertEqual(batches[0][0], [0, 1, 2, 3])
+        self.assertEqual(batches[2][1], ["name8", "name9"])
+
+    def test_empty(self):
+        self.assertEqual(list(msaccess.fetch_batches(FakeRecordset([]), 4)), [])
+
+
+class TestConverters(TestCase):
+    def test_make_converters(self):
+        converters = msaccess.make_converters([3, 6, 7, 12])
+        self.assertIs(converters[0], msaccess.identity)
+        self.assertIs(converters[1], msaccess.convert_decimal)
+        self.assertIs(converters[2], msaccess.convert_date)
+        self.assertEqual(converters[3], msaccess.MsAccessDb.regulate_value)
+
+    def test_convert_row(self):
+        converters = msaccess.make_converters([3, 6, 131, 7])
+        self.assertEqual(msaccess.convert_row(converters, [1, Decimal("2.5"), None, None]), [1, 2.5, None, None])
+
+    def test_regulate_value_for_mongodb(self):
+        self.assertEqual(msaccess.MsAccessDb.regulate_value_for_mongodb(Decimal("2.5")), 2.5)
+        self.assertIn(str(Decimal), msaccess.MsAccessDb.types)
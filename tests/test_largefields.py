@@ -0,0 +1,87 @@
+from unittest import TestCase
+import os
+import hashlib
+import sqlite3
+import tempfile
+import msaccess
+from msaccess.largefields import InlinePolicy, SkipPolicy, HashPolicy, ExternalFilePolicy, ChunkCollectionPolicy
+from tests.sample_database import create_sample_database
+
+PICTURE = bytes(range(256)) * 40
+
+
+class ChunkCollection:
+    def __init__(self):
+        self.documents = []
+
+    def insert_one(self, document):
+        self.documents.append(document)
+
+
+class TestLargeFields(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = create_sample_database(os.path.join(self.directory.name, "sample.db"))
+        con = sqlite3.connect(path)
+        con.execute("Create Table picture (id Integer Primary Key, caption Text(20), data OleObject, memo Memo)")
+        con.execute("Insert Into picture Values (1, 'one', ?, ?)", (PICTURE, "x" * 1000))
+        con.execute("Insert Into picture Values (2, 'two', Null, Null)")
+        con.execute("Insert Into picture Values (3, 'three', ?, 'short')", (b"abc",))
+        con.commit()
+        con.close()
+        self.db = msaccess.MsAccessDb(path, backend="sqlite")
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_get_chunk(self):
+        field = self.db.execute_query("Select data From picture;").Fields.Item(0)
+        self.assertEqual(field.Type, 205)
+        self.assertEqual(field.ActualSize, len(PICTURE))
+        chunks = []
+        while True:
+            chunk = field.GetChunk(4000)
+            if chunk is None:
+                break
+            chunks.append(chunk)
+        self.assertEqual([len(chunk) for chunk in chunks], [4000, 4000, 2240])
+
+    def test_inline_is_the_same_as_iterate_query(self):
+        self.assertEqual(list(self.db.iterate_large_fields("picture", InlinePolicy(), chunk_size=1000)),
+                         list(self.db.iterate_query("picture")))
+
+    def test_skip(self):
+        rows = list(self.db.iterate_large_fields("picture", SkipPolicy()))
+        self.assertEqual(rows[0], [1, "one", None, None])
+
+    def test_hash(self):
+        rows = list(self.db.iterate_large_fields("picture", HashPolicy(), chunk_size=1000))
+        self.assertEqual(rows[0][2], {"size": len(PICTURE), "sha1": hashlib.sha1(PICTURE).hexdigest()})
+        self.assertIsNone(rows[1][2])
+        # 短い値でも Memo と宣言された列は GetChunk で読む
+        self.assertEqual(rows[2][3], {"size": 5, "sha1": hashlib.sha1(b"short").hexdigest()})
+
+    def test_columns(self):
+        rows = list(self.db.iterate_large_fields("picture", SkipPolicy(), columns=["caption"]))
+        self.assertEqual(rows[2][1:3], [None, b"abc"])
+
+    def test_external_file(self):
+        directory = os.path.join(self.directory.name, "blobs")
+        rows = list(self.db.iterate_large_fields("picture", ExternalFilePolicy(directory), columns=["data"]))
+        with open(os.path.join(directory, rows[0][2]["path"]), "rb") as f:
+            self.assertEqual(f.read(), PICTURE)
+        self.assertIsNone(rows[1][2])
+        self.assertEqual(sorted(os.listdir(directory)), sorted(set(row[2]["sha1"][:2] for row in rows if row[2])))
+
+    def test_chunk_collection(self):
+        chunks, files = ChunkCollection(), ChunkCollection()
+        rows = list(self.db.iterate_large_fields("picture", ChunkCollectionPolicy(chunks, files, chunk_size=4096),
+                                                 columns=["data"]))
+        reference = rows[0][2]
+        self.assertEqual(reference["length"], len(PICTURE))
+        parts = [chunk for chunk in chunks.documents if chunk["files_id"] == reference["files_id"]]
+        self.assertEqual([chunk["n"] for chunk in parts], [0, 1, 2])
+        self.assertEqual(b"".join(chunk["data"] for chunk in parts), PICTURE)
+        self.assertEqual(files.documents[0]["_id"], reference["files_id"])
+        self.assertEqual(len(files.documents), 2)
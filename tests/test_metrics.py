@@ -0,0 +1,71 @@
+from unittest import TestCase
+import io
+import os
+import json
+import tempfile
+import msaccess
+from msaccess.metrics import Metrics, Progress, NULL_METRICS
+from tests.sample_database import create_sample_database
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.metrics = Metrics()
+        self.db = msaccess.MsAccessDb(create_sample_database(os.path.join(self.directory.name, "sample.db")),
+                                      backend="sqlite", metrics=self.metrics)
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_batches(self):
+        with self.metrics.table("customer"):
+            rows = sum(len(batch) for batch in self.db.iterate_batches("customer", 2))
+        self.assertEqual(rows, 5)
+        fetch = self.metrics.stages[("fetch", "customer")]
+        self.assertEqual((fetch.rows, fetch.calls), (5, 3))
+        self.assertEqual(self.metrics.stages[("convert", "customer")].rows, 5)
+        self.assertEqual(self.metrics.com_calls, {"Execute": 1, "GetRows": 3})
+
+    def test_rows(self):
+        self.assertEqual(len(list(self.db.iterate_query("orders"))), 10)
+        self.assertEqual(self.metrics.stages[("fetch", None)].rows, 10)
+        self.assertEqual(self.metrics.com_calls["MoveNext"], 10)
+
+    def test_timer_and_listener(self):
+        events = []
+        self.metrics.add_listener(lambda *args: events.append(args[:4]))
+        with self.metrics.timer("serialize", rows=3, table="t") as timer:
+            timer.bytes = 42
+        self.assertEqual(events, [("serialize", "t", 3, 42)])
+        summary = json.loads(self.metrics.to_json())
+        self.assertEqual(summary["stages"]["serialize"]["bytes"], 42)
+        self.assertEqual(summary["tables"]["t"]["serialize"]["rows"], 3)
+
+    def test_prometheus(self):
+        self.metrics.record("sink", 10, 100, 0.5, table='a "b"')
+        self.metrics.count_com_call("GetRows", 2)
+        text = self.metrics.to_prometheus()
+        self.assertIn('msaccess_stage_rows_total{stage="sink",table="a \\"b\\""} 10', text)
+        self.assertIn('msaccess_com_calls_total{call="GetRows"} 2', text)
+        self.assertIn("# TYPE msaccess_stage_seconds_total counter", text)
+
+    def test_null_metrics(self):
+        db = msaccess.MsAccessDb(self.db.db_name, backend="sqlite")
+        self.assertIs(db.metrics, NULL_METRICS)
+        with NULL_METRICS.table("customer"):
+            self.assertEqual(len(list(db.iterate_batches("customer"))), 1)
+        self.assertEqual(NULL_METRICS.stages, {})
+        db.close()
+
+
+class TestProgress(TestCase):
+    def test_eta(self):
+        stream = io.StringIO()
+        progress = Progress("customer", 100, stream, interval=0)
+        progress.started -= 10
+        progress.update(25)
+        self.assertAlmostEqual(progress.eta(progress.started + 10), 30, places=3)
+        self.assertIn("customer: 25/100 rows (25%)", stream.getvalue())
+        self.assertIn("ETA 0:00:30", progress.message(progress.started + 10))
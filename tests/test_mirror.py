@@ -0,0 +1,85 @@
+from unittest import TestCase
+import os
+import time
+import sqlite3
+import datetime
+import tempfile
+import msaccess
+from msaccess.mirror import Mirror, MirroredDb, declared_type
+from msaccess.backends import ado_type_of_declaration
+from tests.sample_database import create_sample_database
+
+
+class TestMirror(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.mdb = create_sample_database(os.path.join(self.directory.name, "sample.db"))
+        self.path = os.path.join(self.directory.name, "mirror.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def source(self):
+        return msaccess.MsAccessDb(self.mdb, backend="sqlite")
+
+    def change_source(self, *statements):
+        con = sqlite3.connect(self.mdb)
+        for statement in statements:
+            con.execute(statement)
+        con.commit()
+        con.close()
+        # 更新時刻の分解能が粗くてもサイズか時刻が変わるように
+        stat = os.stat(self.mdb)
+        os.utime(self.mdb, (stat.st_atime, stat.st_mtime + 10))
+
+    def test_declared_types_map_back(self):
+        for data_type in (2, 3, 5, 6, 7, 11, 20, 72, 131, 203, 205):
+            self.assertEqual(ado_type_of_declaration(declared_type({"DATA_TYPE": data_type})), data_type)
+        self.assertEqual(declared_type({"DATA_TYPE": 202, "CHARACTER_MAXIMUM_LENGTH": 50}), "Text(50)")
+
+    def test_copy_reads_back_the_same_values(self):
+        with self.source() as db, Mirror(self.path, {"orders": ["customer_id", ["amount", "note"]]}) as mirror:
+            self.assertEqual(mirror.refresh(db), {"customer": 5, "orders": 10})
+            expected = list(db.iterate_query("customer"))
+        with msaccess.MsAccessDb(self.path, backend="sqlite") as copy:
+            self.assertEqual(list(copy.iterate_query("customer")), expected)
+            self.assertEqual(copy.get_table_names(), ["customer", "orders"])
+            self.assertEqual(copy.get_primary_key("orders"), ["order_id"])
+            self.assertIsInstance(expected[0][2], datetime.datetime)
+        indexes = [row[1] for row in sqlite3.connect(self.path).execute("PRAGMA index_list(orders)")]
+        self.assertIn("ix_orders_customer_id", indexes)
+        self.assertIn("ix_orders_amount_note", indexes)
+
+    def test_incremental_refresh(self):
+        with Mirror(self.path) as mirror:
+            with self.source() as db:
+                mirror.refresh(db)
+            with self.source() as db:
+                self.assertEqual(mirror.refresh(db), {"customer": 0, "orders": 0})
+
+            self.change_source("Update orders Set amount = 1 Where order_id = 100",
+                               "Delete From orders Where order_id = 501",
+                               "Insert Into orders Values (600, 1, 2.5, 'new')")
+            with self.source() as db:
+                self.assertEqual(mirror.refresh(db), {"customer": 0, "orders": 3})
+                expected = list(db.iterate_query("orders"))
+        with msaccess.MsAccessDb(self.path, backend="sqlite") as copy:
+            self.assertEqual(sorted(copy.iterate_query("orders")), sorted(expected))
+
+    def test_full_refresh(self):
+        with Mirror(self.path) as mirror:
+            with self.source() as db:
+                mirror.refresh(db)
+                self.assertEqual(mirror.refresh(db, ["orders"], full=True), {"orders": 10})
+
+    def test_mirrored_db(self):
+        with MirroredDb(self.mdb, self.path, max_age=60, backend="sqlite") as db:
+            self.assertFalse(db.is_fresh())
+            self.assertEqual(db.count_rows("orders"), 10)
+            self.assertTrue(db.is_fresh())
+            self.change_source("Delete From orders")
+            # 新しいあいだは写しで答える
+            self.assertEqual(db.First("(Select Count(*) From orders)")[0], 10)
+            self.assertFalse(db.is_fresh(now=time.time() + 61))
+            db.max_age = 0
+            self.assertEqual(db.First("(Select Count(*) From orders)")[0], 0)
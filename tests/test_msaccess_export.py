@@ -1,5 +1,19 @@
 from unittest import TestCase
+import os
+import json
+import io
+import gzip
+import sqlite3
+import datetime
+import bson.json_util
+import msaccess.metrics
+import tempfile
+from collections import defaultdict
+from unittest import mock
 from scripts.msaccess_export import tables, columns, dump_mongodb_json, export_mongodb, export_schema
+from scripts.msaccess_export import TableTranslator, InsertStage, dump_changes, dump_table
+from scripts.msaccess_export import export_denormalized, export_sqlite, make_large_field_policy
+from tests.sample_database import create_sample_database, create_translation_words, translation_words
 
 
 class TestMsAccessExport(TestCase):
@@ -17,3 +31,255 @@ class TestMsAccessExport(TestCase):
 
     def test_export_schema(self):
         export_schema("-", "test_data.mdb", "translation_words.yaml")
+
+
+class FakeCollection:
+    """insert_many の呼び出しを記録するだけのコレクション"""
+    def __init__(self):
+        self.batches = []
+        self.documents = []
+
+    def insert_many(self, documents, ordered=True):
+        self.batches.append((len(documents), ordered))
+        self.documents.extend(documents)
+
+    def bulk_write(self, requests, ordered=True):
+        self.batches.append((len(requests), ordered))
+        self.documents.extend(requests)
+
+    def drop(self):
+        self.documents = []
+
+
+class FakeMongoClient:
+    def __init__(self, host):
+        self.databases = defaultdict(lambda: defaultdict(FakeCollection))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def drop_database(self, name):
+        self.databases.pop(name, None)
+
+    def __getitem__(self, name):
+        return self.databases[name]
+
+
+class TestMsAccessExportOnSqlite(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.mdb = create_sample_database(self.path("sample.db"))
+        self.translation_words = create_translation_words(self.path("translation_words.yaml"))
+        self.backend = os.environ.get("MSACCESS_BACKEND")
+        os.environ["MSACCESS_BACKEND"] = "sqlite"
+
+    def tearDown(self):
+        if self.backend is None:
+            del os.environ["MSACCESS_BACKEND"]
+        else:
+            os.environ["MSACCESS_BACKEND"] = self.backend
+        self.directory.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_dump_mongodb_json(self):
+        output = self.path("dump_database.json")
+        dump_mongodb_json(output, self.mdb, self.translation_words)
+        with open(output, encoding="utf-8") as f:
+            data = json.load(f)
+        self.assertEqual(list(data), ["Customer", "Order"])
+        self.assertEqual(len(data["Order"]), 10)
+        self.assertEqual(data["Customer"][0]["Name"], "customer1")
+
+    def test_table_translator(self):
+        translator = TableTranslator("orders", ["order_id", "amount"], translation_words)
+        self.assertEqual(translator.translated_table_name, "Order")
+        self.assertEqual(translator.translate_row([1, 2.5]), {"Id": 1, "Amount": 2.5})
+
+    def test_insert_stage(self):
+        collection = FakeCollection()
+        metrics = msaccess.metrics.Metrics()
+        insert = InsertStage(collection, False, metrics)
+        for start in range(0, 25, 10):
+            insert([{"i": i} for i in range(start, min(start + 10, 25))])
+        self.assertEqual(insert.count, 25)
+        self.assertEqual(collection.batches, [(10, False), (10, False), (5, False)])
+        self.assertEqual(metrics.summary()["stages"]["sink"]["rows"], 25)
+
+    def test_export_mongodb(self):
+        client = FakeMongoClient("localhost")
+        with mock.patch("pymongo.MongoClient", lambda host: client):
+            export_mongodb("kusado", self.mdb, self.translation_words, batch_size="4")
+        orders = client["kusado"]["Order"]
+        self.assertEqual([size for size, ordered in orders.batches], [4, 4, 2])
+        self.assertEqual(orders.documents[0]["Note"], "note 100")
+
+    def test_dump_mongodb_json_in_parallel(self):
+        dump_mongodb_json(self.path("serial.json"), self.mdb, self.translation_words)
+        dump_mongodb_json(self.path("parallel.json"), self.mdb, self.translation_words, jobs="2")
+        with open(self.path("serial.json"), encoding="utf-8") as serial:
+            with open(self.path("parallel.json"), encoding="utf-8") as parallel:
+                self.assertEqual(serial.read(), parallel.read())
+
+    def execute(self, query):
+        con = sqlite3.connect(self.mdb)
+        con.execute(query)
+        con.commit()
+        con.close()
+
+    def read_changes(self, state_directory):
+        output = self.path("changes.json")
+        dump_changes(output, self.mdb, self.translation_words, state_directory)
+        with open(output, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_dump_changes(self):
+        state_directory = self.path("state")
+        self.assertEqual(len(self.read_changes(state_directory)), 15)
+        self.assertEqual(self.read_changes(state_directory), [])
+
+        self.execute("Update orders Set amount = 0 Where order_id = 100")
+        self.execute("Delete From customer Where id = 5")
+        changes = self.read_changes(state_directory)
+        self.assertEqual([(change["table"], change["operation"], change["key"]) for change in changes],
+                         [("Customer", "delete", {"Id": 5}), ("Order", "update", {"Id": 100})])
+        self.assertEqual(changes[1]["document"]["Amount"], 0)
+
+    def test_export_mongodb_incremental(self):
+        client = FakeMongoClient("localhost")
+        state_directory = self.path("state")
+        with mock.patch("pymongo.MongoClient", lambda host: client):
+            export_mongodb("kusado", self.mdb, self.translation_words, incremental=True,
+                           state_directory=state_directory)
+            self.execute("Insert Into orders Values (999, 1, 1.0, 'new')")
+            export_mongodb("kusado", self.mdb, self.translation_words, incremental=True,
+                           state_directory=state_directory)
+        orders = client["kusado"]["Order"]
+        self.assertEqual([size for size, ordered in orders.batches], [10, 1])
+        self.assertEqual(orders.documents[-1]._filter, {"Id": 999})
+
+    def test_dump_changes_and_export_mongodb_incremental_keep_their_own_state(self):
+        client = FakeMongoClient("localhost")
+        state_directory = self.path("state")
+        with mock.patch("pymongo.MongoClient", lambda host: client):
+            export_mongodb("kusado", self.mdb, self.translation_words, incremental=True,
+                           state_directory=state_directory)
+            self.read_changes(state_directory)
+            self.execute("Update orders Set amount = 0 Where order_id = 100")
+            self.assertEqual(len(self.read_changes(state_directory)), 1)
+            export_mongodb("kusado", self.mdb, self.translation_words, incremental=True,
+                           state_directory=state_directory)
+        orders = client["kusado"]["Order"]
+        self.assertEqual([size for size, ordered in orders.batches], [10, 1])
+        self.assertEqual(orders.documents[-1]._filter, {"Id": 100})
+
+    def test_export_mongodb_incremental_deletes_rows_with_date_keys(self):
+        self.execute("Create Table visit (customer_id Integer, visited DateTime)")
+        self.execute("Insert Into visit Values (1, '2015-01-01 12:30:00')")
+        self.execute("Insert Into visit Values (2, '2015-01-02 08:00:00')")
+        client = FakeMongoClient("localhost")
+        state_directory = self.path("state")
+        with mock.patch("pymongo.MongoClient", lambda host: client):
+            export_mongodb("kusado", self.mdb, incremental=True, state_directory=state_directory)
+            self.execute("Delete From visit Where customer_id = 1")
+            export_mongodb("kusado", self.mdb, incremental=True, state_directory=state_directory)
+        visits = client["kusado"]["visit"].documents
+        delete_filter = visits[-1]._filter
+        self.assertEqual(delete_filter, {"customer_id": 1, "visited": datetime.datetime(2015, 1, 1, 12, 30)})
+        self.assertIn(delete_filter, [request._doc for request in visits[:2]])
+
+    def test_dump_table_with_checkpoint(self):
+        output = self.path("order.json")
+        checkpoint = self.path("order.checkpoint")
+        dump_table("Order", output, self.mdb, self.translation_words, checkpoint, commit_every="3")
+        with open(output, encoding="utf-8") as f:
+            self.assertEqual([json.loads(line)["Id"] for line in f][:3], [100, 101, 200])
+        self.assertFalse(os.path.exists(checkpoint))
+
+        with self.assertRaises(Exception):
+            dump_table("Order", output, self.mdb, self.translation_words, checkpoint, compression="gzip")
+        with self.assertRaises(Exception):
+            dump_table("Order", output + ".gz", self.mdb, self.translation_words, checkpoint)
+        self.assertFalse(os.path.exists(output + ".gz"))
+
+    def test_dump_table(self):
+        output = self.path("customer.json.gz")
+        dump_table("Customer", output, self.mdb, self.translation_words, batch_size="2")
+        with gzip.open(output, "rt", encoding="utf-8") as f:
+            documents = [bson.json_util.loads(line) for line in f]
+        self.assertEqual([document["Id"] for document in documents], [1, 2, 3, 4, 5])
+        self.assertEqual(documents[1]["JoinedAt"], datetime.datetime(2015, 1, 2, 12, 30))
+
+    def test_dump_table_to_stdout(self):
+        stdout = io.TextIOWrapper(io.BytesIO(), encoding="utf-8")
+        with mock.patch("sys.stdout", stdout):
+            dump_table("Customer", "-", self.mdb, self.translation_words)
+        stdout.flush()
+        lines = stdout.buffer.getvalue().decode("utf-8").splitlines()
+        self.assertEqual([bson.json_util.loads(line)["Id"] for line in lines], [1, 2, 3, 4, 5])
+
+    def test_dump_table_metrics(self):
+        output = self.path("customer.json")
+        metrics_output = self.path("metrics.json")
+        dump_table("Customer", output, self.mdb, self.translation_words, metrics_output=metrics_output)
+        with open(metrics_output, encoding="utf-8") as f:
+            summary = json.load(f)
+        self.assertEqual(summary["tables"]["Customer"]["sink"]["bytes"], os.path.getsize(output))
+        self.assertEqual(summary["stages"]["fetch"]["rows"], 5)
+        self.assertEqual(summary["com_calls"]["GetRows"], 1)
+        self.assertEqual(list(summary["pipelines"]["Customer"]["stages"]), ["fetch", "serialize", "sink"])
+
+    def test_dump_table_large_fields(self):
+        output = self.path("order.json")
+        dump_table("Order", output, self.mdb, self.translation_words, large_fields="hash")
+        with open(output, encoding="utf-8") as f:
+            documents = [json.loads(line) for line in f]
+        self.assertEqual(documents[0]["Note"]["size"], len("note 100"))
+        self.assertEqual(len(documents), 10)
+
+    def test_chunks_policy(self):
+        client = FakeMongoClient("localhost")
+        policy = make_large_field_policy("chunks", mongodb=client["kusado"])
+        self.assertIs(policy.chunks, client["kusado"]["fs.chunks"])
+        self.assertIs(policy.files, client["kusado"]["fs.files"])
+        with self.assertRaisesRegex(Exception, "only for export_mongodb"):
+            dump_table("Order", self.path("order.json"), self.mdb, self.translation_words, large_fields="chunks")
+
+    def test_export_denormalized(self):
+        client = FakeMongoClient("localhost")
+        with mock.patch("pymongo.MongoClient", lambda host: client):
+            export_denormalized("Customer", "kusado", self.mdb, self.translation_words, batch_size="2")
+        customers = client["kusado"]["Customer"].documents
+        self.assertEqual(len(customers), 5)
+        self.assertEqual([order["Id"] for order in customers[0]["Order"]], [100, 101])
+        self.assertEqual(customers[4]["Order"][1]["Note"], "note 501")
+
+    def test_export_denormalized_as_json(self):
+        relations = self.path("relations.yaml")
+        with open(relations, "w", encoding="utf-8") as f:
+            f.write("embed:\n  - table: orders\n    as: Orders\n    join: {id: customer_id}\n")
+        output = self.path("customer.json")
+        export_denormalized("Customer", output, self.mdb, self.translation_words, relations,
+                            output_format="json", max_rows_in_memory="3", spill_directory=self.directory.name)
+        with open(output, encoding="utf-8") as f:
+            documents = [bson.json_util.loads(line) for line in f]
+        self.assertEqual([document["Id"] for document in documents], [1, 2, 3, 4, 5])
+        self.assertEqual([order["Amount"] for order in documents[1]["Orders"]], [300.0, 301.5])
+        self.assertEqual(sorted(os.listdir(self.directory.name)),
+                         ["customer.json", "relations.yaml", "sample.db", "translation_words.yaml"])
+
+    def test_export_sqlite(self):
+        indexes = self.path("indexes.yaml")
+        with open(indexes, "w", encoding="utf-8") as f:
+            f.write("orders: [customer_id]\n")
+        output = self.path("mirror.sqlite")
+        export_sqlite(output, self.mdb, indexes=indexes)
+        export_sqlite(output, self.mdb, "orders", full=True)
+        con = sqlite3.connect(output)
+        self.assertEqual(con.execute("Select Sum(amount) From orders Where customer_id = 2").fetchone()[0], 601.5)
+        self.assertIn("ix_orders_customer_id", [row[1] for row in con.execute("PRAGMA index_list(orders)")])
+        con.close()
@@ -0,0 +1,65 @@
+from unittest import TestCase
+import io
+import os
+import gzip
+import math
+import decimal
+import datetime
+import tempfile
+import bson.json_util
+from msaccess.ndjson import NdjsonWriter, encode_value, open_output
+
+
+class TestNdjsonWriter(TestCase):
+    field_names = ["id", "name", "flag", "amount", "created", "data", "note"]
+    field_types = [3, 202, 11, 6, 7, 205, 203]
+
+    def write(self, rows):
+        stream = io.BytesIO()
+        writer = NdjsonWriter(stream, self.field_names, self.field_types)
+        writer.write_rows(rows)
+        self.assertEqual(writer.rows, len(rows))
+        return stream.getvalue().decode("utf-8")
+
+    def expected(self, rows):
+        return "".join(bson.json_util.dumps(dict(zip(self.field_names, row))) + "\n" for row in rows)
+
+    def test_same_as_json_util(self):
+        rows = [
+            [1, "日本", True, 12.5, datetime.datetime(2015, 1, 1, 12, 30), b"ab", 'quote " and \\'],
+            [2, None, False, None, datetime.datetime(2015, 1, 1, 12, 30, 0, 123456), None, None],
+            [3, "", None, float("nan"), datetime.datetime(1960, 1, 1), b"", "line\nbreak"],
+            [-4, "x", False, float("-inf"), datetime.datetime(9999, 12, 31), b"\x00\xff", "\t"],
+        ]
+        self.assertEqual(self.write(rows), self.expected(rows))
+
+    def test_unexpected_types_fall_back(self):
+        rows = [["1", 2, 1, 3, "2015-01-01", "text", 4.5]]
+        self.assertEqual(self.write(rows), self.expected(rows))
+
+    def test_empty_batch(self):
+        self.assertEqual(self.write([]), "")
+
+    def test_decimal(self):
+        self.assertEqual(encode_value(decimal.Decimal("1.50")),
+                         bson.json_util.dumps(bson.decimal128.Decimal128("1.50")))
+        self.assertEqual(encode_value(math.inf), bson.json_util.dumps(math.inf))
+
+
+class TestOpenOutput(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_gzip_from_extension(self):
+        path = os.path.join(self.directory.name, "out.json.gz")
+        with open_output(path) as f:
+            f.write(b"{}\n")
+        with gzip.open(path, "rb") as f:
+            self.assertEqual(f.read(), b"{}\n")
+
+    def test_unknown_compression(self):
+        with self.assertRaises(Exception):
+            open_output(os.path.join(self.directory.name, "out.json"), "lz4")
@@ -0,0 +1,29 @@
+from unittest import TestCase
+import os
+import tempfile
+import msaccess
+from msaccess.parallel import map_tables, schedule_tables
+from tests.sample_database import create_sample_database
+
+
+def count_table(db, table_name, offset):
+    return len(list(db.iterate_query(table_name))) + offset
+
+
+class TestParallel(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.mdb = create_sample_database(os.path.join(self.directory.name, "sample.db"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_schedule_tables(self):
+        db = msaccess.MsAccessDb(self.mdb, backend="sqlite")
+        self.assertEqual(schedule_tables(db, ["customer", "orders"]), ["orders", "customer"])
+        db.close()
+
+    def test_map_tables(self):
+        for jobs in (1, 2):
+            results = map_tables(self.mdb, ["customer", "orders"], count_table, jobs, "sqlite", args=(1,))
+            self.assertEqual(results, [6, 11])
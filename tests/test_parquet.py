@@ -0,0 +1,42 @@
+from unittest import TestCase, skipIf
+import os
+import datetime
+import tempfile
+from decimal import Decimal
+import msaccess
+from tests.sample_database import create_sample_database
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+
+@skipIf(pq is None, "pyarrow is not installed")
+class TestParquet(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = msaccess.MsAccessDb(
+            create_sample_database(os.path.join(self.directory.name, "sample.db")), backend="sqlite")
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_export_parquet(self):
+        path = os.path.join(self.directory.name, "customer.parquet")
+        self.assertEqual(self.db.export_parquet("customer", path, row_group_size=2), 5)
+
+        parquet_file = pq.ParquetFile(path)
+        self.assertEqual(parquet_file.num_row_groups, 3)
+        self.assertEqual(str(parquet_file.schema_arrow.field("balance").type), "decimal128(19, 4)")
+        self.assertEqual(str(parquet_file.schema_arrow.field("joined").type), "timestamp[us]")
+
+        table = parquet_file.read().to_pylist()
+        self.assertEqual(table[0], {"id": 1, "name": "customer1", "joined": datetime.datetime(2015, 1, 1, 12, 30),
+                                    "balance": Decimal("50.2500"), "active": True})
+
+    def test_field_names(self):
+        path = os.path.join(self.directory.name, "orders.parquet")
+        self.db.export_parquet("orders", path, field_names=["Id", "CustomerId", "Amount", "Note"])
+        self.assertEqual(pq.ParquetFile(path).schema_arrow.names, ["Id", "CustomerId", "Amount", "Note"])
@@ -0,0 +1,64 @@
+from unittest import TestCase
+import time
+import threading
+from msaccess.pipeline import Pipeline, Stage, chunked
+
+
+class TestPipeline(TestCase):
+    def test_stages_run_in_order(self):
+        output = []
+        pipeline = Pipeline([Stage("double", lambda batch: [x * 2 for x in batch]),
+                             Stage("sink", output.extend)], queue_size=2)
+        self.assertEqual(pipeline.run(chunked(range(10), 3)), 4)
+        self.assertEqual(output, [x * 2 for x in range(10)])
+        stats = pipeline.stats()["stages"]
+        self.assertEqual(list(stats), ["fetch", "double", "sink"])
+        self.assertEqual(stats["sink"]["batches"], 4)
+        self.assertLessEqual(stats["sink"]["input_queue"]["max_depth"], 2)
+
+    def test_stages_run_on_other_threads(self):
+        threads = set()
+        pipeline = Pipeline([Stage("sink", lambda batch: threads.add(threading.get_ident()))])
+        pipeline.run([[1], [2]])
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_overlap(self):
+        def slow(batch):
+            time.sleep(0.05)
+            return batch
+
+        def fetch():
+            for i in range(6):
+                time.sleep(0.05)
+                yield [i]
+
+        started = time.time()
+        Pipeline([Stage("slow", slow), Stage("sink", slow)]).run(fetch())
+        # 3 stages of 0.3 sec each would take 0.9 sec one after another
+        self.assertLess(time.time() - started, 0.7)
+
+    def test_error_in_stage(self):
+        fetched = []
+
+        def fetch():
+            for i in range(1000):
+                fetched.append(i)
+                yield [i]
+
+        def fail(batch):
+            if batch[0] == 3:
+                raise ValueError("bad batch")
+
+        with self.assertRaises(ValueError):
+            Pipeline([Stage("sink", fail)], queue_size=1).run(fetch())
+        self.assertLess(len(fetched), 1000)
+
+    def test_error_in_source(self):
+        output = []
+
+        def fetch():
+            yield [1]
+            raise KeyError("fetch failed")
+
+        with self.assertRaises(KeyError):
+            Pipeline([Stage("sink", output.extend)]).run(fetch())
@@ -0,0 +1,137 @@
+from unittest import TestCase
+import os
+import time
+import tempfile
+import threading
+import msaccess
+from msaccess.pool import ConnectionPool, PoolTimeout, get_pool
+from tests.sample_database import create_sample_database
+
+
+class TestConnectionPool(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.mdb = create_sample_database(os.path.join(self.directory.name, "sample.db"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_context_manager(self):
+        with msaccess.MsAccessDb(self.mdb, backend="sqlite") as db:
+            self.assertIsNone(db._cat)
+            self.assertEqual(db.get_table_names(), ["customer", "orders"])
+            self.assertIsNone(db._cat)
+            self.assertEqual(db.GetViewNames(), ["rich_customer"])
+        self.assertFalse(db.is_open())
+        db.close()
+
+    def test_reuse(self):
+        with ConnectionPool(self.mdb, size=2, backend="sqlite") as pool:
+            with pool.connection() as first:
+                pass
+            with pool.connection() as second:
+                self.assertIs(first, second)
+            self.assertEqual(pool.opened, 1)
+
+    def test_size_and_timeout(self):
+        with ConnectionPool(self.mdb, size=1, backend="sqlite") as pool:
+            db = pool.acquire()
+            self.assertRaises(PoolTimeout, pool.acquire, 0.01)
+            threading.Timer(0.05, pool.release, [db]).start()
+            self.assertIs(pool.acquire(1), db)
+
+    def test_health_check_and_eviction(self):
+        with ConnectionPool(self.mdb, size=2, backend="sqlite", max_idle=0.05) as pool:
+            with pool.connection() as db:
+                pass
+            db.close()
+            with pool.connection() as replaced:
+                self.assertIsNot(replaced, db)
+            time.sleep(0.1)
+            with pool.connection() as fresh:
+                self.assertIsNot(fresh, replaced)
+            self.assertFalse(replaced.is_open())
+            self.assertEqual(pool.opened, 1)
+
+    def test_connections_stay_on_their_thread(self):
+        with ConnectionPool(self.mdb, size=2, backend="sqlite") as pool:
+            closed_on = []
+            close_connection = pool.close_connection
+
+            def record_close(db):
+                closed_on.append((db, threading.current_thread()))
+                close_connection(db)
+
+            pool.close_connection = record_close
+            with pool.connection() as mine:
+                pass
+            others = []
+            borrowed = threading.Event()
+            again = threading.Event()
+
+            def work():
+                with pool.connection() as db:
+                    others.append(db)
+                borrowed.set()
+                again.wait()
+                with pool.connection(1):
+                    pass
+
+            worker = threading.Thread(target=work)
+            worker.start()
+            borrowed.wait()
+            self.assertIsNot(others[0], mine)
+            with pool.connection() as db:
+                self.assertIs(db, mine)
+            self.assertEqual(pool.opened, 2)
+
+            # 全部開いていれば、ほかのスレッドの空きの接続を捨てて開き直す．
+            # 捨てた接続は開いたスレッドが次に借りるときに閉じる
+            with pool.connection() as first, pool.connection() as second:
+                self.assertIs(first, mine)
+                self.assertIsNot(second, others[0])
+            self.assertTrue(others[0].is_open())
+            self.assertEqual(closed_on, [])
+            self.assertEqual(pool.opened, 2)
+
+            again.set()
+            worker.join()
+            self.assertFalse(others[0].is_open())
+            self.assertEqual(closed_on, [(others[0], worker)])
+            self.assertEqual(pool.opened, 2)
+
+    def test_release_on_base_exception(self):
+        with ConnectionPool(self.mdb, size=1, backend="sqlite") as pool:
+            with self.assertRaises(KeyboardInterrupt):
+                with pool.connection() as db:
+                    raise KeyboardInterrupt()
+            with pool.connection(0.01) as again:
+                self.assertIs(again, db)
+
+            connection = pool.connection()
+            db = connection.__enter__()
+            connection.gen.close()
+            self.assertIs(pool.acquire(0.01), db)
+
+    def test_threads(self):
+        pool = ConnectionPool(self.mdb, size=3, backend="sqlite")
+        counts = []
+
+        def work():
+            for i in range(20):
+                with pool.connection() as db:
+                    counts.append(db.count_rows("orders"))
+
+        threads = [threading.Thread(target=work) for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        pool.close()
+        self.assertEqual(counts, [10] * 120)
+        self.assertLessEqual(pool.opened, 3)
+
+    def test_get_pool(self):
+        pool = get_pool(self.mdb, backend="sqlite")
+        self.assertIs(get_pool(os.path.join(self.directory.name, ".", "sample.db")), pool)
+        pool.close()
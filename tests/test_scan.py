@@ -0,0 +1,92 @@
+from unittest import TestCase
+import os
+import tempfile
+import msaccess
+from msaccess.backends import AdoBackend
+from tests.sample_database import create_sample_database
+
+
+class CountingDb(msaccess.MsAccessDb):
+    """実行した SQL を記録する"""
+    def execute_query(self, query):
+        self.statements.append(query)
+        return msaccess.MsAccessDb.execute_query(self, query)
+
+
+class TestScan(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = create_sample_database(os.path.join(self.directory.name, "sample.db"), customers=10)
+        self.db = CountingDb(path, backend="sqlite")
+        self.db.statements = []
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_projection_and_predicate(self):
+        rows = list(self.db.scan("orders", columns=["order_id", "amount"], where="customer_id = 2", key="order_id"))
+        self.assertEqual(rows, [[200, 300.0], [201, 301.5]])
+
+    def test_key_range(self):
+        rows = list(self.db.scan("customer", columns=["name"], key="id", start=3, stop=5))
+        self.assertEqual(rows, [["customer3"], ["customer4"]])
+
+    def test_pages(self):
+        rows = list(self.db.scan("orders", columns=["amount"], page_size=6))
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(rows[0], [150.0])
+        self.assertEqual(len(self.db.statements), 4)
+        self.assertTrue(all("Limit 6" in statement for statement in self.db.statements))
+
+    def test_pages_on_a_key_that_is_not_unique(self):
+        expected = list(self.db.scan("orders", columns=["order_id"], key="customer_id"))
+        self.db.statements = []
+        rows = list(self.db.scan("orders", columns=["order_id"], key="customer_id", page_size=3))
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(sorted(rows), sorted(expected))
+        self.assertTrue(all("Order By [customer_id], [order_id]" in statement for statement in self.db.statements))
+
+    def test_scan_ranges(self):
+        ranges = self.db.scan_ranges("customer", "id", 3)
+        self.assertEqual(ranges[0][0], 1)
+        self.assertEqual(ranges[-1][1], 11)
+        ids = [row[0] for start, stop in ranges for row in self.db.scan("customer", ["id"], key="id", start=start, stop=stop)]
+        self.assertEqual(ids, list(range(1, 11)))
+
+    def test_first(self):
+        self.assertEqual(self.db.First("customer Where id = 4")[1], "customer4")
+        self.assertEqual(self.db.statements, ["Select * From customer Where id = 4 Limit 1;"])
+
+    def test_jet_statement(self):
+        self.assertEqual(AdoBackend().select_statement("[a]", "t", "[a] > 1", "[a]", 10),
+                         "Select Top 10 [a] From t Where [a] > 1 Order By [a];")
+
+
+class TestPrepared(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = create_sample_database(os.path.join(self.directory.name, "sample.db"), customers=10)
+        self.db = msaccess.MsAccessDb(path, backend="sqlite", prepared_cache_size=2)
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_first_prepared(self):
+        statement = "Select name, balance From customer Where id = ?"
+        self.assertEqual(self.db.first_prepared(statement, [3]), ["customer3", 150.25])
+        self.assertIsNone(self.db.first_prepared(statement, [99]))
+
+    def test_iterate_prepared(self):
+        rows = list(self.db.iterate_prepared("Select order_id From orders Where customer_id = ?", (4,), batch_size=1))
+        self.assertEqual(rows, [[400], [401]])
+
+    def test_commands_are_reused(self):
+        first = self.db.prepare("Select * From customer Where id = ?")
+        self.assertIs(self.db.prepare("Select * From customer Where id = ?"), first)
+        self.db.prepare("Select * From orders Where order_id = ?")
+        self.db.prepare("Select * From customer Where id = ?")
+        self.db.prepare("Select * From orders Where customer_id = ?")
+        self.assertEqual(list(self.db.prepared_commands), [
+            "Select * From customer Where id = ?", "Select * From orders Where customer_id = ?"])
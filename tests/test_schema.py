@@ -0,0 +1,66 @@
+from unittest import TestCase
+import os
+import tempfile
+import msaccess
+from msaccess.schema import SchemaCatalog
+from tests.sample_database import create_sample_database
+
+
+class CountingConnection:
+    """OpenSchema の呼び出し回数を数える"""
+    def __init__(self, con):
+        self.con = con
+        self.calls = []
+
+    def __getattr__(self, name):
+        return getattr(self.con, name)
+
+    def OpenSchema(self, schema, *args):
+        self.calls.append(schema)
+        return self.con.OpenSchema(schema, *args)
+
+
+class TestSchemaCatalog(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.mdb = create_sample_database(os.path.join(self.directory.name, "sample.db"))
+        self.cache = os.path.join(self.directory.name, "cache")
+        self.db = msaccess.MsAccessDb(self.mdb, backend="sqlite", schema_cache=self.cache)
+
+    def tearDown(self):
+        self.db.close()
+        self.directory.cleanup()
+
+    def test_load(self):
+        con = CountingConnection(self.db.con)
+        catalog = SchemaCatalog.load(con)
+        self.assertEqual(sorted(con.calls), [4, 20, 28])
+        self.assertEqual(catalog.table_names(), ["customer", "orders"])
+        self.assertEqual(catalog.field_names("orders"), ["order_id", "customer_id", "amount", "note"])
+        self.assertEqual(catalog.primary_key("customer"), ["id"])
+
+    def test_schema_is_loaded_once(self):
+        self.db.con = CountingConnection(self.db.con)
+        self.db.get_table_names()
+        self.db.get_field_names("customer")
+        self.db.GetEasySchema("orders")
+        self.assertEqual(len(self.db.con.calls), 3)
+
+    def test_field_attributes_are_copies(self):
+        self.db.get_field_attributes("customer")[0]["COLUMN_NAME"] = "changed"
+        self.assertEqual(self.db.get_field_names("customer")[0], "id")
+
+    def test_disk_cache(self):
+        self.db.get_table_names()
+        self.assertTrue(os.listdir(self.cache))
+
+        db = msaccess.MsAccessDb(self.mdb, backend="sqlite", schema_cache=self.cache)
+        db.con = CountingConnection(db.con)
+        self.assertEqual(db.get_table_names(), ["customer", "orders"])
+        self.assertEqual(db.con.calls, [])
+
+        db.execute_query("Create Table added (id Integer)")
+        os.utime(self.mdb, (0, 0))
+        db.invalidate_schema()
+        self.assertIn("added", db.get_table_names())
+        db.close()